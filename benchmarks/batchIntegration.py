@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+'''
+    batchIntegration.py :
+        an ensemble of K wave packets (different initial phases)
+        advanced through the same potential, by looping
+        integrate(phi) over the members or with a single
+        integrateBatch(phis), for several twoD integrators.
+
+        Run from the repository root as
+            python -m benchmarks.batchIntegration
+'''
+
+import numpy as np
+
+from twoD.dynamics import (
+    VariablePotSparseRK4Integrator,
+    RK4StepByStepIntegrator,
+    CrankNicolsonIntegrator,
+    ChebyshevIntegrator,
+    SplitOperatorIntegrator,
+)
+from twoD.wfunctions import (
+    wavePacket,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+nSide=65
+ensembleSizes=[4,16,64]
+integratorClasses=[
+    ('rk4-varpot',VariablePotSparseRK4Integrator),
+    ('rk4-stepwise',RK4StepByStepIntegrator),
+    ('crank-nicolson',CrankNicolsonIntegrator),
+    ('chebyshev',ChebyshevIntegrator),
+    ('split-operator',SplitOperatorIntegrator),
+]
+framesToTime=10
+nIntegrationSteps=5
+deltaTau=0.000003
+Mu=0.25
+
+def initialPhis(nMembers):
+    return np.array([
+        wavePacket(nSide,nSide,c=(0.5,0.5),ph0=(0,20*member/nMembers),
+            sigma2=(0.006,0.006),waveNumber0=(2*np.pi,2*np.pi),
+            deltaLambdaX=1.0/nSide,deltaLambdaY=1.0/nSide)
+        for member in range(nMembers)
+    ]).transpose().copy()
+
+def makeIntegrator(integratorClass):
+    pot=np.fromfunction(
+        lambda x,y: 8000*(((x/nSide-0.5)**2+(y/nSide-0.5)**2)>0.2),
+        (nSide,nSide),
+    ).reshape((nSide*nSide))
+    return integratorClass(
+        wfSizeX=nSide,
+        wfSizeY=nSide,
+        deltaTau=deltaTau,
+        deltaLambdaX=1.0/nSide,
+        deltaLambdaY=1.0/nSide,
+        nIntegrationSteps=nIntegrationSteps,
+        vPotential=pot,
+        periodicBCX=False,
+        periodicBCY=False,
+        mu=Mu,
+    )
+
+def loopFrames(integrator,phis):
+    for _ in range(framesToTime):
+        phis=np.array([
+            integrator.integrate(phis[:,member])[0]
+            for member in range(phis.shape[1])
+        ]).transpose()
+    return phis
+
+def batchFrames(integrator,phis):
+    for _ in range(framesToTime):
+        phis=integrator.integrateBatch(phis)[0]
+    return phis
+
+if __name__=='__main__':
+    print('%14s %8s | %12s %12s %8s' % ('integrator','members','loop','batch','speedup'))
+    for integratorName,integratorClass in integratorClasses:
+        integrator=makeIntegrator(integratorClass)
+        for nMembers in ensembleSizes:
+            phis=initialPhis(nMembers)
+            _,loopTime=timeCall(loopFrames,integrator,phis)
+            _,batchTime=timeCall(batchFrames,integrator,phis)
+            print('%14s %8i | %12s %12s %8.2f' % (
+                integratorName,
+                nMembers,
+                formatSeconds(loopTime/framesToTime),
+                formatSeconds(batchTime/framesToTime),
+                loopTime/batchTime,
+            ))
@@ -0,0 +1,40 @@
+'''
+    benchTools.py : small helpers shared by the benchmark scripts
+'''
+
+import time
+import tracemalloc
+
+def timeCall(func,*pargs,**kwargs):
+    '''
+        runs func once, returning (result, elapsed seconds)
+    '''
+    iniTime=time.time()
+    result=func(*pargs,**kwargs)
+    return result,time.time()-iniTime
+
+def peakMemoryOfCall(func,*pargs,**kwargs):
+    '''
+        runs func once under tracemalloc (which also
+        sees the numpy/scipy array buffers), returning
+        (result, peak traced bytes during the call)
+    '''
+    tracemalloc.start()
+    result=func(*pargs,**kwargs)
+    _,peakMemory=tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result,peakMemory
+
+def formatBytes(nBytes):
+    if nBytes is None:
+        return 'n/a'
+    for unit in ['B','KB','MB','GB']:
+        if abs(nBytes)<1024.0:
+            return '%.1f %s' % (nBytes,unit)
+        nBytes/=1024.0
+    return '%.1f TB' % nBytes
+
+def formatSeconds(secs):
+    if secs is None:
+        return 'n/a'
+    return '%.4f s' % secs
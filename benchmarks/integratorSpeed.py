@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+'''
+    integratorSpeed.py :
+        cost of one frame (nIntegrationSteps steps) of the
+        finite-difference twoD integrators on several grids:
+            - the naive forward-Euler integrator,
+            - the step-by-step (matrix-free) RK4,
+            - the sparse RK4 on the variable potential,
+            - the sparse RK4 with the precomputed frame matrix.
+        The setup time (operator assembly) is reported apart.
+        Then the deviation of a naive frame from the original
+        per-row implementation (its order of operations, and the
+        norm summed sequentially), for all BC combinations: the
+        two agree to rounding, not bitwise.
+
+        Run from the repository root as
+            python -m benchmarks.integratorSpeed
+'''
+
+import numpy as np
+
+from twoD.dynamics import (
+    NaiveFiniteDifferenceIntegrator,
+    RK4StepByStepIntegrator,
+    VariablePotSparseRK4Integrator,
+    SparseMatrixRK4Integrator,
+)
+from twoD.wfunctions import (
+    wavePacket,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[32,65,128,256]
+# (name, class, largest grid side to try, None for all)
+integratorClasses=[
+    ('naive',NaiveFiniteDifferenceIntegrator,None),
+    ('rk4-stepwise',RK4StepByStepIntegrator,None),
+    ('rk4-varpot',VariablePotSparseRK4Integrator,None),
+    ('rk4-matrix',SparseMatrixRK4Integrator,None),
+]
+framesToTime=20
+nIntegrationSteps=5
+deltaTau=0.000003
+Mu=0.25
+
+def initialPhi(nSide):
+    phi=wavePacket(nSide,nSide,c=(0.5,0.5),ph0=(0,20),sigma2=(0.006,0.006),
+        waveNumber0=(2*np.pi,2*np.pi),deltaLambdaX=1.0/nSide,
+        deltaLambdaY=1.0/nSide)
+    return phi/(np.vdot(phi,phi).real/(nSide*nSide))**0.5
+
+def makeIntegrator(integratorClass,nSide):
+    pot=np.fromfunction(
+        lambda x,y: 8000*(((x/nSide-0.5)**2+(y/nSide-0.5)**2)>0.2),
+        (nSide,nSide),
+    ).reshape((nSide*nSide))
+    return integratorClass(
+        wfSizeX=nSide,
+        wfSizeY=nSide,
+        deltaTau=deltaTau,
+        deltaLambdaX=1.0/nSide,
+        deltaLambdaY=1.0/nSide,
+        nIntegrationSteps=nIntegrationSteps,
+        vPotential=pot,
+        periodicBCX=False,
+        periodicBCY=False,
+        mu=Mu,
+    )
+
+# (wfSizeX,wfSizeY) grids for the check against the per-row naive frame
+checkGrids=[(12,12),(12,10)]
+
+def secondDifferences(Phi,periodicBC):
+    '''
+        2*Phi[i]-Phi[i-1]-Phi[i+1] along the first axis (none on
+        the first and last lines with fixed BC), as originally written
+    '''
+    if periodicBC:
+        largePhi=np.vstack([Phi[-1:],Phi,Phi[:1]])
+        return 2*Phi-largePhi[:-2]-largePhi[2:]
+    else:
+        zeroLine=np.zeros((1,Phi.shape[1]),dtype=complex)
+        return np.vstack([zeroLine,2*Phi[1:-1]-Phi[:-2]-Phi[2:],zeroLine])
+
+def perRowNaiveFrame(phi,pot,wfSizeX,wfSizeY,periodicBCX,periodicBCY):
+    '''
+        a normalised frame of the naive integrator
+        with the operations of its original, per-row, version
+    '''
+    deltaLambdaX,deltaLambdaY=1.0/wfSizeX,1.0/wfSizeY
+    kineticFactor=-1.0/(2.0*Mu)
+    pot2D=pot.reshape((wfSizeX,wfSizeY))
+    for _ in range(nIntegrationSteps):
+        Phi=phi.reshape((wfSizeX,wfSizeY))
+        der2X=secondDifferences(Phi,periodicBCX)/(deltaLambdaX**2)
+        der2Y=secondDifferences(Phi.transpose(),periodicBCY).transpose()/(deltaLambdaY**2)
+        F=complex(0,-1)*(kineticFactor*(der2X+der2Y)+pot2D*Phi)
+        phi=np.array([
+            p+deltaTau*dp
+            for p,dp in zip(Phi,F)
+        ]).reshape((wfSizeX*wfSizeY))
+    return phi/(sum(np.abs(phi)**2)*deltaLambdaX*deltaLambdaY)**0.5
+
+def naiveDeviations():
+    '''
+        (grid, BCs, max |difference|) of a naive frame
+        against perRowNaiveFrame
+    '''
+    rng=np.random.default_rng(1)
+    deviations=[]
+    for wfSizeX,wfSizeY in checkGrids:
+        for periodicBCX in (False,True):
+            for periodicBCY in (False,True):
+                phi=rng.random(wfSizeX*wfSizeY)+complex(0,1)*rng.random(wfSizeX*wfSizeY)
+                pot=100*rng.random(wfSizeX*wfSizeY)
+                integrator=NaiveFiniteDifferenceIntegrator(
+                    wfSizeX=wfSizeX,
+                    wfSizeY=wfSizeY,
+                    deltaTau=deltaTau,
+                    deltaLambdaX=1.0/wfSizeX,
+                    deltaLambdaY=1.0/wfSizeY,
+                    nIntegrationSteps=nIntegrationSteps,
+                    vPotential=pot,
+                    periodicBCX=periodicBCX,
+                    periodicBCY=periodicBCY,
+                    mu=Mu,
+                )
+                deviations.append((
+                    '%ix%i' % (wfSizeX,wfSizeY),
+                    '%s/%s' % tuple('periodic' if bc else 'fixed' for bc in (periodicBCX,periodicBCY)),
+                    np.abs(
+                        integrator.integrate(phi)[0]
+                        -perRowNaiveFrame(phi,pot,wfSizeX,wfSizeY,periodicBCX,periodicBCY)
+                    ).max(),
+                ))
+    return deviations
+
+def runFrames(integrator,phi):
+    for _ in range(framesToTime):
+        phi=integrator.integrate(phi)[0]
+    return phi
+
+if __name__=='__main__':
+    print('%10s | %14s | %12s %12s' % ('grid','integrator','setup','per frame'))
+    for nSide in gridSizes:
+        phi=initialPhi(nSide)
+        for integratorName,integratorClass,maxSide in integratorClasses:
+            if maxSide is not None and nSide>maxSide:
+                print('%10s | %14s | %12s %12s' % (
+                    '%ix%i' % (nSide,nSide),
+                    integratorName,
+                    'skipped',
+                    'skipped',
+                ))
+                continue
+            integrator,setupTime=timeCall(makeIntegrator,integratorClass,nSide)
+            _,framesTime=timeCall(runFrames,integrator,phi)
+            print('%10s | %14s | %12s %12s' % (
+                '%ix%i' % (nSide,nSide),
+                integratorName,
+                formatSeconds(setupTime),
+                formatSeconds(framesTime/framesToTime),
+            ))
+    print('\n%10s | %18s | %12s' % ('grid','BC (x/y)','naive dev.'))
+    for gridName,bcName,deviation in naiveDeviations():
+        print('%10s | %18s | %12.2E' % (gridName,bcName,deviation))
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+'''
+    momentum.py :
+        cost of the per-frame momentum-space diagnostics of phi
+        (the |phi(k)|^2 distribution, centred, and the fraction of
+        the norm at grid-scale wavenumbers) on several grids:
+            - recomputing the wavenumber grids, masks and fftshift
+              at each frame,
+            - the cached utils.momentum.MomentumTransform.
+
+        Run from the repository root as
+            python -m benchmarks.momentum
+'''
+
+import numpy as np
+
+from utils.momentum import MomentumTransform
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[65,128,256,512]
+nFrames=50
+highKCutoff=0.8
+
+def uncachedDiagnostics(phi,nSide):
+    mod2K=np.abs(np.fft.fft2(phi.reshape((nSide,nSide))))**2
+    qX=2*np.abs(np.fft.fftfreq(nSide))[:,np.newaxis]
+    qY=2*np.abs(np.fft.fftfreq(nSide))[np.newaxis,:]
+    highK=(qX>highKCutoff)|(qY>highKCutoff)
+    return np.fft.fftshift(mod2K)/mod2K.sum(),mod2K[highK].sum()/mod2K.sum()
+
+def cachedDiagnostics(momentumTransform,phi):
+    momentumTransform.update(phi)
+    return momentumTransform.distribution(),momentumTransform.lastHighKFraction
+
+def repeat(func,*pargs):
+    for _ in range(nFrames):
+        func(*pargs)
+
+if __name__=='__main__':
+    print('%10s | %12s %12s' % ('grid','uncached','cached'))
+    for nSide in gridSizes:
+        phi=np.random.rand(nSide*nSide)+complex(0,1)*np.random.rand(nSide*nSide)
+        momentumTransform=MomentumTransform(
+            (nSide,nSide),
+            (1.0/nSide,1.0/nSide),
+            highKCutoff=highKCutoff,
+        )
+        _,uncachedTime=timeCall(repeat,uncachedDiagnostics,phi,nSide)
+        _,cachedTime=timeCall(repeat,cachedDiagnostics,momentumTransform,phi)
+        print('%10s | %12s %12s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(uncachedTime/nFrames),
+            formatSeconds(cachedTime/nFrames),
+        ))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+'''
+    observables.py :
+        cost of the per-frame observables of twoD.schroedinger
+        (positions, momenta, spreads, energy breakdown, two
+        currents) on several grids:
+            - one numpy reduction per observable, with the
+              differences recomputed for each of them,
+            - the fused GridObservables.evaluate.
+        Then the check of the observables kept by integrators whose
+        potential changes between frames (refilled in place by some):
+        the deviation of their potential energy from a fresh
+        evaluation with the new potential.
+
+        Run from the repository root as
+            python -m benchmarks.observables
+'''
+
+import numpy as np
+
+from twoD.observables import GridObservables
+from twoD.dynamics import (
+    createKineticMatricesXY,
+    VariablePotSparseRK4Integrator,
+    SparseMatrixRK4Integrator,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[65,128,256,512]
+nEvaluations=50
+Mu=0.25
+
+def separateObservables(phi,nSide,pot,kinPartX,kinPartY):
+    '''
+        each observable with its own pass over phi
+    '''
+    deltaLambda=1.0/nSide
+    dA=deltaLambda**2
+    kineticFactor=-1.0/(2.0*Mu)
+    grid=phi.reshape((nSide,nSide))
+    xs=np.arange(nSide)[:,None]*deltaLambda
+    ys=np.arange(nSide)[None,:]*deltaLambda
+    norm2=np.sum(np.abs(grid)**2)*dA
+    values={
+        'x': np.sum(xs*np.abs(grid)**2)*dA/norm2,
+        'y': np.sum(ys*np.abs(grid)**2)*dA/norm2,
+        'x2': np.sum(xs**2*np.abs(grid)**2)*dA/norm2,
+        'y2': np.sum(ys**2*np.abs(grid)**2)*dA/norm2,
+        'px': np.sum(np.imag(grid[:-1].conjugate()*np.diff(grid,axis=0)))/deltaLambda*dA/norm2,
+        'py': np.sum(np.imag(grid[:,:-1].conjugate()*np.diff(grid,axis=1)))/deltaLambda*dA/norm2,
+        'px2': np.vdot(phi,kinPartX.dot(phi)).real/deltaLambda**2*dA/norm2,
+        'py2': np.vdot(phi,kinPartY.dot(phi)).real/deltaLambda**2*dA/norm2,
+        'potentialEnergy': np.sum(pot*np.abs(phi)**2)*dA/norm2,
+        'centreX': 2*kineticFactor*np.sum(np.imag(
+            grid[nSide//2].conjugate()*(grid[nSide//2+1]-grid[nSide//2])
+        ))/norm2,
+        'centreY': 2*kineticFactor*np.sum(np.imag(
+            grid[:,nSide//2].conjugate()*(grid[:,nSide//2+1]-grid[:,nSide//2])
+        ))/norm2,
+    }
+    values['kineticEnergy']=kineticFactor*(values['px2']+values['py2'])
+    return values
+
+# (wfSizeX,wfSizeY) grid and the potentials of the successive frames
+# for the check of the potential energy of the integrators' observables
+checkGrid=(12,10)
+checkPotentials=[0.0,100.0,100.0,-30.0]
+
+def potentialChangeDeviations():
+    '''
+        (integrator, frame, potential energy, max |difference|) of the
+        observables of an integrator (periodic BCs) whose potential is
+        changed with setPotential between frames, against a
+        GridObservables built anew for each frame
+    '''
+    wfSizeX,wfSizeY=checkGrid
+    rng=np.random.default_rng(1)
+    deviations=[]
+    for integratorClass in (VariablePotSparseRK4Integrator,SparseMatrixRK4Integrator):
+        phi=rng.random(wfSizeX*wfSizeY)+complex(0,1)*rng.random(wfSizeX*wfSizeY)
+        observables=GridObservables(wfSizeX,wfSizeY,1.0/wfSizeX,1.0/wfSizeY,True,True,Mu)
+        observables.addEnergy(np.full(wfSizeX*wfSizeY,checkPotentials[0]))
+        integrator=integratorClass(
+            wfSizeX=wfSizeX,
+            wfSizeY=wfSizeY,
+            deltaTau=0.000001,
+            deltaLambdaX=1.0/wfSizeX,
+            deltaLambdaY=1.0/wfSizeY,
+            nIntegrationSteps=2,
+            vPotential=np.full(wfSizeX*wfSizeY,checkPotentials[0]),
+            periodicBCX=True,
+            periodicBCY=True,
+            mu=Mu,
+            observables=observables,
+        )
+        for frame,potentialValue in enumerate(checkPotentials):
+            pot=np.full(wfSizeX*wfSizeY,potentialValue)
+            integrator.setPotential(pot)
+            phi=integrator.integrate(phi)[0]
+            freshObservables=GridObservables(wfSizeX,wfSizeY,1.0/wfSizeX,1.0/wfSizeY,True,True,Mu)
+            freshObservables.addEnergy(pot)
+            expected=freshObservables.evaluate(phi)
+            deviations.append((
+                integratorClass.__name__,
+                frame,
+                integrator.lastObservables['potentialEnergy'],
+                max(
+                    abs(integrator.lastObservables[name]-expected[name])
+                    for name in ('potentialEnergy','kineticEnergy')
+                ),
+            ))
+    return deviations
+
+def repeat(func,*pargs):
+    for _ in range(nEvaluations):
+        func(*pargs)
+
+if __name__=='__main__':
+    print('%10s | %12s %12s' % ('grid','separate','fused'))
+    for nSide in gridSizes:
+        phi=np.random.rand(nSide*nSide)+complex(0,1)*np.random.rand(nSide*nSide)
+        pot=np.random.rand(nSide*nSide)
+        kinPartX,kinPartY=createKineticMatricesXY(nSide,nSide,False,False)
+        observables=GridObservables(nSide,nSide,1.0/nSide,1.0/nSide,False,False,Mu)
+        observables.addPosition()
+        observables.addMomentum()
+        observables.addEnergy(pot)
+        observables.addCurrent('centreX','x',0.5)
+        observables.addCurrent('centreY','y',0.5)
+        _,separateTime=timeCall(repeat,separateObservables,phi,nSide,pot,kinPartX,kinPartY)
+        _,fusedTime=timeCall(repeat,observables.evaluate,phi)
+        print('%10s | %12s %12s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(separateTime/nEvaluations),
+            formatSeconds(fusedTime/nEvaluations),
+        ))
+    print('\n%32s | %5s | %12s %12s' % ('integrator','frame','potential','deviation'))
+    for integratorName,frame,potentialEnergy,deviation in potentialChangeDeviations():
+        print('%32s | %5i | %12.4f %12.2E' % (integratorName,frame,potentialEnergy,deviation))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+'''
+    operatorAssembly.py :
+        assembly time and peak memory of the twoD evolution
+        matrix F, sparse-native construction vs. the former
+        dense-then-sparsify construction (kept here as reference).
+
+        Run from the repository root as
+            python -m benchmarks.operatorAssembly
+'''
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from twoD.dynamics import (
+    createEvolutionMatrixF,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    peakMemoryOfCall,
+    formatBytes,
+    formatSeconds,
+)
+
+# grid sizes (Nx=Ny) to benchmark
+gridSizes=[16,32,64,128,256,512]
+# the dense reference is skipped when its estimated footprint exceeds this
+denseMemoryBudget=2*1024**3
+# boundary conditions
+periodicBCX=False
+periodicBCY=False
+Mu=0.25
+
+def legacyCreateEvolutionMatrixF(
+    vPotential,
+    wfSizeX,
+    wfSizeY,
+    deltaLambdaX,
+    deltaLambdaY,
+    periodicBCX,
+    periodicBCY,
+    mu
+):
+    '''
+        the original dense-intermediate construction,
+        verbatim, as a reference for timing and correctness
+    '''
+    fullSize=wfSizeX*wfSizeY
+    indexer=lambda x,y,_Ny=wfSizeY: x*_Ny+y
+    kinPartX=np.diag(2*np.ones(fullSize))
+    for x in range(wfSizeX):
+        for y in range(wfSizeY):
+            tIdx=indexer(x,y)
+            kinPartX[tIdx,indexer((x+1)%wfSizeX,y)]=-1
+            kinPartX[indexer((x+1)%wfSizeX,y),tIdx]=-1
+        if not periodicBCX:
+            for y in [0,wfSizeY-1]:
+                tIdx=indexer(x,y)
+                kinPartX[tIdx,indexer((x+1)%wfSizeX,y)]=0
+                kinPartX[indexer((x+1)%wfSizeX,y),tIdx]=0
+    kinPartY=np.diag(2*np.ones(fullSize))
+    for y in range(wfSizeY):
+        for x in range(wfSizeX):
+            tIdx=indexer(x,y)
+            kinPartY[tIdx,indexer(x,(y+1)%wfSizeY)]=-1
+            kinPartY[indexer(x,(y+1)%wfSizeY),tIdx]=-1
+        if not periodicBCY:
+            for x in [0,wfSizeX-1]:
+                tIdx=indexer(x,y)
+                kinPartY[tIdx,indexer(x,(y+1)%wfSizeY)]=0
+                kinPartY[indexer(x,(y+1)%wfSizeY),tIdx]=0
+    mKinFactorX=complex(0,1.0/(2.0*float(mu)*(deltaLambdaX**2)))
+    mKinFactorY=complex(0,1.0/(2.0*float(mu)*(deltaLambdaY**2)))
+    if vPotential is not None:
+        return csr_matrix(
+            mKinFactorX*kinPartX+mKinFactorY*kinPartY+complex(0,-1)*np.diag(vPotential)
+        )
+    else:
+        return csr_matrix(
+            mKinFactorX*kinPartX+mKinFactorY*kinPartY
+        )
+
+def estimateDenseFootprint(nSide):
+    '''
+        two float and three complex (N^2 x N^2) arrays
+        are alive at the peak of the dense construction
+    '''
+    return (2*8+3*16)*(nSide*nSide)**2
+
+def assemblyArguments(nSide):
+    return (
+        np.linspace(0,1000,nSide*nSide),
+        nSide,
+        nSide,
+        1.0/nSide,
+        1.0/nSide,
+        periodicBCX,
+        periodicBCY,
+        Mu,
+    )
+
+if __name__=='__main__':
+    print('%6s | %12s %12s | %12s %12s | %s' % (
+        'grid',
+        'sparse t',
+        'sparse mem',
+        'dense t',
+        'dense mem',
+        'max |diff|',
+    ))
+    for nSide in gridSizes:
+        args=assemblyArguments(nSide)
+        sparseF,sparseTime=timeCall(createEvolutionMatrixF,*args)
+        _,sparseMem=peakMemoryOfCall(createEvolutionMatrixF,*args)
+        if estimateDenseFootprint(nSide)<=denseMemoryBudget:
+            denseF,denseTime=timeCall(legacyCreateEvolutionMatrixF,*args)
+            _,denseMem=peakMemoryOfCall(legacyCreateEvolutionMatrixF,*args)
+            maxDiff=abs(sparseF-denseF).max()
+            diffString='%.2E' % maxDiff
+        else:
+            denseTime,denseMem,diffString=None,None,'(dense skipped, ~%s)' % (
+                formatBytes(estimateDenseFootprint(nSide))
+            )
+        print('%6s | %12s %12s | %12s %12s | %s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(sparseTime),
+            formatBytes(sparseMem),
+            formatSeconds(denseTime),
+            formatBytes(denseMem),
+            diffString,
+        ))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+'''
+    regionNorms.py :
+        cost of the norm of psi together with the probabilities
+        of the qpong slices (four vertical quarters):
+            - the former builtin-sum implementation,
+            - twoD.tools.norm (np.add.reduceat),
+            - a RegionReducer with the same four slices,
+            - a RegionReducer with the slices plus two rectangles
+              and a Gaussian window.
+
+        Run from the repository root as
+            python -m benchmarks.regionNorms
+'''
+
+import numpy as np
+
+from twoD.tools import (
+    mod2,
+    norm,
+    RegionReducer,
+    sliceRegions,
+    rectangleRegion,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[65,128,256,512]
+nReductions=100
+slicesSet=[0.0,0.25,0.5,0.75]
+
+def legacyNorm(psi,deltaLambdaXY,slices):
+    '''
+        the former implementation (builtin sum over the arrays)
+    '''
+    _mod2=mod2(psi)
+    normMap={
+        slIndex: sum(_mod2[slStart:slEnd])
+        for slIndex,(slStart,slEnd) in enumerate(zip(slices,slices[1:]+[None]))
+    }
+    fullNorm=sum(normMap.values())
+    return (fullNorm*deltaLambdaXY)**0.5,{k: v/fullNorm for k,v in normMap.items()}
+
+def repeat(func,*pargs):
+    for _ in range(nReductions):
+        func(*pargs)
+
+if __name__=='__main__':
+    print('%10s | %12s %12s %12s %12s' % ('grid','legacy','reduceat','regions','7 regions'))
+    for nSide in gridSizes:
+        psi=np.random.rand(nSide*nSide)+complex(0,1)*np.random.rand(nSide*nSide)
+        deltaLambdaXY=1.0/(nSide*nSide)
+        slices=[int(0.5+slFraction*nSide*nSide) for slFraction in slicesSet]
+        xs,ys=np.meshgrid(np.linspace(0,1,nSide),np.linspace(0,1,nSide),indexing='ij')
+        sliceReducer=RegionReducer(nSide,nSide,sliceRegions(slices,nSide,nSide))
+        regions=sliceRegions(slices,nSide,nSide)
+        regions['leftGoal']=rectangleRegion(nSide,nSide,(0.0,0.1),(0.3,0.7))
+        regions['rightGoal']=rectangleRegion(nSide,nSide,(0.9,1.0),(0.3,0.7))
+        regions['centre']=np.exp(-((xs-0.5)**2+(ys-0.5)**2)/0.02)
+        regionReducer=RegionReducer(nSide,nSide,regions)
+        #
+        _,legacyTime=timeCall(repeat,legacyNorm,psi,deltaLambdaXY,slices)
+        _,reduceatTime=timeCall(repeat,norm,psi,deltaLambdaXY,slices)
+        _,slicesTime=timeCall(repeat,sliceReducer.reduce,psi,deltaLambdaXY)
+        _,regionsTime=timeCall(repeat,regionReducer.reduce,psi,deltaLambdaXY)
+        print('%10s | %12s %12s %12s %12s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(legacyTime/nReductions),
+            formatSeconds(reduceatTime/nReductions),
+            formatSeconds(slicesTime/nReductions),
+            formatSeconds(regionsTime/nReductions),
+        ))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+'''
+    rk4Workspace.py :
+        VariablePotSparseRK4Integrator with and without the
+        preallocated workspace: frames/s and memory allocated
+        within a frame (tracemalloc), with the qpong parameters
+        and on larger grids.
+
+        Run from the repository root as
+            python -m benchmarks.rk4Workspace
+'''
+
+import time
+import tracemalloc
+import numpy as np
+
+from twoD.dynamics import (
+    VariablePotSparseRK4Integrator,
+)
+from twoD.wfunctions import (
+    wavePacket,
+)
+
+from benchmarks.benchTools import (
+    formatBytes,
+)
+
+# (grid side, drawFreq) pairs; the first mimics qpong
+configurations=[(65,5),(128,5),(256,5)]
+framesToTime=40
+framesToTrace=5
+deltaTau=0.000003
+Mu=0.25
+
+def makeIntegrator(nSide,drawFreq,preallocate):
+    pot=np.fromfunction(
+        lambda x,y: 8000*(((x/nSide-0.5)**2+(y/nSide-0.5)**2)>0.2),
+        (nSide,nSide),
+    ).reshape((nSide*nSide))
+    return VariablePotSparseRK4Integrator(
+        wfSizeX=nSide,
+        wfSizeY=nSide,
+        deltaTau=deltaTau,
+        deltaLambdaX=1.0/nSide,
+        deltaLambdaY=1.0/nSide,
+        nIntegrationSteps=drawFreq,
+        vPotential=pot,
+        periodicBCX=False,
+        periodicBCY=False,
+        mu=Mu,
+        exactEnergy=True,
+        preallocate=preallocate,
+    ),pot
+
+def initialPhi(nSide):
+    phi=wavePacket(nSide,nSide,c=(0.5,0.5),ph0=(0,20),sigma2=(0.006,0.006),
+        waveNumber0=(2*np.pi,2*np.pi),deltaLambdaX=1.0/nSide,
+        deltaLambdaY=1.0/nSide)
+    return phi/(np.vdot(phi,phi).real/(nSide*nSide))**0.5
+
+def runFrame(integrator,pot,phi):
+    '''
+        one qpong-like frame: integrate then set the potential
+    '''
+    newPhi=integrator.integrate(phi)[0]
+    integrator.setPotential(pot)
+    return newPhi
+
+def transientBytesPerFrame(integrator,pot,phi):
+    '''
+        peak of the memory traced during a frame,
+        above what was in use when the frame started
+    '''
+    peaks=[]
+    tracemalloc.start()
+    for _ in range(framesToTrace):
+        startMemory,_=tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc,'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # older Pythons: restart the tracing to reset the peak
+            tracemalloc.stop()
+            tracemalloc.start()
+            startMemory=0
+        phi=runFrame(integrator,pot,phi)
+        _,peakMemory=tracemalloc.get_traced_memory()
+        peaks.append(peakMemory-startMemory)
+    tracemalloc.stop()
+    return max(peaks)
+
+def framesPerSecond(integrator,pot,phi):
+    iniTime=time.time()
+    for _ in range(framesToTime):
+        phi=runFrame(integrator,pot,phi)
+    return framesToTime/(time.time()-iniTime)
+
+if __name__=='__main__':
+    print('%9s %9s | %14s %10s' % ('grid','workspace','alloc/frame','frames/s'))
+    for nSide,drawFreq in configurations:
+        phi=initialPhi(nSide)
+        for preallocate in [False,True]:
+            integrator,pot=makeIntegrator(nSide,drawFreq,preallocate)
+            print('%9s %9s | %14s %10.1f' % (
+                '%ix%i' % (nSide,nSide),
+                'yes' if preallocate else 'no',
+                formatBytes(transientBytesPerFrame(integrator,pot,phi)),
+                framesPerSecond(integrator,pot,phi),
+            ))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+'''
+    smoothing.py :
+        the qpong smoothing of phi on several grids:
+            - assembly of the (sparse) smoothing matrix,
+            - one application as a sparse product (new array),
+            - one application of the in-place StencilSmoother,
+            - one application of the SpectralFilter (fixed BCs).
+
+        Run from the repository root as
+            python -m benchmarks.smoothing
+'''
+
+import numpy as np
+
+from twoD.dynamics import (
+    makeSmoothingMatrix,
+    StencilSmoother,
+    SpectralFilter,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[65,128,256,512]
+nApplications=50
+smoothingMap=[
+    (( 0, 0),1.0),
+    (( 0,+1),0.1),
+    (( 0,-1),0.1),
+    ((+1, 0),0.1),
+    ((-1, 0),0.1),
+]
+
+def repeatProduct(matrix,phi):
+    for _ in range(nApplications):
+        phi=matrix.dot(phi)
+    return phi
+
+def repeatSmoother(smoother,phi):
+    for _ in range(nApplications):
+        smoother.smoothInPlace(phi)
+    return phi
+
+if __name__=='__main__':
+    print('%10s | %12s | %12s %12s %12s' % ('grid','assembly','product','stencil','spectral'))
+    for nSide in gridSizes:
+        phi=np.random.rand(nSide*nSide)+complex(0,1)*np.random.rand(nSide*nSide)
+        matrix,assemblyTime=timeCall(makeSmoothingMatrix,
+            nSide,nSide,False,False,smoothingMap)
+        _,productTime=timeCall(repeatProduct,matrix,phi.copy())
+        _,stencilTime=timeCall(repeatSmoother,
+            StencilSmoother(nSide,nSide,smoothingMap),phi.copy())
+        _,spectralTime=timeCall(repeatSmoother,
+            SpectralFilter(nSide,nSide,False,False,1.0/nSide,1.0/nSide,0.25),
+            phi.copy())
+        print('%10s | %12s | %12s %12s %12s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(assemblyTime),
+            formatSeconds(productTime/nApplications),
+            formatSeconds(stencilTime/nApplications),
+            formatSeconds(spectralTime/nApplications),
+        ))
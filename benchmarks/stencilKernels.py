@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+'''
+    stencilKernels.py :
+        cost of one application of the twoD evolution operator F[phi]:
+            - the former matrix-free evolutionOperator (padded copies),
+            - the in-place stencil evolutionOperatorInto,
+            - the in-place sparse matvec (plus the matrix assembly).
+
+        Run from the repository root as
+            python -m benchmarks.stencilKernels
+'''
+
+import numpy as np
+
+from twoD.dynamics import (
+    evolutionOperatorInto,
+    createEvolutionMatrixF,
+)
+from utils.kernels import (
+    sparseMatVecInto,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+gridSizes=[64,128,256,512,1024]
+nApplications=50
+Mu=0.25
+periodicBC=True
+
+def legacyEvolutionOperator(
+    Phi,
+    vPotential,
+    deltaLambdaX,
+    deltaLambdaY,
+    kineticFactor,
+):
+    '''
+        the former padded-copy implementation (periodic case)
+    '''
+    largePhiX=np.vstack([[Phi[:][-1]],Phi[:][:],[Phi[:][0]]])
+    der2X=(2*Phi-largePhiX[:-2]-largePhiX[2:])/(deltaLambdaX**2)
+    PhiT=Phi.transpose()
+    largePhiYT=np.vstack([[PhiT[-1][:]],PhiT[:][:],[PhiT[0][:]]])
+    der2Y=((2*PhiT-largePhiYT[:-2]-largePhiYT[2:]).transpose())/(deltaLambdaY**2)
+    secondDerivative=kineticFactor*(der2X+der2Y)
+    return complex(0,-1)*(secondDerivative+vPotential*Phi)
+
+def repeat(func,*pargs):
+    for _ in range(nApplications):
+        func(*pargs)
+
+if __name__=='__main__':
+    kineticFactor=-1.0/(2.0*Mu)
+    print('%10s | %12s %12s %12s | %12s' % (
+        'grid',
+        'legacy',
+        'stencil',
+        'sparse',
+        'assembly',
+    ))
+    for nSide in gridSizes:
+        deltaLambda=1.0/nSide
+        Phi=(np.random.rand(nSide,nSide)+complex(0,1)*np.random.rand(nSide,nSide))
+        vPot=np.random.rand(nSide,nSide)
+        out=np.zeros((nSide,nSide),dtype=complex)
+        scratch=np.zeros((nSide,nSide),dtype=complex)
+        #
+        _,legacyTime=timeCall(repeat,legacyEvolutionOperator,
+            Phi,vPot,deltaLambda,deltaLambda,kineticFactor)
+        _,stencilTime=timeCall(repeat,evolutionOperatorInto,
+            Phi,vPot,deltaLambda,deltaLambda,kineticFactor,
+            periodicBC,periodicBC,out,scratch)
+        matrixF,assemblyTime=timeCall(createEvolutionMatrixF,
+            vPot.reshape((nSide*nSide)),nSide,nSide,deltaLambda,deltaLambda,
+            periodicBC,periodicBC,Mu)
+        _,sparseTime=timeCall(repeat,sparseMatVecInto,
+            matrixF,Phi.reshape((nSide*nSide)),out.reshape((nSide*nSide)))
+        print('%10s | %12s %12s %12s | %12s' % (
+            '%ix%i' % (nSide,nSide),
+            formatSeconds(legacyTime/nApplications),
+            formatSeconds(stencilTime/nApplications),
+            formatSeconds(sparseTime/nApplications),
+            formatSeconds(assemblyTime),
+        ))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+'''
+    trajectory.py :
+        per-frame cost of a twoD.schroedinger run, on the grid
+        and with the integrator of twoD.settings:
+            - the integration alone,
+            - storing each frame with a utils.trajectory.TrajectoryWriter,
+              in each format (the headless runs),
+            - the pygame display of each frame (if pygame is
+              available; with SDL's dummy video driver).
+
+        Run from the repository root as
+            python -m benchmarks.trajectory
+'''
+
+import os
+import shutil
+import tempfile
+
+from twoD.settings import (
+    Nx,
+    Ny,
+    Mu,
+    deltaTau,
+    deltaLambdaX,
+    deltaLambdaY,
+    waveNumber0,
+    periodicBCX,
+    periodicBCY,
+    drawFreq,
+    integratorClass,
+    integratorOptions,
+)
+
+from twoD.wfunctions import (
+    wavePacket,
+)
+
+from twoD.potentials import (
+    rectangularHolePotential,
+)
+
+from utils.trajectory import (
+    TrajectoryWriter,
+    TRAJECTORY_FORMATS,
+)
+
+from benchmarks.benchTools import (
+    timeCall,
+    formatSeconds,
+)
+
+nFrames=200
+
+def runFrames(integrator,phi,frameActions):
+    for i in range(nFrames):
+        phi,*_=integrator.integrate(phi)
+        for frameAction in frameActions:
+            frameAction(phi,i)
+
+if __name__=='__main__':
+    integrator=integratorClass(
+        wfSizeX=Nx,
+        wfSizeY=Ny,
+        deltaTau=deltaTau,
+        deltaLambdaX=deltaLambdaX,
+        deltaLambdaY=deltaLambdaY,
+        nIntegrationSteps=drawFreq,
+        vPotential=rectangularHolePotential(
+            Nx,
+            Ny,
+            pPos=(0.1,0.1,0.8,0.8),
+            pThickness=(0.0004,0.0004),
+            vIn=0,
+            vOut=6000,
+        ),
+        periodicBCX=periodicBCX,
+        periodicBCY=periodicBCY,
+        mu=Mu,
+        **integratorOptions
+    )
+    phi=wavePacket(Nx,Ny,c=(0.25,0.25),ph0=(0,0),sigma2=(0.002,0.002),
+        waveNumber0=waveNumber0,deltaLambdaX=deltaLambdaX,
+        deltaLambdaY=deltaLambdaY,weight=1)
+    print('%ix%i grid, %s, %i steps per frame' % (Nx,Ny,integratorClass.__name__,drawFreq))
+    print('%24s | %12s' % ('per frame','time'))
+    _,integrationTime=timeCall(runFrames,integrator,phi,[])
+    print('%24s | %12s' % ('integration',formatSeconds(integrationTime/nFrames)))
+    for trajectoryFormat in TRAJECTORY_FORMATS:
+        trajectoryDirectory=tempfile.mkdtemp()
+        trajectoryWriter=TrajectoryWriter(
+            trajectoryDirectory,
+            (Nx,Ny),
+            trajectoryFormat=trajectoryFormat,
+            nFrames=nFrames,
+        )
+        _,storingTime=timeCall(
+            runFrames,
+            integrator,
+            phi,
+            [lambda phi,i: trajectoryWriter.push(phi,i,i)],
+        )
+        trajectoryWriter.close()
+        shutil.rmtree(trajectoryDirectory)
+        print('%24s | %12s' % (
+            '+ trajectory %s' % trajectoryFormat,
+            formatSeconds(storingTime/nFrames),
+        ))
+    try:
+        os.environ.setdefault('SDL_VIDEODRIVER','dummy')
+        from twoD.gui import doPlot
+    except ImportError:
+        doPlot=None
+    if doPlot is None:
+        print('%24s | %12s' % ('+ display',formatSeconds(None)))
+    else:
+        replotting=doPlot(phi)
+        _,displayTime=timeCall(
+            runFrames,
+            integrator,
+            phi,
+            [lambda phi,i: doPlot(phi,replotting,title='%i' % i)],
+        )
+        print('%24s | %12s' % ('+ display',formatSeconds(displayTime/nFrames)))
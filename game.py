@@ -32,6 +32,7 @@ from qpong.interactiveSettings import (
     panelHeight,
     defaultSoundActive,
     maxFrameRate,
+    highKThreshold,
 )
 
 from qpong.gui import (
@@ -119,11 +120,23 @@ if __name__=='__main__':
                     int((plInfo['patchPos'][1])*Nx),
                 )
             # smoothing step
-            if mutableGameState['physics']['energy'] < mutableGameState['physics']['initEnergyThreshold']:
-                # this does not seem to be doable in-place (why?)
-                mutableGameState['physics']['phi']=mutableGameState['phiSmoothingMatrix'].dot(
+            if mutableGameState['momentumTransform'] is not None:
+                phiNeedsSmoothing=mutableGameState['momentumTransform'].highKFraction(
                     mutableGameState['physics']['phi']
-                )
+                ) > highKThreshold
+            else:
+                phiNeedsSmoothing=mutableGameState['physics']['energy'] < mutableGameState['physics']['initEnergyThreshold']
+            if phiNeedsSmoothing:
+                if mutableGameState['phiSmoother'] is not None:
+                    # in place, on the buffers of the smoother
+                    mutableGameState['phiSmoother'].smoothInPlace(
+                        mutableGameState['physics']['phi']
+                    )
+                else:
+                    # (a sparse product cannot write into its operand)
+                    mutableGameState['physics']['phi']=mutableGameState['phiSmoothingMatrix'].dot(
+                        mutableGameState['physics']['phi']
+                    )
             # potential-induced damping step, in-place
             mutableGameState['physics']['phi']*=mutableGameState['physics']['damping']
 
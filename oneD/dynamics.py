@@ -3,7 +3,31 @@
 '''
 
 import numpy as np
-from scipy.sparse import csr_matrix
+from scipy.sparse import (
+    csr_matrix,
+    csc_matrix,
+)
+from scipy.sparse.linalg import splu
+
+from utils.propagators import (
+    gershgorinBounds,
+    chebyshevCoefficients,
+    chebyshevPropagate,
+    prunedMatrixPower,
+    prunedRowsOfPower,
+    replaceRows,
+    reachableRows,
+)
+
+from utils.kernels import (
+    makeRK4Workspace,
+    rk4StepInPlace,
+    makeDormandPrinceWorkspace,
+    dormandPrincePropagate,
+    secondDifferenceInto,
+    trackPotentialChanges,
+    expectationValue,
+)
 
 from oneD.tools import (
     mod2,
@@ -27,15 +51,59 @@ class WFIntegrator():
     def setPotential(self,pot):
         raise NotImplementedError
 
+    def _potentialChanges(self,vPotential):
+        '''
+            the indices of the sites where vPotential differs from
+            the potential of the previous call (None at the first call),
+            for the integrators (with a cachedPotential attribute)
+            able to skip or localise the update
+        '''
+        self.cachedPotential,changedSites=trackPotentialChanges(
+            self.cachedPotential,
+            vPotential,
+        )
+        return changedSites
+
     def integrate(self,phi,nSteps):
         raise NotImplementedError
 
+    def integrateBatch(self,phis,nSteps):
+        '''
+            as integrate, for an ensemble of K wavefunctions
+            sharing the potential: phis is (wfSize,K),
+            one wavefunction per column.
+            Returns (newPhis, normBiases, timeIncrement),
+            the first two column by column.
+            This fallback integrates one column at a time.
+        '''
+        newPhis=np.zeros(phis.shape,dtype=complex)
+        normBiases=np.zeros(phis.shape[1])
+        for member in range(phis.shape[1]):
+            newPhis[:,member],normBiases[member],timeIncrement=self.integrate(
+                phis[:,member],
+                nSteps,
+            )
+        return newPhis,normBiases,timeIncrement
+
+    def _normaliseBatch(self,newPhis,timeIncrement):
+        newNorms=norm(newPhis,self.deltaLambda)
+        return (
+            newPhis/newNorms,
+            newNorms-1,
+            timeIncrement,
+        )
+
 class SparseMatrixRK4Integrator(WFIntegrator):
     '''
         RK4
         uses sparse matrices
         uses U=(1+H)^n
         does n timesteps at once
+        (U by repeated squaring, pruned of the entries below
+        dropTolerance: the build stats are in evoUInfo).
+        setPotential does nothing if the potential is unchanged,
+        and after a local change recomputes only the rows of U
+        that can depend on the sites which changed
     '''
     def __init__(
         self,
@@ -46,6 +114,7 @@ class SparseMatrixRK4Integrator(WFIntegrator):
         vPotential,
         periodicBC,
         mu,
+        dropTolerance=1e-12,
     ):
         '''
             the evolution matrix U^nIntegrationSteps is prepared here
@@ -58,8 +127,22 @@ class SparseMatrixRK4Integrator(WFIntegrator):
         self.deltaLambda=deltaLambda
         self.vPotential=vPotential
         self.mu=mu
+        self.dropTolerance=dropTolerance
         self.totalDeltaTau=self.nIntegrationSteps*self.deltaTau
-        self._refreshEvoU()
+        self.cachedPotential=None
+        self.setPotential(vPotential)
+
+    def _refreshOneStepMatrix(self):
+        oneStepMatrixH=createRK4StepMatrixH(
+            self.vPotential,
+            self.deltaTau,
+            self.deltaLambda,
+            self.wfSize,
+            self.periodicBC,
+            self.mu
+        )
+        oneStepMatrixH[np.diag_indices(self.wfSize)]+=1
+        self.oneStepMatrix=csr_matrix(oneStepMatrixH)
 
     def _refreshEvoU(self):
         '''
@@ -68,21 +151,50 @@ class SparseMatrixRK4Integrator(WFIntegrator):
             such that the nIntSteps evolution is given by
                 phi -> U * phi
         '''
-        self.evoU=csr_matrix(np.linalg.matrix_power(
-            createRK4StepMatrixH(
-                self.vPotential,
-                self.deltaTau,
-                self.deltaLambda,
-                self.wfSize,
-                self.periodicBC,
-                self.mu
-            )+np.diag(np.ones(self.wfSize)),
+        self._refreshOneStepMatrix()
+        self.evoU,self.evoUInfo=prunedMatrixPower(
+            self.oneStepMatrix,
             self.nIntegrationSteps,
-        ))
+            dropTolerance=self.dropTolerance,
+        )
+        self.evoUInfo['updatedRows']=None
+
+    def _updateEvoULocally(self,changedSites):
+        '''
+            row i of 1+H depends on v within four sites of i and
+            row i of U=(1+H)^n on the rows of 1+H within n-1 hops:
+            only these rows of U are recomputed (1+H is rebuilt
+            whole, as it is cheap in one dimension)
+        '''
+        self._refreshOneStepMatrix()
+        powerRows=reachableRows(
+            self.oneStepMatrix,
+            reachableRows(self.oneStepMatrix,changedSites,1),
+            self.nIntegrationSteps-1,
+        )
+        newRows,rowsErrorBound=prunedRowsOfPower(
+            self.oneStepMatrix,
+            powerRows,
+            self.nIntegrationSteps,
+            dropTolerance=self.dropTolerance,
+        )
+        self.evoU=replaceRows(self.evoU,powerRows,newRows)
+        self.evoUInfo={
+            'nnz': self.evoU.nnz,
+            'bytes': self.evoU.data.nbytes+self.evoU.indices.nbytes+self.evoU.indptr.nbytes,
+            'errorBound': max(self.evoUInfo['errorBound'],rowsErrorBound),
+            'products': self.nIntegrationSteps-1,
+            'abandoned': False,
+            'updatedRows': len(powerRows),
+        }
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
-        self._refreshEvoU()
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is None:
+            self._refreshEvoU()
+        elif len(changedSites)>0:
+            self._updateEvoULocally(changedSites)
 
     def integrate(self,phi,nSteps):
         '''
@@ -100,11 +212,16 @@ class SparseMatrixRK4Integrator(WFIntegrator):
             self.totalDeltaTau,
         )
 
+    def integrateBatch(self,phis,nSteps):
+        return self._normaliseBatch(self.evoU.dot(phis),self.totalDeltaTau)
+
 class RK4StepByStepIntegrator(WFIntegrator):
     '''
         RK4
         does not use matrices
         one timestep at a time (internally, for phi->phi)
+        F[phi] is the in-place stencil evolutionOperatorInto
+        and the stages live in a workspace reused across calls
     '''
     def __init__(
         self,
@@ -128,46 +245,23 @@ class RK4StepByStepIntegrator(WFIntegrator):
         self.mu=mu
         # specials
         self.kineticFactor=-1.0/(2.0*float(self.mu))
-        # not much else to do
+        self.workPhi=np.zeros(self.wfSize,dtype=complex)
+        self.scratch=np.zeros(self.wfSize,dtype=complex)
+        self.rk4Workspace=makeRK4Workspace(self.workPhi)
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
 
-    def _performSingleRKStep(self,phi):
-        '''
-            does what the function name says
-            and returns a new phi.
-            No normalisation is performed
-        '''
-        k1 = evolutionOperator(
-            phi,
+    def _evolutionOperatorInto(self,Phi,out):
+        return evolutionOperatorInto(
+            Phi,
             self.vPotential,
             self.deltaLambda,
             self.kineticFactor,
             self.periodicBC,
+            out,
+            self.scratch,
         )
-        k2 = evolutionOperator(
-            phi+k1*self.halfDeltaTau,
-            self.vPotential,
-            self.deltaLambda,
-            self.kineticFactor,
-            self.periodicBC,
-        )
-        k3=evolutionOperator(
-            phi+k2*self.halfDeltaTau,
-            self.vPotential,
-            self.deltaLambda,
-            self.kineticFactor,
-            self.periodicBC,
-        )
-        k4=evolutionOperator(
-            phi+self.deltaTau*k3,
-            self.vPotential,
-            self.deltaLambda,
-            self.kineticFactor,
-            self.periodicBC,
-        )
-        return phi+self.deltaTau*(k1+2*k2+2*k3+k4)/6.0
 
     def integrate(self,phi,nSteps):
         '''
@@ -176,12 +270,118 @@ class RK4StepByStepIntegrator(WFIntegrator):
             nSteps is used (even though it should match nIntegrationSteps)
             and the returned elapsedTime accordingly
         '''
-        newPhi=phi
+        np.copyto(self.workPhi,phi)
         for _ in range(nSteps):
-            newPhi=self._performSingleRKStep(newPhi)
-        newNorm=norm(newPhi,self.deltaLambda)
+            rk4StepInPlace(
+                self._evolutionOperatorInto,
+                self.workPhi,
+                self.rk4Workspace,
+                self.deltaTau,
+            )
+        newNorm=norm(self.workPhi,self.deltaLambda)
         return (
-            newPhi/newNorm,
+            self.workPhi/newNorm,
+            newNorm-1,
+            self.deltaTau*nSteps,
+        )
+
+    def integrateBatch(self,phis,nSteps):
+        '''
+            the stencil and the RK4 stages run
+            on the whole (wfSize,K) batch at once
+        '''
+        Phis=np.array(phis,dtype=complex)
+        workspace=makeRK4Workspace(Phis)
+        scratch=np.zeros(Phis.shape,dtype=complex)
+        vPotential2D=self.vPotential[:,np.newaxis]
+        def _batchEvolutionOperatorInto(Phis,out):
+            return evolutionOperatorInto(
+                Phis,
+                vPotential2D,
+                self.deltaLambda,
+                self.kineticFactor,
+                self.periodicBC,
+                out,
+                scratch,
+            )
+        for _ in range(nSteps):
+            rk4StepInPlace(
+                _batchEvolutionOperatorInto,
+                Phis,
+                workspace,
+                self.deltaTau,
+                batch=True,
+            )
+        return self._normaliseBatch(Phis,self.deltaTau*nSteps)
+
+class DormandPrinceIntegrator(WFIntegrator):
+    '''
+        Adaptive RK45 (Dormand-Prince 5(4), embedded error estimate)
+        each call covers exactly nSteps*deltaTau, with an internal
+        step adapted to relTolerance/absTolerance (deltaTau is only
+        the first guess); F[phi] is the in-place stencil.
+        The step counts of the last call are in lastAdaptiveInfo
+    '''
+    def __init__(
+        self,
+        wfSize,
+        deltaTau,
+        deltaLambda,
+        nIntegrationSteps,
+        vPotential,
+        periodicBC,
+        mu,
+        relTolerance=1e-6,
+        absTolerance=1e-8,
+    ):
+        '''
+            nIntegrationSteps is discarded
+        '''
+        self.wfSize=wfSize
+        self.periodicBC=periodicBC
+        self.deltaTau=deltaTau
+        self.deltaLambda=deltaLambda
+        self.vPotential=vPotential
+        self.mu=mu
+        self.relTolerance=relTolerance
+        self.absTolerance=absTolerance
+        # specials
+        self.kineticFactor=-1.0/(2.0*float(self.mu))
+        self.workPhi=np.zeros(self.wfSize,dtype=complex)
+        self.scratch=np.zeros(self.wfSize,dtype=complex)
+        self.dormandPrinceWorkspace=makeDormandPrinceWorkspace(self.workPhi)
+        self.nextDeltaTau=self.deltaTau
+        self.lastAdaptiveInfo=None
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+
+    def _evolutionOperatorInto(self,Phi,out):
+        return evolutionOperatorInto(
+            Phi,
+            self.vPotential,
+            self.deltaLambda,
+            self.kineticFactor,
+            self.periodicBC,
+            out,
+            self.scratch,
+        )
+
+    def integrate(self,phi,nSteps):
+        np.copyto(self.workPhi,phi)
+        self.lastAdaptiveInfo=dormandPrincePropagate(
+            self._evolutionOperatorInto,
+            self.workPhi,
+            self.deltaTau*nSteps,
+            self.dormandPrinceWorkspace,
+            self.nextDeltaTau,
+            relTolerance=self.relTolerance,
+            absTolerance=self.absTolerance,
+        )
+        self.nextDeltaTau=self.lastAdaptiveInfo['deltaTau']
+        newNorm=norm(self.workPhi,self.deltaLambda)
+        return (
+            self.workPhi/newNorm,
             newNorm-1,
             self.deltaTau*nSteps,
         )
@@ -191,6 +391,8 @@ class NaiveFiniteDifferenceIntegrator(WFIntegrator):
         Naive finite-difference integrator
         uses the simple discretised (adimensional) Schroedinger eq.
         one timestep at a time (internally, for phi->phi)
+        as a vectorised, in-place forward-Euler update
+        on buffers reused across calls
     '''
     def __init__(
         self,
@@ -214,39 +416,127 @@ class NaiveFiniteDifferenceIntegrator(WFIntegrator):
         self.mu=mu
         # specials
         self.kineticFactor=-1.0/(2.0*float(self.mu))
-        # not much else to do
+        self.workPhi=np.zeros(self.wfSize,dtype=complex)
+        self.deltaPhi=np.zeros(self.wfSize,dtype=complex)
+        self.scratch=np.zeros(self.wfSize,dtype=complex)
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
 
     def _performSingleIntegrationStep(self,phi):
         '''
-            does what the function name says
-            and returns a new phi, over a single deltaTau.
+            does what the function name says, updating
+            phi in place, over a single deltaTau.
             No normalisation is performed
         '''
-        return np.array([
-          p+self.deltaTau*dp
-          for p,dp in zip(
-                phi,
-                evolutionOperator(
-                    phi,
-                    self.vPotential,
-                    self.deltaLambda,
-                    self.kineticFactor,
-                    self.periodicBC,
-                ),
-            )
-        ])
+        evolutionOperatorInto(
+            phi,
+            self.vPotential,
+            self.deltaLambda,
+            self.kineticFactor,
+            self.periodicBC,
+            self.deltaPhi,
+            self.scratch,
+        )
+        np.multiply(self.deltaPhi,self.deltaTau,out=self.deltaPhi)
+        np.add(phi,self.deltaPhi,out=phi)
+        return phi
 
     def integrate(self,phi,nSteps):
         '''
             Implements a simple integration,
             repeated nSteps times.
         '''
+        np.copyto(self.workPhi,phi)
+        for _ in range(nSteps):
+            self._performSingleIntegrationStep(self.workPhi)
+        newNorm=norm(self.workPhi,self.deltaLambda)
+        return (
+            self.workPhi/newNorm,
+            newNorm-1,
+            self.deltaTau*nSteps,
+        )
+
+    def integrateBatch(self,phis,nSteps):
+        '''
+            the forward-Euler update on the whole (wfSize,K) batch at once
+        '''
+        Phis=np.array(phis,dtype=complex)
+        deltaPhis=np.zeros(Phis.shape,dtype=complex)
+        scratch=np.zeros(Phis.shape,dtype=complex)
+        vPotential2D=self.vPotential[:,np.newaxis]
+        for _ in range(nSteps):
+            evolutionOperatorInto(
+                Phis,
+                vPotential2D,
+                self.deltaLambda,
+                self.kineticFactor,
+                self.periodicBC,
+                deltaPhis,
+                scratch,
+            )
+            np.multiply(deltaPhis,self.deltaTau,out=deltaPhis)
+            np.add(Phis,deltaPhis,out=Phis)
+        return self._normaliseBatch(Phis,self.deltaTau*nSteps)
+
+class CrankNicolsonIntegrator(WFIntegrator):
+    '''
+        Crank-Nicolson
+        implicit, unconditionally stable and norm-preserving:
+            (1 - deltaTau*F/2) phi' = (1 + deltaTau*F/2) phi
+        the left-hand matrix is factorised (sparse LU) once
+        per potential and reused until setPotential is called
+    '''
+    def __init__(
+        self,
+        wfSize,
+        deltaTau,
+        deltaLambda,
+        nIntegrationSteps,
+        vPotential,
+        periodicBC,
+        mu,
+    ):
+        self.nIntegrationSteps=nIntegrationSteps
+        self.wfSize=wfSize
+        self.periodicBC=periodicBC
+        self.deltaTau=deltaTau
+        self.deltaLambda=deltaLambda
+        self.vPotential=vPotential
+        self.mu=mu
+        self.cachedPotential=None
+        self.setPotential(vPotential)
+
+    def _refreshFactorisation(self):
+        '''
+            builds the explicit (right-hand) matrix and
+            the LU factorisation of the implicit (left-hand) one
+        '''
+        halfStepF=0.5*self.deltaTau*createEvolutionMatrixF(
+            self.vPotential,
+            self.wfSize,
+            self.deltaLambda,
+            self.periodicBC,
+            self.mu,
+        )
+        identity=np.diag(np.ones(self.wfSize))
+        self.explicitMatrix=csr_matrix(identity+halfStepF)
+        self.implicitLU=splu(csc_matrix(identity-halfStepF))
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is None or len(changedSites)>0:
+            self._refreshFactorisation()
+
+    def integrate(self,phi,nSteps):
+        '''
+            nSteps CN steps, each a sparse matvec
+            and a solve with the cached factorisation
+        '''
         newPhi=phi
         for _ in range(nSteps):
-            newPhi=self._performSingleIntegrationStep(newPhi)
+            newPhi=self.implicitLU.solve(self.explicitMatrix.dot(newPhi))
         newNorm=norm(newPhi,self.deltaLambda)
         return (
             newPhi/newNorm,
@@ -254,6 +544,105 @@ class NaiveFiniteDifferenceIntegrator(WFIntegrator):
             self.deltaTau*nSteps,
         )
 
+    def integrateBatch(self,phis,nSteps):
+        '''
+            a sparse matrix-matrix product and a
+            multi-column solve per step
+        '''
+        newPhis=phis
+        for _ in range(nSteps):
+            newPhis=self.implicitLU.solve(self.explicitMatrix.dot(newPhis))
+        return self._normaliseBatch(newPhis,self.deltaTau*nSteps)
+
+class ChebyshevIntegrator(WFIntegrator):
+    '''
+        Chebyshev global propagator (for static potentials)
+        exp(-i H nIntegrationSteps*deltaTau) is expanded in Chebyshev
+        polynomials over the (Gershgorin) spectral bounds of H=iF;
+        each frame costs matvecsPerFrame sparse matvecs
+    '''
+    def __init__(
+        self,
+        wfSize,
+        deltaTau,
+        deltaLambda,
+        nIntegrationSteps,
+        vPotential,
+        periodicBC,
+        mu,
+        chebyshevTolerance=1e-15,
+    ):
+        '''
+            as for SparseMatrixRK4Integrator, the frame interval is
+            fixed to nIntegrationSteps*deltaTau here
+        '''
+        self.nIntegrationSteps=nIntegrationSteps
+        self.wfSize=wfSize
+        self.periodicBC=periodicBC
+        self.deltaTau=deltaTau
+        self.deltaLambda=deltaLambda
+        self.vPotential=vPotential
+        self.mu=mu
+        self.chebyshevTolerance=chebyshevTolerance
+        self.totalDeltaTau=self.nIntegrationSteps*self.deltaTau
+        self.cachedPotential=None
+        self.setPotential(vPotential)
+
+    def _refreshExpansion(self):
+        self.hMatrix=csr_matrix((complex(0,1)*createEvolutionMatrixF(
+            self.vPotential,
+            self.wfSize,
+            self.deltaLambda,
+            self.periodicBC,
+            self.mu,
+        )).real)
+        self.spectralBounds=gershgorinBounds(self.hMatrix)
+        (
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )=chebyshevCoefficients(
+            self.spectralBounds[0],
+            self.spectralBounds[1],
+            self.totalDeltaTau,
+            tolerance=self.chebyshevTolerance,
+        )
+        self.matvecsPerFrame=max(1,len(self.chebyshevCoefficients)-1)
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is None or len(changedSites)>0:
+            self._refreshExpansion()
+
+    def integrate(self,phi,nSteps):
+        '''
+            NO CHECKS are made whether nSteps matches self.nIntegrationSteps
+        '''
+        newPhi,_=chebyshevPropagate(
+            self.hMatrix,
+            phi,
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )
+        newNorm=norm(newPhi,self.deltaLambda)
+        return (
+            newPhi/newNorm,
+            newNorm-1,
+            self.totalDeltaTau,
+        )
+
+    def integrateBatch(self,phis,nSteps):
+        newPhis,_=chebyshevPropagate(
+            self.hMatrix,
+            phis,
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )
+        return self._normaliseBatch(newPhis,self.totalDeltaTau)
+
 # general-purpose dynamic matrix utilities
 
 def createRK4StepMatrixH(vPotential,deltaTau,deltaLambda,wfSize,periodicBC,mu):
@@ -263,7 +652,8 @@ def createRK4StepMatrixH(vPotential,deltaTau,deltaLambda,wfSize,periodicBC,mu):
             phi -> phi + H*phi
     '''
     sF=deltaTau*createEvolutionMatrixF(vPotential,wfSize,deltaLambda,periodicBC,mu)
-    H=(sF+sF.dot(sF)/2.+sF.dot(sF).dot(sF)/6.+sF.dot(sF).dot(sF).dot(sF)/24.)
+    sF2=sF.dot(sF)
+    H=(sF+sF2/2.+sF2.dot(sF)/6.+sF2.dot(sF2)/24.)
     return H
 
 def createEvolutionMatrixF(vPotential,wfSize,deltaLambda,periodicBC,mu):
@@ -293,40 +683,43 @@ def evolutionOperator(Phi,vPotential,deltaLambda,kineticFactor,periodicBC):
             delta phi/delta tau = F[phi]
         i.e.
             F = -i ( (/1(2mu)) delta2phi/deltaLambda2 + v*phi )
+        returning a new array (see evolutionOperatorInto)
+    '''
+    out=np.zeros(Phi.shape,dtype=complex)
+    return evolutionOperatorInto(
+        Phi,
+        vPotential,
+        deltaLambda,
+        kineticFactor,
+        periodicBC,
+        out,
+        np.zeros(Phi.shape,dtype=complex),
+    )
+
+def evolutionOperatorInto(Phi,vPotential,deltaLambda,kineticFactor,periodicBC,out,scratch):
+    '''
+        matrix-free stencil for F[phi], written into out
+        with scratch as work array: nothing is allocated.
+        Phi can be a (wfSize,K) batch, with vPotential (wfSize,1)
     '''
-    if periodicBC:
-        enlargedPhi=np.hstack([Phi[-1:],Phi,Phi[:1]])
-        secondDerivative=kineticFactor*(2*Phi-enlargedPhi[:-2]-enlargedPhi[2:])/(deltaLambda**2)
-    else:
-        secondDerivative=np.hstack([
-            complex(0),
-            kineticFactor*(2*Phi[1:-1]-Phi[:-2]-Phi[2:])/(deltaLambda**2),
-            complex(0),
-        ])
-    #
-    minusI = complex(0,-1)
-    F = minusI*(secondDerivative+vPotential*Phi)
-    return F
+    secondDifferenceInto(Phi,periodicBC,out)
+    np.multiply(out,kineticFactor/(deltaLambda**2),out=out)
+    np.multiply(vPotential,Phi,out=scratch)
+    np.add(out,scratch,out=out)
+    np.multiply(out,complex(0,-1),out=out)
+    return out
 
 def energy(Phi,vPotential,periodicBC,deltaLambda,mu):
     '''
         evaluates <phi|E|phi>, the adimensional
-        version of <psi|E|psi>
+        version of <psi|E|psi>, as i<phi|F[phi]> with
+        the stencil of evolutionOperator (one vectorised pass;
+        no kinetic term on the end points with fixed BC)
     '''
     kineticFactor=-1.0/(2.0*float(mu))
-    if periodicBC:
-        enlargedPhi=np.hstack([Phi[-1:],Phi,Phi[:1]])
-        secondDerivative=kineticFactor*(2*Phi-enlargedPhi[:-2]-enlargedPhi[2:])/(deltaLambda**2)
-    else:
-        secondDerivative=np.hstack([
-            complex(0),
-            kineticFactor*(2*Phi[1:-1]-Phi[:-2]-Phi[2:])/(deltaLambda**2),
-            complex(0),
-        ])
-    #
-    complexEn = sum(
-        p.conjugate()*(d2+v*p)
-        for d2,v,p in zip (secondDerivative,vPotential,Phi)
+    complexEn=complex(0,1)*expectationValue(
+        Phi,
+        evolutionOperator(Phi,vPotential,deltaLambda,kineticFactor,periodicBC),
     )
     if abs(complexEn.imag) > 0.001*abs(complexEn.real):
         raise ValueError('Energy substantially complex: %f | %f' % (complexEn.real,complexEn.imag))
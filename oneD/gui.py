@@ -24,11 +24,17 @@ imColorList=  ['#b26700','#00dcff','#73ccb2']
 mod2ColorList=['#FF0000','#0000ff','#00881d']
 potColor='#00C000'
 zeroColor='#c0c0c0'
-def doPlot(xs,phiMap,pots,title='',replotting=None,photoIndex=None):
+def doPlot(xs,phiMap,pots,title='',replotting=None,photoIndex=None,momentumTransform=None):
     '''
         if replotting is None: creates the plot window.
         Else: refreshes the plot interactively using the handles
+
+        With a momentumTransform (utils.momentum.MomentumTransform),
+        given at creation, the momentum distributions |phi(k)|^2
+        are plotted instead (see doMomentumPlot)
     '''
+    if momentumTransform is not None or (replotting is not None and 'momentum' in replotting):
+        return doMomentumPlot(phiMap,title,replotting,photoIndex,momentumTransform)
     if replotting is None:
         plt.ion()
         fig = plt.figure()
@@ -84,3 +90,42 @@ def doPlot(xs,phiMap,pots,title='',replotting=None,photoIndex=None):
             print('saving %i' % photoIndex)
             replotting['fig'].set_size_inches(4,2.8)
             replotting['fig'].savefig('frame_%06i.png' % photoIndex,bbox_inches='tight')
+
+def doMomentumPlot(phiMap,title='',replotting=None,photoIndex=None,momentumTransform=None):
+    '''
+        as doPlot, for the momentum distributions |phi(k)|^2
+        (normalised to sum one, k in adimensional units)
+    '''
+    if replotting is None:
+        plt.ion()
+        fig = plt.figure()
+        ax = fig.add_subplot(111)
+        kValues=momentumTransform.kAxes[0]
+        plotMod2={}
+        totalMax=0
+        for iphi,(phiName,phi) in enumerate(sorted(phiMap.items())):
+            # (a copy, the transform reusing its buffer)
+            distribution=momentumTransform.update(phi).distribution().copy()
+            totalMax=max(totalMax,distribution.max())
+            plotMod2[phiName], = ax.plot(kValues, distribution, '-',color=mod2ColorList[iphi],lineWidth=2)
+        plt.xlabel('k')
+        plt.ylim((0,1.2*totalMax))
+        ax.set_title(title,fontsize=10,family='monospace')
+        replotting={
+            'fig' : fig,
+            'ax'  : ax,
+            'mod2': plotMod2,
+            'momentum': momentumTransform,
+        }
+    else:
+        for phiName,phi in sorted(phiMap.items()):
+            replotting['mod2'][phiName].set_ydata(
+                replotting['momentum'].update(phi).distribution().copy()
+            )
+        replotting['ax'].set_title(title,fontsize=10,family='monospace')
+        replotting['fig'].canvas.draw()
+    if photoIndex is not None:
+        print('saving %i' % photoIndex)
+        replotting['fig'].set_size_inches(4,2.8)
+        replotting['fig'].savefig('frame_%06i.png' % photoIndex,bbox_inches='tight')
+    return replotting
@@ -0,0 +1,116 @@
+'''
+    observables.py : the physical observables of the
+    one-dimensional wavefunction (see utils.observables)
+'''
+
+import numpy as np
+from scipy.sparse import diags
+
+from utils.observables import (
+    ObservableSet,
+    forwardDifferenceInto,
+)
+
+from utils.kernels import (
+    trackPotentialChanges,
+)
+
+def secondDifferenceMatrix(size,periodicBC):
+    '''
+        the stencil of utils.kernels.secondDifferenceInto
+        (2phi[i]-phi[i-1]-phi[i+1], zero at the end points
+        with fixed BC) as a sparse matrix
+    '''
+    matrix=diags(
+        [-np.ones(size-1),2*np.ones(size),-np.ones(size-1)],
+        [-1,0,1],
+        format='lil',
+    )
+    if periodicBC:
+        matrix[0,size-1]=-1
+        matrix[size-1,0]=-1
+    else:
+        matrix[0,:]=0
+        matrix[size-1,:]=0
+    return matrix.tocsr()
+
+class LineObservables(ObservableSet):
+    '''
+        observables of phi on the wfSize line, in adimensional units,
+        each added with one of the add* methods:
+            addPosition: <x>, <x^2> and the spread sigmaX
+            addMomentum: <p> (the expectation of -i d/dx, with the
+                forward difference), <p^2> (with the second difference
+                of oneD.dynamics.energy) and the spread sigmaP.
+                With the integrators' sign convention
+                d<x>/dtau=2*kineticFactor*<p>
+            addCurrent: the probability per unit time crossing a point
+            addEnergy: kineticEnergy, potentialEnergy, whose sum is
+                deltaLambda*oneD.dynamics.energy (the latter omitting
+                the line element)
+        Observables are evaluated with evaluate(phi).
+    '''
+    def __init__(self,wfSize,deltaLambda,periodicBC,mu):
+        self.wfSize=wfSize
+        self.deltaLambda=deltaLambda
+        self.periodicBC=periodicBC
+        self.kineticFactor=-1.0/(2.0*float(mu))
+        # a copy of the potential of the energy weights
+        self.cachedPotential=None
+        ObservableSet.__init__(
+            self,
+            wfSize,
+            deltaLambda,
+            {
+                'difference': self._differenceInto,
+                'kinetic': secondDifferenceMatrix(wfSize,periodicBC)/(deltaLambda**2),
+            },
+        )
+
+    def _differenceInto(self,phi,out):
+        forwardDifferenceInto(phi,0,self.periodicBC,out)
+
+    def addPosition(self):
+        xs=np.arange(self.wfSize)*self.deltaLambda
+        self.register('x',[('density',xs)])
+        self.register('x2',[('density',xs**2)])
+        self.registerSpread('sigmaX','x','x2')
+
+    def addMomentum(self):
+        ones=np.ones(self.nSites)
+        self.register('p',[('imdifference',ones/self.deltaLambda)])
+        self.register('p2',[('rekinetic',ones)])
+        self.registerSpread('sigmaP','p','p2')
+
+    def addCurrent(self,name,position):
+        '''
+            the probability per unit time flowing from the site at
+            the given fraction of the line to the next one
+            (positive towards larger x)
+        '''
+        weights=np.zeros(self.wfSize)
+        # j = 2*kineticFactor*Im(phi^* D+ phi) for H = kineticFactor*(second difference)+v
+        weights[int(position*self.wfSize)]=2*self.kineticFactor/(self.deltaLambda*self.deltaVolume)
+        self.register(name,[('imdifference',weights)])
+
+    def addEnergy(self,vPotential):
+        self.register(
+            'kineticEnergy',
+            [('rekinetic',self.kineticFactor*np.ones(self.nSites))],
+        )
+        self.register('potentialEnergy',[('density',vPotential)],keepZeros=True)
+        self.cachedPotential,_=trackPotentialChanges(None,vPotential)
+
+    def setPotential(self,vPotential):
+        '''
+            to be called when the potential may have changed (if
+            addEnergy was used): the contents are compared, as
+            integrators may refill the same array in place
+        '''
+        if self.cachedPotential is not None:
+            self.cachedPotential,changedSites=trackPotentialChanges(
+                self.cachedPotential,
+                vPotential,
+            )
+            if changedSites is None or len(changedSites)>0:
+                self.updateWeights('potentialEnergy',vPotential)
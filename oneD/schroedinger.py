@@ -9,6 +9,9 @@
 import matplotlib.pyplot as plt
 import math
 import itertools
+import atexit
+import os
+import numpy as np
 
 from oneD.settings import (
     Lambda,
@@ -20,12 +23,35 @@ from oneD.settings import (
     periodicBC,
     Mu,
     integratorMap,
+    observablesDirectory,
+    observedCurrents,
+    highKCutoff,
+    momentumView,
+    checkpointDirectory,
+    checkpointEvery,
 )
 
 from oneD.dynamics import (
     energy,
 )
 
+from oneD.observables import (
+    LineObservables,
+)
+
+from utils.observables import (
+    ObservablesWriter,
+)
+
+from utils.momentum import (
+    MomentumTransform,
+)
+
+from utils.checkpoint import (
+    CheckpointWriter,
+    resumableCheckpoint,
+)
+
 from oneD.tools import (
     mod2,
     norm,
@@ -107,6 +133,47 @@ def initPot():
         ],
     )
 
+def initObservables(pot):
+    observables=LineObservables(
+        wfSize=Nx,
+        deltaLambda=deltaLambda,
+        periodicBC=periodicBC,
+        mu=Mu,
+    )
+    observables.addPosition()
+    observables.addMomentum()
+    observables.addEnergy(pot)
+    for currentName,currentPosition in observedCurrents.items():
+        observables.addCurrent(currentName,currentPosition)
+    return observables
+
+def adaptiveStepsText(integrator):
+    '''
+        accepted/rejected steps of the last frame, for adaptive integrators
+    '''
+    adaptiveInfo=getattr(integrator,'lastAdaptiveInfo',None)
+    if adaptiveInfo is None:
+        return ''
+    else:
+        return ' [%i/%i acc/rej steps]' % (
+            adaptiveInfo['accepted'],
+            adaptiveInfo['rejected'],
+        )
+
+def runParameters():
+    '''
+        what a checkpoint must share with the run resuming from it
+    '''
+    return {
+        'integrators': sorted(integratorMap.keys()),
+        'Nx': Nx,
+        'Mu': Mu,
+        'deltaTau': deltaTau,
+        'deltaLambda': deltaLambda,
+        'periodicBC': periodicBC,
+        'drawFreq': drawFreq,
+    }
+
 if __name__=='__main__':
     #
     print('Init [L=%f fm, DeltaT=%.2E fs]' % (
@@ -122,13 +189,35 @@ if __name__=='__main__':
         k: phi
         for k in integratorMap.keys()
     }
+    tau=0
+    firstFrame=0
+    if checkpointDirectory is not None:
+        checkpoint=resumableCheckpoint(checkpointDirectory,runParameters())
+        if checkpoint is not None:
+            pot=np.array(checkpoint['arrays']['potential'])
+            phiMap={
+                k: np.array(checkpoint['arrays']['phi-%s' % k])
+                for k in integratorMap.keys()
+            }
+            tau=checkpoint['values']['tau']
+            firstFrame=checkpoint['frame']+1
+            print('Resuming from frame %i' % firstFrame)
+        checkpointWriter=CheckpointWriter(checkpointDirectory)
+        atexit.register(checkpointWriter.close)
+    else:
+        checkpointWriter=None
     normDevMap={k: None for k in integratorMap.keys()}
     tauIncrMap={k: None for k in integratorMap.keys()}
     energyMap={k: None for k in integratorMap.keys()}
-    replottable=doPlot(xvalues,phiMap,pot)
+    highKMap={k: None for k in integratorMap.keys()}
+    momentumTransform=MomentumTransform((Nx,),(deltaLambda,),highKCutoff=highKCutoff)
+    replottable=doPlot(
+        xvalues,
+        phiMap,
+        pot,
+        momentumTransform=momentumTransform if momentumView else None,
+    )
     #
-    tau=0
-
     integrators={
         k: v(
             wfSize=Nx,
@@ -142,24 +231,60 @@ if __name__=='__main__':
         for k,v in integratorMap.items()
     }
 
+    if observablesDirectory is not None:
+        observables=initObservables(pot)
+        observablesWriters={
+            k: ObservablesWriter(
+                os.path.join(observablesDirectory,k),
+                ['frame','tau']+observables.names()+['energy','normDeviation','highKFraction'],
+            )
+            for k in integrators.keys()
+        }
+        for observablesWriter in observablesWriters.values():
+            atexit.register(observablesWriter.close)
+    else:
+        observablesWriters=None
+
     import time
     ini=time.time()
-    for i in range(framesToDraw) if framesToDraw is not None else itertools.count():
+    for i in range(firstFrame,framesToDraw) if framesToDraw is not None else itertools.count(firstFrame):
         for k,v in integrators.items():
             phiMap[k],normDevMap[k],tauIncrMap[k]=v.integrate(phiMap[k],drawFreq)
             energyMap[k]=energy(phiMap[k],pot,periodicBC,deltaLambda,Mu)
+            highKMap[k]=momentumTransform.highKFraction(phiMap[k])
         assert(len(set(tauIncrMap.values()))==1)
         tau+=list(tauIncrMap.values())[0]
+        if observablesWriters is not None:
+            for k,observablesWriter in observablesWriters.items():
+                observablesWriter.push(observables.evaluate(
+                    phiMap[k],
+                    frame=i,
+                    tau=tau,
+                    energy=energyMap[k],
+                    normDeviation=normDevMap[k],
+                    highKFraction=highKMap[k],
+                ))
+        if checkpointWriter is not None and (i+1)%checkpointEvery==0:
+            checkpointWriter.save(
+                i,
+                dict(
+                    {'phi-%s' % k: phiMap[k] for k in integrators.keys()},
+                    potential=pot,
+                ),
+                {'tau': float(tau), 'parameters': runParameters()},
+            )
 
         descText='[f=%6i, stp=%6i] t=%.3E fs\n%s' % (
             i,
             i*drawFreq,
             toTime_fs(tau),
             '\n'.join(
-                '%s: E=%+.3E MeV (nd=%+.3E)' % (
+                '%s: E=%+.3E MeV (nd=%+.3E, hiK=%.1E)%s' % (
                     k,
                     toEnergy_MeV(energyMap[k]),
                     normDevMap[k],
+                    highKMap[k],
+                    adaptiveStepsText(integrators[k]),
                 )
                 for k in sorted(integrators.keys())
             )
@@ -8,6 +8,9 @@ from oneD.dynamics import (
     SparseMatrixRK4Integrator,
     RK4StepByStepIntegrator,
     NaiveFiniteDifferenceIntegrator,
+    CrankNicolsonIntegrator,
+    ChebyshevIntegrator,
+    DormandPrinceIntegrator,
 )
 
 # PHYSICAL PARAMETERS
@@ -34,8 +37,31 @@ integratorMap={
     'RKspa': SparseMatrixRK4Integrator,
     # 'RKste': RK4StepByStepIntegrator,
     #'Naive': NaiveFiniteDifferenceIntegrator,
+    # 'CN': CrankNicolsonIntegrator,
+    # 'Cheb': ChebyshevIntegrator,
+    # 'DP45': DormandPrinceIntegrator,
 }
 # every drawFreq deltaTau updates is the screen refreshed
 drawFreq=800
 # how many frames to draw before stopping (None = forever)
 framesToDraw=180
+
+# per-frame observables (position, momentum, spreads, energy breakdown,
+# probability currents at the given fractions of the line), streamed as
+# chunked .npy files to a subdirectory per integrator (None = disabled);
+# read back with utils.observables.loadObservables
+observablesDirectory=None
+observedCurrents={'centre': 0.5}
+
+# fraction of the norm above this fraction of the grid-scale |k|,
+# shown each frame; with momentumView the momentum distributions
+# |phi(k)|^2 are plotted instead of the wavefunctions
+highKCutoff=0.8
+momentumView=False
+
+# checkpoints (the wavefunctions of all integrators, tau, the potential)
+# written every checkpointEvery frames to checkpointDirectory (None =
+# disabled) from a background thread; a run with the same parameters
+# resumes from the latest one found there (see utils.checkpoint)
+checkpointDirectory=None
+checkpointEvery=20
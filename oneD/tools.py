@@ -9,7 +9,10 @@ def mod2(psi):
     return (psi.conjugate()*psi).real
 
 def norm(psi,deltaLambda):
-    return (sum(mod2(psi))*deltaLambda)**0.5
+    '''
+        psi can also be a (N,K) batch: then K norms are returned
+    '''
+    return (mod2(psi).sum(axis=0)*deltaLambda)**0.5
 
 def re(psi):
     return psi.real
@@ -9,6 +9,9 @@ from qpong.settings import (
     Ny,
     Mu,
     deltaTau,
+    autoTimestep,
+    integratorClass,
+    operatorStoreDirectory,
     deltaLambdaX,
     deltaLambdaY,
     waveNumber0,
@@ -38,10 +41,6 @@ from twoD.potentials import (
     rectangularHolePotential,
 )
 
-from twoD.dynamics import (
-    VariablePotSparseRK4Integrator,
-)
-
 from qpong.artifacts import (
     makeRectangularArtifactList,
     makeCircleArtifact,
@@ -341,7 +340,7 @@ def initialiseMatch(mutableGameState):
         backgroundPot=mutableGameState['basePot'],
         matrixRepo=mutableGameState['globalMatrixRepo'],
     )
-    mutableGameState['physics']['integrator']=VariablePotSparseRK4Integrator(
+    mutableGameState['physics']['integrator']=integratorClass(
         wfSizeX=Nx,
         wfSizeY=Ny,
         deltaTau=deltaTau,
@@ -354,6 +353,9 @@ def initialiseMatch(mutableGameState):
         mu=Mu,
         exactEnergy=True,
         slicesSet=[0.0,0.25,0.5,0.75],
+        autoTimestep=autoTimestep,
+        operatorCache=mutableGameState['operatorCache'],
+        operatorStore=operatorStoreDirectory,
     )
     mutableGameState['physics']['phi']=initPhi()
     mutableGameState['physics']['tau']=0
@@ -81,6 +81,25 @@ panelHeight=80 # pixels
 # (True = some speedup)
 useMRepo=True
 
+# smoothing of phi (when the energy drops, see initEnergyThreshold):
+#   'stencil': the smoothing map as an in-place direct stencil
+#   'matrix':  the same, as a product with the (sparse) smoothing matrix
+#   'spectral': a low-pass filter removing only the grid-scale modes
+#               (the fraction of the highest frequency above
+#               spectralFilterCutoff, with a roll-off of that width)
+phiSmoothing='stencil'
+spectralFilterCutoff=0.8
+spectralFilterRollOff=0.1
+# what triggers the smoothing of phi:
+#   'energy': the energy dropping below initEnergyThreshold
+#   'highK':  the fraction of the norm above highKCutoff (a fraction of
+#             the grid-scale |k|, see utils.momentum) exceeding
+#             highKThreshold: the grid-scale noise is caught as it
+#             builds up, before it shows in the energy (one FFT per frame)
+smoothingTrigger='energy'
+highKCutoff=0.8
+highKThreshold=1e-3
+
 # on-screen countdown before match starts
 matchCountdownSteps=3
 matchCountdownSpan=0.5
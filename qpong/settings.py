@@ -7,9 +7,16 @@
 
 '''
 
+import os
 import math
 import pygame
 
+from twoD.dynamics import (
+    VariablePotSparseRK4Integrator,
+    SparseMatrixRK4Integrator,
+    WoodburyCrankNicolsonIntegrator,
+)
+
 # Physical parameters
 LambdaX = 1
 LambdaY = 1
@@ -19,6 +26,29 @@ Mu = 0.25
 Nx=65
 Ny=65
 deltaTau = 0.000003
+# with autoTimestep, deltaTau*drawFreq only fixes the time
+# between frames: the integrator picks the largest stable
+# step (and the number of steps) for the current potential
+autoTimestep=True
+# the potential is re-set at each frame but only changes, near
+# the pads, as these move: SparseMatrixRK4Integrator skips the
+# unchanged frames and updates only the rows of its precomputed
+# operators around the pads, VariablePotSparseRK4Integrator
+# just rewrites the diagonal of its matrix.
+# WoodburyCrankNicolsonIntegrator (implicit, so set autoTimestep=False;
+# it stays stable with a larger deltaTau and a smaller drawFreq)
+# factorises once for the starting potential and corrects
+# for the pads having moved with a solve on the pad sites only
+integratorClass=VariablePotSparseRK4Integrator
+# the pads move on a lattice (padIncrement), so the same potentials
+# recur: integrators keeping built operators (SparseMatrixRK4,
+# CrankNicolson, SplitOperator) reuse them through an LRU cache
+# of this many bytes, kept across matches (0 for none)
+operatorCacheBytes=256*2**20
+# directory of the on-disk store of the potential-independent
+# operators (free-particle matrix, smoothing matrix), loaded
+# memory-mapped at startup and match start (None for no store)
+operatorStoreDirectory=os.path.join(os.path.expanduser('~'),'.cache','pyschroedinger')
 
 periodicBCX=False
 periodicBCY=False
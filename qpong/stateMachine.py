@@ -20,6 +20,9 @@ from qpong.settings import (
     periodicBCY,
     LambdaX,
     LambdaY,
+    Mu,
+    operatorCacheBytes,
+    operatorStoreDirectory,
 )
 
 from qpong.interactive import (
@@ -39,6 +42,17 @@ from qpong.artifacts import (
 
 from twoD.dynamics import (
     makeSmoothingMatrix,
+    StencilSmoother,
+    SpectralFilter,
+    OperatorCache,
+)
+
+from utils.operatorStore import (
+    loadOrBuildOperator,
+)
+
+from utils.momentum import (
+    MomentumTransform,
 )
 
 from qpong.interactiveSettings import (
@@ -46,6 +60,11 @@ from qpong.interactiveSettings import (
     fieldBevelY,
     halfFieldArtifactWidth,
     useMRepo,
+    phiSmoothing,
+    spectralFilterCutoff,
+    spectralFilterRollOff,
+    smoothingTrigger,
+    highKCutoff,
     matchCountdownSteps,
     matchCountdownSpan,
     endMatchStillTime,
@@ -318,6 +337,42 @@ def handleStateUpdate(curState, scEvent, mutableGameState):
     return newState,mutableGameState
 
 
+# the smoothing applied to phi after each frame
+phiSmoothingMap=[
+    (( 0, 0),1.0),
+    (( 0,+1),0.1),
+    (( 0,-1),0.1),
+    ((+1, 0),0.1),
+    ((-1, 0),0.1),
+]
+
+def makePhiSmoother():
+    '''
+        the in-place smoother of phi chosen by phiSmoothing
+        (None when the smoothing matrix is used instead)
+    '''
+    if phiSmoothing=='stencil':
+        return StencilSmoother(
+            wfSizeX=Nx,
+            wfSizeY=Ny,
+            smoothingMap=phiSmoothingMap,
+        )
+    elif phiSmoothing=='spectral':
+        return SpectralFilter(
+            wfSizeX=Nx,
+            wfSizeY=Ny,
+            periodicBCX=periodicBCX,
+            periodicBCY=periodicBCY,
+            deltaLambdaX=deltaLambdaX,
+            deltaLambdaY=deltaLambdaY,
+            mu=Mu,
+            cutoff=spectralFilterCutoff,
+            rollOff=spectralFilterRollOff,
+        )
+    elif phiSmoothing=='matrix':
+        return None
+    else:
+        raise ValueError('Unknown phiSmoothing "%s"' % phiSmoothing)
 
 def initMutableGameState(gState,sound):
     '''
@@ -336,18 +391,24 @@ def initMutableGameState(gState,sound):
         'basePot': prepareBasePotential(),
         'patchPot': initPatchPotential(),
         'globalMatrixRepo': prepareMatrixRepository() if useMRepo else None,
-        'phiSmoothingMatrix': makeSmoothingMatrix(
-            wfSizeX=Nx,
-            wfSizeY=Ny,
-            periodicBCX=periodicBCX,
-            periodicBCY=periodicBCY,
-            smoothingMap=[
-                (( 0, 0),1.0),
-                (( 0,+1),0.1),
-                (( 0,-1),0.1),
-                ((+1, 0),0.1),
-                ((-1, 0),0.1),
-            ]
+        'operatorCache': OperatorCache(maxBytes=operatorCacheBytes) if operatorCacheBytes>0 else None,
+        'phiSmoother': makePhiSmoother(),
+        'momentumTransform': None if smoothingTrigger!='highK' else MomentumTransform(
+            (Nx,Ny),
+            (deltaLambdaX,deltaLambdaY),
+            highKCutoff=highKCutoff,
+        ),
+        'phiSmoothingMatrix': None if phiSmoothing!='matrix' else loadOrBuildOperator(
+            operatorStoreDirectory,
+            'smoothingMatrix',
+            (Nx,Ny,periodicBCX,periodicBCY,phiSmoothingMap),
+            lambda: makeSmoothingMatrix(
+                wfSizeX=Nx,
+                wfSizeY=Ny,
+                periodicBCX=periodicBCX,
+                periodicBCY=periodicBCY,
+                smoothingMap=phiSmoothingMap,
+            ),
         ),
         'halfField': makeCheckerboardRectangularArtifact(
             Nx=Nx,
@@ -2,17 +2,80 @@
     dynamics.py : integration of the Schroedinger equation
 '''
 
+from collections import OrderedDict
+from functools import lru_cache
+import hashlib
 import numpy as np
-from scipy.sparse import csr_matrix
+from scipy.sparse import (
+    csr_matrix,
+    csc_matrix,
+    diags,
+    kron,
+    identity as identityMatrix,
+)
+from scipy.sparse.linalg import splu
+from scipy.linalg import (
+    lu_factor,
+    lu_solve,
+)
+from scipy.fftpack import dst
+
+from utils.propagators import (
+    lanczosPropagate,
+    gershgorinBounds,
+    chebyshevCoefficients,
+    chebyshevPropagate,
+    prunedMatrixPower,
+    prunedRowsOfPower,
+    replaceRows,
+    reachableRows,
+)
+
+from utils.kernels import (
+    sparseMatVecInto,
+    columnVdot,
+    makeRK4Workspace,
+    rk4StepInPlace,
+    makeDormandPrinceWorkspace,
+    dormandPrincePropagate,
+    secondDifferenceInto,
+    diagonalPositions,
+    trackPotentialChanges,
+    shiftedInto,
+    shiftedAddInto,
+    expectationValue,
+    mod2Into,
+)
+
+from utils.operatorStore import (
+    loadOrBuildOperator,
+)
+
+from utils.momentum import (
+    FFT_INTO,
+)
+
+from utils.timestep import (
+    RK4_STABILITY_LIMIT,
+    spectralRadius,
+    planTimeStep,
+)
 
 from twoD.tools import (
     mod2,
     norm,
+    RegionReducer,
+    sliceRegions,
     re,
     im,
 )
 
 class WFIntegrator():
+    # |deltaTau*lambda| limit of the explicit scheme, if any (for autoTimestep)
+    stabilityLimit=None
+    # attributes holding the operators built for a potential (for operatorCache)
+    cachedOperatorNames=()
+
     def __init__(
         self,
         wfSizeX,
@@ -26,8 +89,39 @@ class WFIntegrator():
         periodicBCY,
         mu,
         exactEnergy=False,
-        slicesSet=None
+        slicesSet=None,
+        autoTimestep=False,
+        timestepSafety=0.9,
+        operatorCache=None,
+        operatorStore=None,
+        regions=None,
+        observables=None,
     ):
+        '''
+            with autoTimestep the frame interval stays
+            deltaTau*nIntegrationSteps, but deltaTau and
+            nIntegrationSteps are re-chosen at each setPotential as
+            the largest step within the stability limit of the
+            (explicit) integrator times timestepSafety
+
+            operatorCache, an OperatorCache (possibly shared among
+            integrators), lets the integrators listing their built
+            operators in cachedOperatorNames reuse them whenever
+            a potential (with the same parameters) comes back.
+
+            operatorStore, a directory, holds on disk the
+            potential-independent operators (see utils.operatorStore)
+
+            regions (a map name -> (wfSizeX,wfSizeY) weights, see
+            twoD.tools.RegionReducer) are arbitrary areas whose
+            probabilities are returned, with those of the slices,
+            in the slice-norm map of integrate
+
+            observables (e.g. a twoD.observables.GridObservables) are
+            evaluated on each new phi of integrate, in lastObservables
+            together with the energy, its complexity and the norm
+            deviation
+        '''
         self.wfSizeX=wfSizeX
         self.wfSizeY=wfSizeY
         self.periodicBCX=periodicBCX
@@ -41,11 +135,21 @@ class WFIntegrator():
         self.vPotential=vPotential
         self.mu=mu
         self.exactEnergy=exactEnergy
+        self.operatorStore=operatorStore
         self.kineticFactor=-1.0/(2.0*float(self.mu))
         self.slices = None if slicesSet is None else [
             int(0.5+slFraction*self.wfSizeX*self.wfSizeY)
             for slFraction in sorted(slicesSet)
         ]
+        if regions is None:
+            self.regionReducer=None
+        else:
+            if self.slices is None:
+                allRegions={}
+            else:
+                allRegions=sliceRegions(self.slices,self.wfSizeX,self.wfSizeY)
+            allRegions.update(regions)
+            self.regionReducer=RegionReducer(self.wfSizeX,self.wfSizeY,allRegions)
         if self.exactEnergy:
             self.energyCalculator=createEnergyCalculator(
                 self.wfSizeX,
@@ -55,23 +159,215 @@ class WFIntegrator():
                 self.deltaLambdaX,
                 self.deltaLambdaY,
                 self.mu,
+                freeMatrix=self._freeEvolutionMatrix(),
             )
         else:
             self.energyCalculator=None
         self.lastEnergy=None
+        self.lastEnergies=None
+        self.observables=observables
+        self.lastObservables=None
+        self.batchWorkspace=None
+        self.autoTimestep=autoTimestep
+        self.timestepSafety=timestepSafety
+        self.spectralRadius=None
+        self.cachedPotential=None
+        self.operatorCache=operatorCache
+        self.operatorKey=None
+        if self.autoTimestep and self.stabilityLimit is None:
+            raise ValueError('autoTimestep not available for %s' % self.__class__.__name__)
 
     def setPotential(self,pot):
         raise NotImplementedError
 
+    def _potentialChanges(self,vPotential):
+        '''
+            the indices of the sites where vPotential differs from
+            the potential of the previous call (None at the first call),
+            for the integrators able to skip or localise the update
+        '''
+        self.cachedPotential,changedSites=trackPotentialChanges(
+            self.cachedPotential,
+            vPotential,
+        )
+        return changedSites
+
+    def _freeEvolutionMatrix(self):
+        '''
+            F for a zero potential, from operatorStore if possible
+        '''
+        return loadOrBuildOperator(
+            self.operatorStore,
+            'freeEvolutionMatrixF',
+            (
+                self.wfSizeX,
+                self.wfSizeY,
+                self.deltaLambdaX,
+                self.deltaLambdaY,
+                self.periodicBCX,
+                self.periodicBCY,
+                self.mu,
+            ),
+            lambda: createEvolutionMatrixF(
+                None,
+                self.wfSizeX,
+                self.wfSizeY,
+                self.deltaLambdaX,
+                self.deltaLambdaY,
+                self.periodicBCX,
+                self.periodicBCY,
+                self.mu
+            ),
+        )
+
+    def _operatorParameters(self):
+        '''
+            everything but the potential the built operators depend on
+        '''
+        return (
+            self.__class__.__name__,
+            self.wfSizeX,
+            self.wfSizeY,
+            self.periodicBCX,
+            self.periodicBCY,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+            self.mu,
+            self.deltaTau,
+            self.nIntegrationSteps,
+        )
+
+    def _restoreOperators(self):
+        '''
+            if operatorCache holds the operators for the current
+            potential and parameters, makes them current.
+            Returns whether it did
+        '''
+        if self.operatorCache is None:
+            return False
+        self.operatorKey=operatorFingerprint(
+            self.vPotential,
+            self._operatorParameters(),
+        )
+        operators=self.operatorCache.get(self.operatorKey)
+        if operators is None:
+            return False
+        for operatorName,operator in operators.items():
+            setattr(self,operatorName,operator)
+        return True
+
+    def _storeOperators(self):
+        '''
+            to be called after a _restoreOperators miss, once the
+            operators are built. The cached objects are shared with
+            the integrator: they must not be modified in place afterwards
+        '''
+        if self.operatorCache is not None:
+            self.operatorCache.put(
+                self.operatorKey,
+                {
+                    operatorName: getattr(self,operatorName)
+                    for operatorName in self.cachedOperatorNames
+                },
+            )
+
+    def cacheStats(self):
+        '''
+            the counters of the operatorCache, if any
+        '''
+        return None if self.operatorCache is None else self.operatorCache.stats()
+
+    def operatorSnapshot(self):
+        '''
+            (operatorKey, map name -> operator) of the current
+            operators, as operatorCache would hold them (None if the
+            integrator lists none): put in an OperatorCache given to
+            a new integrator, they spare it their construction
+            (see utils.checkpoint)
+        '''
+        if not self.cachedOperatorNames:
+            return None
+        return (
+            operatorFingerprint(self.vPotential,self._operatorParameters()),
+            {
+                operatorName: getattr(self,operatorName)
+                for operatorName in self.cachedOperatorNames
+            },
+        )
+
+    def _updateHMatrix(self,changedSites):
+        '''
+            (for the integrators working with H=iF)
+            builds H, or if it exists rewrites in place its
+            diagonal at the sites where the potential changed.
+            Returns whether H changed
+        '''
+        if changedSites is None:
+            # H=iF is real symmetric: keeping it real halves the matvec cost
+            self.hMatrix=csr_matrix((complex(0,1)*createEvolutionMatrixF(
+                self.vPotential,
+                self.wfSizeX,
+                self.wfSizeY,
+                self.deltaLambdaX,
+                self.deltaLambdaY,
+                self.periodicBCX,
+                self.periodicBCY,
+                self.mu
+            )).real)
+            self.hMatrix.sort_indices()
+            self.hDiagonalPositions=diagonalPositions(self.hMatrix)
+            self.freeHDiagonal=self.hMatrix.data[self.hDiagonalPositions]-self.vPotential
+            return True
+        elif len(changedSites)>0:
+            self.hMatrix.data[self.hDiagonalPositions[changedSites]]=(
+                self.freeHDiagonal[changedSites]+self.vPotential[changedSites]
+            )
+            return True
+        else:
+            return False
+
+    def _planTimeStep(self):
+        '''
+            if autoTimestep, bounds the spectral radius of H for the
+            current potential and picks deltaTau and nIntegrationSteps
+            accordingly. Returns whether nIntegrationSteps changed
+        '''
+        if not self.autoTimestep:
+            return False
+        self.spectralRadius=spectralRadius(*hamiltonianSpectralBounds(
+            self.vPotential,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+            self.mu,
+        ))
+        prevIntegrationSteps=self.nIntegrationSteps
+        self.deltaTau,self.nIntegrationSteps=planTimeStep(
+            self.spectralRadius,
+            self.totalDeltaTau,
+            self.stabilityLimit,
+            safetyFactor=self.timestepSafety,
+        )
+        self.halfDeltaTau=0.5*self.deltaTau
+        return self.nIntegrationSteps!=prevIntegrationSteps
+
     def integrate(self,phi):
         newPhi=self._baseIntegrate(phi)
-        newNorm,sliceNorm=norm(newPhi,self.deltaLambdaXY,slices=self.slices)
+        newNorm,sliceNorm=self._norm(newPhi)
         if self.exactEnergy:
             energy=self.energyCalculator(phi,self.vPotential,self.lastEnergy)
         else:
             energy=complex(0,1)*(
                     newPhi.transpose().conjugate().dot( newPhi-phi )
                 )/self.totalDeltaTau
+        if self.observables is not None:
+            if hasattr(self.observables,'setPotential'):
+                self.observables.setPotential(self.vPotential)
+            self.lastObservables=self.observables.evaluate(
+                newPhi,
+                energy=energy.real,
+                energyComplexity=abs(energy.imag)/abs(energy.real),
+                normDeviation=newNorm-1,
+            )
 
         return (
             newPhi/newNorm,
@@ -82,6 +378,69 @@ class WFIntegrator():
             sliceNorm,
         )
 
+    def _norm(self,phi):
+        '''
+            norm and map of slice (and region) norms, as twoD.tools.norm
+        '''
+        if self.regionReducer is None:
+            return norm(phi,self.deltaLambdaXY,slices=self.slices)
+        else:
+            return self.regionReducer.reduce(phi,self.deltaLambdaXY)
+
+    def integrateBatch(self,phis):
+        '''
+            as integrate, for an ensemble of K wavefunctions
+            sharing the potential: phis is (wfSizeX*wfSizeY,K),
+            one wavefunction per column.
+            Returns the same tuple as integrate, with arrays
+            of K entries (newPhis column by column, energies,
+            energy complexities, norm deviations) and, for the
+            slices, a map slice -> array of K partial norms.
+        '''
+        newPhis=self._baseIntegrateBatch(phis)
+        newNorms,sliceNorms=self._norm(newPhis)
+        if self.exactEnergy:
+            energies=self.energyCalculator(phis,self.vPotential,self.lastEnergies)
+        else:
+            energies=complex(0,1)*columnVdot(newPhis,newPhis-phis)/self.totalDeltaTau
+
+        return (
+            newPhis/newNorms,
+            energies.real,
+            abs(energies.imag)/abs(energies.real),
+            newNorms-1,
+            self.totalDeltaTau,
+            sliceNorms,
+        )
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            fallback for the integrators with no batched
+            implementation: one _baseIntegrate per column.
+            Sets lastEnergies if the integrator provides lastEnergy
+        '''
+        newPhis=np.zeros(phis.shape,dtype=complex)
+        lastEnergies=[]
+        for member in range(phis.shape[1]):
+            newPhis[:,member]=self._baseIntegrate(phis[:,member])
+            lastEnergies.append(self.lastEnergy)
+        if any(lastEnergy is None for lastEnergy in lastEnergies):
+            self.lastEnergies=None
+        else:
+            self.lastEnergies=np.array(lastEnergies,dtype=complex)
+        return newPhis
+
+    def _getBatchWorkspace(self,shape):
+        '''
+            RK4 workspace plus 'phi' and 'scratch' buffers for a batch,
+            kept across calls as long as the batch shape does not change
+        '''
+        if self.batchWorkspace is None or self.batchWorkspace['phi'].shape!=shape:
+            self.batchWorkspace=makeRK4Workspace(np.zeros(shape,dtype=complex))
+            self.batchWorkspace['phi']=np.zeros(shape,dtype=complex)
+            self.batchWorkspace['scratch']=np.zeros(shape,dtype=complex)
+        return self.batchWorkspace
+
 class VariablePotSparseRK4Integrator(WFIntegrator):
     '''
         RK4
@@ -89,26 +448,48 @@ class VariablePotSparseRK4Integrator(WFIntegrator):
         applies repeatedly the one-step evolution
         optimised for time-dependent potential:
             the components of the evolution are assembled live
+
+        With preallocate=True (the default) the steps run on a
+        workspace allocated once and reused across frames:
+        the potential is written in place into the diagonal of
+        a copy of the free matrix, so that F[phi] is a single
+        in-place sparse matvec, and the RK4 stages are combined
+        with in-place ufuncs (see utils.kernels).
     '''
-    def __init__(self,**kwargs):
+    stabilityLimit=RK4_STABILITY_LIMIT
+
+    def __init__(self,preallocate=True,**kwargs):
         WFIntegrator.__init__(self,**kwargs)
+        self.preallocate=preallocate
         # calculation of the free-particle dynamics part
-        self.freeMatrix=createEvolutionMatrixF(
-            None,
-            self.wfSizeX,
-            self.wfSizeY,
-            self.deltaLambdaX,
-            self.deltaLambdaY,
-            self.periodicBCX,
-            self.periodicBCY,
-            self.mu
-        )
+        self.freeMatrix=self._freeEvolutionMatrix()
         self.halfDeltaTau=0.5*self.deltaTau
+        if self.preallocate:
+            self._prepareWorkspace()
         #
         self.setPotential(kwargs['vPotential'])
 
+    def _prepareWorkspace(self):
+        '''
+            the full matrix F (free part plus -i*v on the diagonal),
+            with the positions of the diagonal within its data,
+            and the buffers for the in-place RK4
+        '''
+        self.fullMatrix=self.freeMatrix.copy()
+        self.fullMatrix.sort_indices()
+        self.diagonalPositions=diagonalPositions(self.fullMatrix)
+        self.freeDiagonal=self.fullMatrix.data[self.diagonalPositions].copy()
+        self.diagonalBuffer=np.zeros(self.freeDiagonal.shape,dtype=complex)
+        self.workPhi=np.zeros(self.wfSizeX*self.wfSizeY,dtype=complex)
+        self.rk4Workspace=makeRK4Workspace(self.workPhi)
+
     def setPotential(self,vPotential):
         np.copyto(self.vPotential,vPotential)
+        if self.preallocate:
+            np.multiply(self.vPotential,complex(0,-1),out=self.diagonalBuffer)
+            np.add(self.diagonalBuffer,self.freeDiagonal,out=self.diagonalBuffer)
+            self.fullMatrix.data[self.diagonalPositions]=self.diagonalBuffer
+        self._planTimeStep()
 
     def _naiveEvolutionOperator(self,phi):
         '''
@@ -120,6 +501,12 @@ class VariablePotSparseRK4Integrator(WFIntegrator):
             complex(0,1)*self.vPotential*phi
         )
 
+    def _evolutionOperatorInto(self,phi,out):
+        '''
+            in-place counterpart of _naiveEvolutionOperator
+        '''
+        return sparseMatVecInto(self.fullMatrix,phi,out)
+
     def _performSingleRKStep(self,phi):
         '''
             does what the function name says
@@ -139,23 +526,142 @@ class VariablePotSparseRK4Integrator(WFIntegrator):
 
             nSteps is used (even though it should match nIntegrationSteps)
             and the returned elapsedTime accordingly
+
+            In preallocate mode the returned array is the
+            integrator's own buffer, overwritten at the next call
         '''
+        if self.preallocate:
+            np.copyto(self.workPhi,phi)
+            for _ in range(self.nIntegrationSteps):
+                phiDotK1=rk4StepInPlace(
+                    self._evolutionOperatorInto,
+                    self.workPhi,
+                    self.rk4Workspace,
+                    self.deltaTau,
+                )
+            self.lastEnergy=complex(0,1)*phiDotK1
+            return self.workPhi
         #
         newPhi=phi
         for _ in range(self.nIntegrationSteps):
             newPhi=self._performSingleRKStep(newPhi)
         return newPhi
 
+    def _baseIntegrateBatch(self,phis):
+        '''
+            in preallocate mode, the RK4 stages of the whole batch
+            are advanced together: F is a sparse matrix times
+            a (wfSizeX*wfSizeY,K) block
+        '''
+        if not self.preallocate:
+            return WFIntegrator._baseIntegrateBatch(self,phis)
+        workspace=self._getBatchWorkspace(phis.shape)
+        np.copyto(workspace['phi'],phis)
+        for _ in range(self.nIntegrationSteps):
+            phiDotK1=rk4StepInPlace(
+                self._evolutionOperatorInto,
+                workspace['phi'],
+                workspace,
+                self.deltaTau,
+                batch=True,
+            )
+        self.lastEnergies=complex(0,1)*phiDotK1
+        return workspace['phi'].copy()
+
+class DormandPrinceIntegrator(VariablePotSparseRK4Integrator):
+    '''
+        Adaptive RK45 (Dormand-Prince 5(4), embedded error estimate)
+        each frame still covers exactly totalDeltaTau, but the
+        internal step adapts to keep the local error within
+        relTolerance/absTolerance: deltaTau is only the first guess,
+        and each frame starts from the step the previous one ended with.
+        F[phi] is the in-place sparse matvec of the preallocated
+        VariablePotSparseRK4Integrator, with the potential
+        updated in place by setPotential.
+        The step counts of the last frame are in lastAdaptiveInfo,
+        the running totals in adaptiveTotals.
+    '''
+    # the step is chosen by the error control instead
+    stabilityLimit=None
+
+    def __init__(self,relTolerance=1e-6,absTolerance=1e-8,**kwargs):
+        self.relTolerance=relTolerance
+        self.absTolerance=absTolerance
+        VariablePotSparseRK4Integrator.__init__(self,preallocate=True,**kwargs)
+        self.dormandPrinceWorkspace=makeDormandPrinceWorkspace(self.workPhi)
+        self.nextDeltaTau=self.deltaTau
+        self.lastAdaptiveInfo=None
+        self.adaptiveTotals={
+            'frames': 0,
+            'accepted': 0,
+            'rejected': 0,
+        }
+
+    def _baseIntegrate(self,phi):
+        '''
+            one adaptive propagation over totalDeltaTau
+
+            the returned array is the integrator's own
+            buffer, overwritten at the next call
+        '''
+        np.copyto(self.workPhi,phi)
+        self.lastAdaptiveInfo=dormandPrincePropagate(
+            self._evolutionOperatorInto,
+            self.workPhi,
+            self.totalDeltaTau,
+            self.dormandPrinceWorkspace,
+            self.nextDeltaTau,
+            relTolerance=self.relTolerance,
+            absTolerance=self.absTolerance,
+        )
+        self.nextDeltaTau=self.lastAdaptiveInfo['deltaTau']
+        self.adaptiveTotals['frames']+=1
+        self.adaptiveTotals['accepted']+=self.lastAdaptiveInfo['accepted']
+        self.adaptiveTotals['rejected']+=self.lastAdaptiveInfo['rejected']
+        self.lastEnergy=complex(0,1)*self.lastAdaptiveInfo['phiDotF']
+        return self.workPhi
+
+    def _baseIntegrateBatch(self,phis):
+        # each member adapts its own steps
+        return WFIntegrator._baseIntegrateBatch(self,phis)
+
 class SparseMatrixRK4Integrator(WFIntegrator):
     '''
         RK4
         uses sparse matrices
         uses U=(1+H)^n
         does n timesteps at once
+
+        U is built by repeated squaring, pruning after each product
+        the entries below dropTolerance; the stats of the last build
+        (nnz, bytes, errorBound on |U-exact U| in the infinity norm,
+        products) are in evoUInfo. If U would be denser than applying
+        1+H n times (maxNnzRatio*n*nnz(1+H) entries), it is not kept
+        and the frame is done by n sparse matvecs instead (evoU is None).
+
+        setPotential does nothing if the potential did not change,
+        and if it changed on a few sites recomputes only the rows
+        of 1+H and U that can depend on them (see _updateEvoULocally),
+        unless these exceed maxLocalFraction of all rows.
     '''
-    def __init__(self,**kwargs):
+    stabilityLimit=RK4_STABILITY_LIMIT
+    cachedOperatorNames=(
+        'stepMatrixF',
+        'stepDiagonalPositions',
+        'oneStepMatrix',
+        'evoU',
+        'evoUInfo',
+    )
+
+    def __init__(self,dropTolerance=1e-12,maxNnzRatio=1.0,maxLocalFraction=0.5,**kwargs):
         WFIntegrator.__init__(self,**kwargs)
-        self._refreshEvoU()
+        self.dropTolerance=dropTolerance
+        self.maxNnzRatio=maxNnzRatio
+        self.maxLocalFraction=maxLocalFraction
+        self.workPhi=np.zeros(self.wfSizeX*self.wfSizeY,dtype=complex)
+        self.otherWorkPhi=np.zeros(self.wfSizeX*self.wfSizeY,dtype=complex)
+        self.freeDiagonal=self._freeEvolutionMatrix().diagonal()
+        self.setPotential(kwargs['vPotential'])
 
     def _refreshEvoU(self):
         '''
@@ -163,11 +669,21 @@ class SparseMatrixRK4Integrator(WFIntegrator):
                 U = (1+H)^nIntegrationSteps
             such that the nIntSteps evolution is given by
                 phi -> U * phi
+            (or, if too dense, only the one-step 1+H)
         '''
-        # we exploit the fact that csr_matrix has a __pow__ method
-        # so we turn the one-step 1+H into a sparse and then
-        # compute its nIntSteps-th power within the sparseness realm.
-        oneStepMatrixOH=(
+        self.stepMatrixF=csr_matrix(self.deltaTau*createEvolutionMatrixF(
+            self.vPotential,
+            self.wfSizeX,
+            self.wfSizeY,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+            self.periodicBCX,
+            self.periodicBCY,
+            self.mu
+        ))
+        self.stepMatrixF.sort_indices()
+        self.stepDiagonalPositions=diagonalPositions(self.stepMatrixF)
+        self.oneStepMatrix=csr_matrix(
             createRK4StepMatrixH(
                 self.vPotential,
                 self.deltaTau,
@@ -178,168 +694,1214 @@ class SparseMatrixRK4Integrator(WFIntegrator):
                 self.periodicBCX,
                 self.periodicBCY,
                 self.mu
-            )+csr_matrix(np.diag(np.ones(self.wfSizeX*self.wfSizeY)))
+            )+identityMatrix(self.wfSizeX*self.wfSizeY,dtype=complex,format='csr')
+        )
+        self.evoU,self.evoUInfo=prunedMatrixPower(
+            self.oneStepMatrix,
+            self.nIntegrationSteps,
+            dropTolerance=self.dropTolerance,
+            maxNnz=self._maxEvoUNnz(),
+        )
+        self.evoUInfo['updatedRows']=None
+
+    def _operatorParameters(self):
+        return WFIntegrator._operatorParameters(self)+(
+            self.dropTolerance,
+            self.maxNnzRatio,
+        )
+
+    def _maxEvoUNnz(self):
+        return int(self.maxNnzRatio*self.nIntegrationSteps*self.oneStepMatrix.nnz)
+
+    def _updateEvoULocally(self,changedSites):
+        '''
+            after a change of the potential on changedSites only.
+            Row i of 1+H depends on v only within four hops of i,
+            i.e. on the columns in its pattern (which is symmetric),
+            and row i of U=(1+H)^n on the rows of 1+H within n-1 hops
+            of i: those rows are recomputed (U's with prunedRowsOfPower)
+            and swapped in, everything else is kept. Returns False,
+            doing nothing, if the rows of U to recompute are more than
+            maxLocalFraction of all rows (a full build is then cheaper)
+        '''
+        nSites=self.wfSizeX*self.wfSizeY
+        stepRows=reachableRows(self.oneStepMatrix,changedSites,1)
+        if self.evoU is not None:
+            powerRows=reachableRows(
+                self.oneStepMatrix,
+                stepRows,
+                self.nIntegrationSteps-1,
+            )
+            if len(powerRows)>self.maxLocalFraction*nSites:
+                return False
+        # (a copy, as the current one may be shared with operatorCache)
+        self.stepMatrixF=self.stepMatrixF.copy()
+        self.stepMatrixF.data[self.stepDiagonalPositions[changedSites]]=self.deltaTau*(
+            self.freeDiagonal[changedSites]-complex(0,1)*self.vPotential[changedSites]
         )
-        self.evoU=oneStepMatrixOH**self.nIntegrationSteps
+        self.oneStepMatrix=replaceRows(
+            self.oneStepMatrix,
+            stepRows,
+            rk4StepRows(self.stepMatrixF,stepRows),
+        )
+        if self.evoU is not None:
+            newRows,rowsErrorBound=prunedRowsOfPower(
+                self.oneStepMatrix,
+                powerRows,
+                self.nIntegrationSteps,
+                dropTolerance=self.dropTolerance,
+            )
+            evoU=replaceRows(self.evoU,powerRows,newRows)
+            if evoU.nnz>self._maxEvoUNnz():
+                return False
+            self.evoU=evoU
+            self.evoUInfo={
+                'nnz': self.evoU.nnz,
+                'bytes': self.evoU.data.nbytes+self.evoU.indices.nbytes+self.evoU.indptr.nbytes,
+                'errorBound': max(self.evoUInfo['errorBound'],rowsErrorBound),
+                'products': self.nIntegrationSteps-1,
+                'abandoned': False,
+                'updatedRows': len(powerRows),
+            }
+        return True
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
-        self._refreshEvoU()
+        changedSites=self._potentialChanges(vPotential)
+        stepsChanged=self._planTimeStep()
+        if not stepsChanged and changedSites is not None and len(changedSites)==0:
+            return
+        if self._restoreOperators():
+            return
+        if stepsChanged or changedSites is None:
+            self._refreshEvoU()
+        elif not self._updateEvoULocally(changedSites):
+            self._refreshEvoU()
+        self._storeOperators()
 
     def _baseIntegrate(self,phi):
         '''
             NO CHECKS are made whether nSteps matches self.nIntegrationSteps
             (it should!), for the sake of speed
 
-            Given phi and nSteps, a tuple is returned:
-                newPhi, normBias, timeIncrement
+            Without U, the returned array is one of the
+            integrator's own buffers, overwritten at the next call
         '''
-        return self.evoU.dot(phi)
+        if self.evoU is not None:
+            return self.evoU.dot(phi)
+        np.copyto(self.workPhi,phi)
+        for _ in range(self.nIntegrationSteps):
+            sparseMatVecInto(self.oneStepMatrix,self.workPhi,self.otherWorkPhi)
+            self.workPhi,self.otherWorkPhi=self.otherWorkPhi,self.workPhi
+        return self.workPhi
 
+    def _baseIntegrateBatch(self,phis):
+        if self.evoU is not None:
+            return self.evoU.dot(phis)
+        newPhis=phis
+        for _ in range(self.nIntegrationSteps):
+            newPhis=self.oneStepMatrix.dot(newPhis)
+        return newPhis
 
 class RK4StepByStepIntegrator(WFIntegrator):
     '''
         RK4
         does not use matrices
         one timestep at a time (internally, for phi->phi)
+        F[phi] is the in-place stencil evolutionOperatorInto
+        and the stages live in a workspace reused across frames
     '''
+    stabilityLimit=RK4_STABILITY_LIMIT
+
     def __init__(self,**kwargs):
         WFIntegrator.__init__(self,**kwargs)
         self.halfDeltaTau=0.5*self.deltaTau
+        self.workPhi=np.zeros((self.wfSizeX,self.wfSizeY),dtype=complex)
+        self.scratch=np.zeros((self.wfSizeX,self.wfSizeY),dtype=complex)
+        self.rk4Workspace=makeRK4Workspace(self.workPhi)
+        self.setPotential(kwargs['vPotential'])
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
+        self.vPotential2D=self.vPotential.reshape((self.wfSizeX,self.wfSizeY))
+        self._planTimeStep()
 
-    def _performSingleRKStep(self,phi):
-        '''
-            does what the function name says
-            and returns a new phi.
-            No normalisation is performed
-        '''
-        k1 = evolutionOperator(
-            phi.reshape((self.wfSizeX,self.wfSizeY)),
-            self.vPotential.reshape((self.wfSizeX,self.wfSizeY)),
-            self.deltaLambdaX,
-            self.deltaLambdaY,
-            self.kineticFactor,
-            self.periodicBCX,
-            self.periodicBCY,
-            self.wfSizeX,
-            self.wfSizeY,
-        ).reshape((self.wfSizeX*self.wfSizeY))
-        k2 = evolutionOperator(
-            (phi+k1*self.halfDeltaTau).reshape((self.wfSizeX,self.wfSizeY)),
-            self.vPotential.reshape((self.wfSizeX,self.wfSizeY)),
-            self.deltaLambdaX,
-            self.deltaLambdaY,
-            self.kineticFactor,
-            self.periodicBCX,
-            self.periodicBCY,
-            self.wfSizeX,
-            self.wfSizeY,
-        ).reshape((self.wfSizeX*self.wfSizeY))
-        k3=evolutionOperator(
-            (phi+k2*self.halfDeltaTau).reshape((self.wfSizeX,self.wfSizeY)),
-            self.vPotential.reshape((self.wfSizeX,self.wfSizeY)),
-            self.deltaLambdaX,
-            self.deltaLambdaY,
-            self.kineticFactor,
-            self.periodicBCX,
-            self.periodicBCY,
-            self.wfSizeX,
-            self.wfSizeY,
-        ).reshape((self.wfSizeX*self.wfSizeY))
-        k4=evolutionOperator(
-            (phi+self.deltaTau*k3).reshape((self.wfSizeX,self.wfSizeY)),
-            self.vPotential.reshape((self.wfSizeX,self.wfSizeY)),
+    def _evolutionOperatorInto(self,Phi,out):
+        return evolutionOperatorInto(
+            Phi,
+            self.vPotential2D,
             self.deltaLambdaX,
             self.deltaLambdaY,
             self.kineticFactor,
             self.periodicBCX,
             self.periodicBCY,
-            self.wfSizeX,
-            self.wfSizeY,
-        ).reshape((self.wfSizeX*self.wfSizeY))
-        return (phi+self.deltaTau*(k1+2*k2+2*k3+k4)/6.0)
+            out,
+            self.scratch,
+        )
 
     def _baseIntegrate(self,phi):
         '''
             Implements procedural RK4
 
-            nSteps is used (even though it should match nIntegrationSteps)
-            and the returned elapsedTime accordingly
+            the returned array is the integrator's own
+            buffer, overwritten at the next call
         '''
-        newPhi=phi
+        np.copyto(self.workPhi,phi.reshape((self.wfSizeX,self.wfSizeY)))
         for _ in range(self.nIntegrationSteps):
-            newPhi=self._performSingleRKStep(newPhi)
-        return newPhi
+            phiDotK1=rk4StepInPlace(
+                self._evolutionOperatorInto,
+                self.workPhi,
+                self.rk4Workspace,
+                self.deltaTau,
+            )
+        self.lastEnergy=complex(0,1)*phiDotK1
+        return self.workPhi.reshape((self.wfSizeX*self.wfSizeY))
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            the stencil runs on the (wfSizeX,wfSizeY,K) stack
+            of the whole batch at once
+        '''
+        nMembers=phis.shape[1]
+        workspace=self._getBatchWorkspace((self.wfSizeX,self.wfSizeY,nMembers))
+        vPotential3D=self.vPotential2D[:,:,np.newaxis]
+        def _batchEvolutionOperatorInto(Phis,out):
+            return evolutionOperatorInto(
+                Phis,
+                vPotential3D,
+                self.deltaLambdaX,
+                self.deltaLambdaY,
+                self.kineticFactor,
+                self.periodicBCX,
+                self.periodicBCY,
+                out,
+                workspace['scratch'],
+            )
+        np.copyto(workspace['phi'],phis.reshape(workspace['phi'].shape))
+        for _ in range(self.nIntegrationSteps):
+            phiDotK1=rk4StepInPlace(
+                _batchEvolutionOperatorInto,
+                workspace['phi'],
+                workspace,
+                self.deltaTau,
+                batch=True,
+            )
+        self.lastEnergies=complex(0,1)*phiDotK1
+        return workspace['phi'].reshape(phis.shape).copy()
 
 class NaiveFiniteDifferenceIntegrator(WFIntegrator):
     '''
         Naive finite-difference integrator
         uses the simple discretised (adimensional) Schroedinger eq.
         one timestep at a time (internally, for phi->phi)
+        as a vectorised, in-place forward-Euler update
+        on buffers reused across frames
     '''
     def __init__(self,**kwargs):
         WFIntegrator.__init__(self,**kwargs)
-        # not much else to do
+        self.workPhi=np.zeros((self.wfSizeX,self.wfSizeY),dtype=complex)
+        self.deltaPhi=np.zeros((self.wfSizeX,self.wfSizeY),dtype=complex)
+        self.scratch=np.zeros((self.wfSizeX,self.wfSizeY),dtype=complex)
+        self.setPotential(kwargs['vPotential'])
 
     def setPotential(self,vPotential):
         self.vPotential=vPotential
+        self.vPotential2D=self.vPotential.reshape((self.wfSizeX,self.wfSizeY))
 
-    def _performSingleIntegrationStep(self,phi):
+    def _performSingleIntegrationStep(self,Phi):
         '''
-            does what the function name says
-            and returns a new phi, over a single deltaTau.
+            does what the function name says, updating
+            the (wfSizeX,wfSizeY) Phi in place, over a single deltaTau.
             No normalisation is performed
         '''
-        return np.array([
-            p+self.deltaTau*dp
-            for p,dp in zip(
-                phi.reshape((self.wfSizeX,self.wfSizeY)),
-                evolutionOperator(
-                    phi.reshape((self.wfSizeX,self.wfSizeY)),
-                    self.vPotential.reshape((self.wfSizeX,self.wfSizeY)),
-                    self.deltaLambdaX,
-                    self.deltaLambdaY,
-                    self.kineticFactor,
-                    self.periodicBCX,
-                    self.periodicBCY,
-                    self.wfSizeX,
-                    self.wfSizeY,
-                ),
-            )
-        ]).reshape((self.wfSizeX*self.wfSizeY))
+        evolutionOperatorInto(
+            Phi,
+            self.vPotential2D,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+            self.kineticFactor,
+            self.periodicBCX,
+            self.periodicBCY,
+            self.deltaPhi,
+            self.scratch,
+        )
+        np.multiply(self.deltaPhi,self.deltaTau,out=self.deltaPhi)
+        np.add(Phi,self.deltaPhi,out=Phi)
+        return Phi
 
     def _baseIntegrate(self,phi):
         '''
             Implements a simple integration,
             repeated nSteps times.
+
+            the returned array is the integrator's own
+            buffer, overwritten at the next call
         '''
-        newPhi=phi
+        np.copyto(self.workPhi,phi.reshape((self.wfSizeX,self.wfSizeY)))
         for _ in range(self.nIntegrationSteps):
-            newPhi=self._performSingleIntegrationStep(newPhi)
-        return newPhi
+            self._performSingleIntegrationStep(self.workPhi)
+        return self.workPhi.reshape((self.wfSizeX*self.wfSizeY))
 
-def createRK4StepMatrixH(
-    vPotential,
-    deltaTau,
-    deltaLambdaX,
-    deltaLambdaY,
-    wfSizeX,
-    wfSizeY,
-    periodicBCX,
-    periodicBCY,
-    mu
-):
-    '''
-        Creates the matrix H, encoding the whole rk process.
-        H is such that for one deltaTau time step
-            phi -> phi + H*phi
-    '''
-    sF=deltaTau*createEvolutionMatrixF(
-        vPotential,
-        wfSizeX,
+    def _baseIntegrateBatch(self,phis):
+        '''
+            the forward-Euler update on the (wfSizeX,wfSizeY,K)
+            stack of the whole batch at once
+        '''
+        nMembers=phis.shape[1]
+        workspace=self._getBatchWorkspace((self.wfSizeX,self.wfSizeY,nMembers))
+        vPotential3D=self.vPotential2D[:,:,np.newaxis]
+        Phis=workspace['phi']
+        deltaPhis=workspace['k']
+        np.copyto(Phis,phis.reshape(Phis.shape))
+        for _ in range(self.nIntegrationSteps):
+            evolutionOperatorInto(
+                Phis,
+                vPotential3D,
+                self.deltaLambdaX,
+                self.deltaLambdaY,
+                self.kineticFactor,
+                self.periodicBCX,
+                self.periodicBCY,
+                deltaPhis,
+                workspace['scratch'],
+            )
+            np.multiply(deltaPhis,self.deltaTau,out=deltaPhis)
+            np.add(Phis,deltaPhis,out=Phis)
+        return Phis.reshape(phis.shape).copy()
+
+class CrankNicolsonIntegrator(WFIntegrator):
+    '''
+        Crank-Nicolson
+        implicit, unconditionally stable and norm-preserving:
+            (1 - deltaTau*F/2) phi' = (1 + deltaTau*F/2) phi
+        i.e. (1 + i deltaTau H/2) phi' = (1 - i deltaTau H/2) phi.
+        The left-hand matrix is factorised (sparse LU) once
+        for each potential and the factorisation is reused
+        across frames until setPotential is called.
+    '''
+    cachedOperatorNames=('explicitMatrix','implicitLU')
+
+    def __init__(self,**kwargs):
+        WFIntegrator.__init__(self,**kwargs)
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is None or len(changedSites)>0:
+            if not self._restoreOperators():
+                self._refreshFactorisation()
+                self._storeOperators()
+
+    def _refreshFactorisation(self):
+        '''
+            builds the explicit (right-hand) matrix and
+            the LU factorisation of the implicit (left-hand) one
+        '''
+        halfStepF=0.5*self.deltaTau*createEvolutionMatrixF(
+            self.vPotential,
+            self.wfSizeX,
+            self.wfSizeY,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+            self.periodicBCX,
+            self.periodicBCY,
+            self.mu
+        )
+        identity=identityMatrix(self.wfSizeX*self.wfSizeY,dtype=complex,format='csr')
+        self.explicitMatrix=csr_matrix(identity+halfStepF)
+        self.implicitLU=splu(csc_matrix(identity-halfStepF))
+
+    def _baseIntegrate(self,phi):
+        '''
+            nIntegrationSteps CN steps, each a sparse matvec
+            and a solve with the cached factorisation
+        '''
+        newPhi=phi
+        for _ in range(self.nIntegrationSteps):
+            rhs=self._explicitStep(newPhi)
+            # rhs-phi = (deltaTau/2)*F*phi, whence <phi|H|phi> for free
+            self.lastEnergy=complex(0,2)*np.vdot(newPhi,rhs-newPhi)/self.deltaTau
+            newPhi=self._implicitSolve(rhs)
+        return newPhi
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            as _baseIntegrate, with a sparse matrix-matrix
+            product and a multi-column solve per step
+        '''
+        newPhis=phis
+        for _ in range(self.nIntegrationSteps):
+            rhs=self._explicitStep(newPhis)
+            self.lastEnergies=complex(0,2)*columnVdot(newPhis,rhs-newPhis)/self.deltaTau
+            newPhis=self._implicitSolve(rhs)
+        return newPhis
+
+    def _explicitStep(self,phi):
+        '''
+            (1 + deltaTau*F/2) phi, also for a batch
+        '''
+        return self.explicitMatrix.dot(phi)
+
+    def _implicitSolve(self,rhs):
+        '''
+            (1 - deltaTau*F/2)^-1 rhs, also for a batch
+        '''
+        return self.implicitLU.solve(rhs)
+
+class WoodburyCrankNicolsonIntegrator(CrankNicolsonIntegrator):
+    '''
+        Crank-Nicolson for a potential differing from a fixed
+        background (e.g. the walls, with the moving pads on top)
+        only on a few sites. The matrices are built and factorised
+        once, for the background potential (basePotential, by default
+        the potential given at construction). The current potential
+        is the background plus a correction dV on the set S of sites
+        where |dV|>correctionThreshold, so the implicit matrix is
+            A = A0 + P diag(c) P^T,   c = i*deltaTau*dV_S/2
+        (P the columns of the identity on S), and each solve uses
+        the Sherman-Morrison-Woodbury formula
+            A^-1 b = y - Z diag(c) K^-1 y_S,
+            y = A0^-1 b,   Z = A0^-1 P,   K = 1 + Z_S diag(c).
+        The columns of Z (wfSizeX*wfSizeY complex entries each) are
+        kept in an LRU cache within maxCachedBytes (a pad moving by
+        a few sites reuses most of them): a setPotential solves with
+        A0 only for the columns missing, assembles Z diag(c) and
+        factorises the small capacitance matrix K, and each solve
+        adds to that with A0 a product with Z diag(c). Both are
+        O(wfSizeX*wfSizeY*|S|): far cheaper than a factorisation
+        while |S| is a small part of the grid, but not independent
+        of its size. Past maxCorrectionSites sites, the current
+        implicit matrix is factorised in full as in
+        CrankNicolsonIntegrator. The counts of cached/solved columns
+        and of the full factorisations, and the bytes of the cached
+        columns, are in woodburyInfo.
+    '''
+    def __init__(
+        self,
+        basePotential=None,
+        correctionThreshold=0.0,
+        maxCorrectionSites=1500,
+        maxCachedBytes=64*2**20,
+        **kwargs
+    ):
+        WFIntegrator.__init__(self,**kwargs)
+        self.correctionThreshold=correctionThreshold
+        self.maxCorrectionSites=maxCorrectionSites
+        self.maxCachedBytes=maxCachedBytes
+        self.basePotential=np.array(
+            kwargs['vPotential'] if basePotential is None else basePotential,
+            dtype=float,
+        )
+        self.vPotential=self.basePotential
+        self._refreshFactorisation()
+        self.baseExplicitMatrix=self.explicitMatrix
+        self.baseLU=self.implicitLU
+        self.correctionColumns=OrderedDict()
+        self.cachedColumnBytes=0
+        self.correctionSites=None
+        self.woodburyInfo={
+            'correctionSites': None,
+            'columnHits': 0,
+            'columnMisses': 0,
+            'fullFactorisations': 0,
+            'cachedBytes': 0,
+        }
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is not None and len(changedSites)==0:
+            return
+        potentialCorrection=self.vPotential-self.basePotential
+        correctionSites=np.flatnonzero(abs(potentialCorrection)>self.correctionThreshold)
+        self.woodburyInfo['correctionSites']=len(correctionSites)
+        if len(correctionSites)>self.maxCorrectionSites:
+            self.correctionSites=None
+            self._refreshFactorisation()
+            self.woodburyInfo['fullFactorisations']+=1
+            return
+        self.correctionSites=correctionSites
+        halfStepCorrection=complex(0,0.5*self.deltaTau)*potentialCorrection[correctionSites]
+        # the explicit side is diagonal in the correction: (1 - c) on S
+        self.explicitCorrection=-halfStepCorrection
+        self.correctionZC=self._correctionColumns(correctionSites)*halfStepCorrection
+        if len(correctionSites)>0:
+            self.capacitanceLU=lu_factor(
+                np.identity(len(correctionSites))+self.correctionZC[correctionSites]
+            )
+
+    def _correctionColumns(self,sites):
+        '''
+            the (wfSizeX*wfSizeY,len(sites)) array Z of the
+            columns A0^-1 e_k for k in sites, solving (all together)
+            only those not in the LRU cache (trimmed afterwards
+            to maxCachedBytes, least recently used first)
+        '''
+        missingSites=[site for site in sites if site not in self.correctionColumns]
+        if len(missingSites)>0:
+            unitVectors=np.zeros((self.wfSizeX*self.wfSizeY,len(missingSites)),dtype=complex)
+            unitVectors[missingSites,np.arange(len(missingSites))]=1
+            solvedColumns=self.baseLU.solve(unitVectors)
+            for columnIndex,site in enumerate(missingSites):
+                self.correctionColumns[site]=solvedColumns[:,columnIndex].copy()
+                self.cachedColumnBytes+=self.correctionColumns[site].nbytes
+        self.woodburyInfo['columnMisses']+=len(missingSites)
+        self.woodburyInfo['columnHits']+=len(sites)-len(missingSites)
+        columns=np.zeros((self.wfSizeX*self.wfSizeY,len(sites)),dtype=complex)
+        for columnIndex,site in enumerate(sites):
+            self.correctionColumns.move_to_end(site)
+            columns[:,columnIndex]=self.correctionColumns[site]
+        while self.cachedColumnBytes>self.maxCachedBytes:
+            _,evictedColumn=self.correctionColumns.popitem(last=False)
+            self.cachedColumnBytes-=evictedColumn.nbytes
+        self.woodburyInfo['cachedBytes']=self.cachedColumnBytes
+        return columns
+
+    def _explicitStep(self,phi):
+        if self.correctionSites is None:
+            return self.explicitMatrix.dot(phi)
+        rhs=self.baseExplicitMatrix.dot(phi)
+        if phi.ndim==1:
+            rhs[self.correctionSites]+=self.explicitCorrection*phi[self.correctionSites]
+        else:
+            rhs[self.correctionSites]+=self.explicitCorrection[:,None]*phi[self.correctionSites]
+        return rhs
+
+    def _implicitSolve(self,rhs):
+        if self.correctionSites is None:
+            return self.implicitLU.solve(rhs)
+        newPhi=self.baseLU.solve(rhs)
+        if len(self.correctionSites)>0:
+            newPhi-=self.correctionZC.dot(
+                lu_solve(self.capacitanceLU,newPhi[self.correctionSites])
+            )
+        return newPhi
+
+class ADIIntegrator(WFIntegrator):
+    '''
+        Peaceman-Rachford alternating-direction implicit
+        splits H=Hx~+Hy~, with Hx~=Hx+v/2 and Hy~=Hy+v/2, and does
+            (1 + i deltaTau Hx~/2) phi* = (1 - i deltaTau Hy~/2) phi
+            (1 + i deltaTau Hy~/2) phi' = (1 - i deltaTau Hx~/2) phi*
+        The implicit halves are batches of independent tridiagonal
+        systems (cyclic, as the couplings of createKineticMatricesXY
+        wrap around each line), one per line and all solved together:
+        a step costs O(Nx*Ny) and so does a setPotential.
+    '''
+    def __init__(self,**kwargs):
+        WFIntegrator.__init__(self,**kwargs)
+        kinPartX,kinPartY=createKineticMatricesXY(
+            self.wfSizeX,
+            self.wfSizeY,
+            self.periodicBCX,
+            self.periodicBCY,
+        )
+        self.kinFactorX=self.kineticFactor/(self.deltaLambdaX**2)
+        self.kinFactorY=self.kineticFactor/(self.deltaLambdaY**2)
+        self.hKinX=self.kinFactorX*kinPartX
+        self.hKinY=self.kinFactorY*kinPartY
+        # coupling strength along each line of the sweeps
+        self.lineMaskX=createLineMask(self.wfSizeY,self.periodicBCX)
+        self.lineMaskY=createLineMask(self.wfSizeX,self.periodicBCY)
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is not None and len(changedSites)==0:
+            return
+        halfStep=complex(0,0.5*self.deltaTau)
+        identity=identityMatrix(self.wfSizeX*self.wfSizeY,dtype=complex,format='csr')
+        halfPot=diags(0.5*self.vPotential)
+        self.explicitX=csr_matrix(identity-halfStep*(self.hKinX+halfPot))
+        self.explicitY=csr_matrix(identity-halfStep*(self.hKinY+halfPot))
+        #
+        halfPot2D=0.5*self.vPotential.reshape((self.wfSizeX,self.wfSizeY))
+        # X sweeps: systems along x (axis 0), one per y
+        self.factorsX=self._factoriseSweep(
+            1+halfStep*(2*self.kinFactorX+halfPot2D),
+            -halfStep*self.kinFactorX*self.lineMaskX,
+        )
+        # Y sweeps: systems along y, one per x (on transposed arrays)
+        self.factorsY=self._factoriseSweep(
+            1+halfStep*(2*self.kinFactorY+halfPot2D.transpose()),
+            -halfStep*self.kinFactorY*self.lineMaskY,
+        )
+
+    def _factoriseSweep(self,diagonal,lineCoupling):
+        '''
+            diagonal: (lineLength,nLines), lineCoupling: (nLines,)
+        '''
+        offDiagonal=np.broadcast_to(lineCoupling,diagonal.shape)
+        if diagonal.shape[0]>=3:
+            corners=lineCoupling
+        else:
+            corners=np.zeros(lineCoupling.shape)
+        return factoriseCyclicTridiagonalBatch(
+            offDiagonal,
+            diagonal,
+            offDiagonal,
+            corners,
+            corners,
+        )
+
+    def _baseIntegrate(self,phi):
+        newPhi=phi
+        for _ in range(self.nIntegrationSteps):
+            halfPhi=solveCyclicTridiagonalBatch(
+                self.factorsX,
+                self.explicitY.dot(newPhi).reshape((self.wfSizeX,self.wfSizeY)),
+            )
+            newPhiT=solveCyclicTridiagonalBatch(
+                self.factorsY,
+                self.explicitX.dot(
+                    halfPhi.reshape((self.wfSizeX*self.wfSizeY))
+                ).reshape((self.wfSizeX,self.wfSizeY)).transpose(),
+            )
+            newPhi=newPhiT.transpose().reshape((self.wfSizeX*self.wfSizeY))
+        return newPhi
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            as _baseIntegrate, the members of the batch
+            adding a trailing axis to the line systems
+        '''
+        batchShape=(self.wfSizeX,self.wfSizeY,phis.shape[1])
+        newPhis=phis
+        for _ in range(self.nIntegrationSteps):
+            halfPhis=solveCyclicTridiagonalBatch(
+                self.factorsX,
+                self.explicitY.dot(newPhis).reshape(batchShape),
+            )
+            newPhisT=solveCyclicTridiagonalBatch(
+                self.factorsY,
+                self.explicitX.dot(
+                    halfPhis.reshape(phis.shape)
+                ).reshape(batchShape).transpose((1,0,2)),
+            )
+            newPhis=newPhisT.transpose((1,0,2)).reshape(phis.shape)
+        return newPhis
+
+class KrylovIntegrator(WFIntegrator):
+    '''
+        Krylov (Lanczos) exponential propagator
+        advances phi by the whole totalDeltaTau in one go:
+            phi -> exp(F*totalDeltaTau) phi = exp(-i H totalDeltaTau) phi
+        in a Krylov subspace of H=iF whose size adapts to reach
+        krylovTolerance (relative); if maxKrylovDim is not enough,
+        the frame is covered in a few substeps.
+        Only H (sparse, as built by createEvolutionMatrixF) and
+        the Krylov basis are stored: no matrix powers.
+        The details of the last call are in lastKrylovInfo.
+        Each wavefunction has its own Krylov subspace, so batches
+        go through the column-by-column fallback.
+    '''
+    def __init__(self,krylovTolerance=1e-10,maxKrylovDim=30,**kwargs):
+        WFIntegrator.__init__(self,**kwargs)
+        self.krylovTolerance=krylovTolerance
+        self.maxKrylovDim=maxKrylovDim
+        self.lastKrylovInfo=None
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        self._updateHMatrix(self._potentialChanges(vPotential))
+
+    def _baseIntegrate(self,phi):
+        newPhi,self.lastKrylovInfo=lanczosPropagate(
+            self.hMatrix,
+            phi,
+            self.totalDeltaTau,
+            tolerance=self.krylovTolerance,
+            maxKrylovDim=self.maxKrylovDim,
+        )
+        self.lastEnergy=self.lastKrylovInfo['energy']
+        return newPhi
+
+class ChebyshevIntegrator(WFIntegrator):
+    '''
+        Chebyshev global propagator (for static potentials)
+        the spectral bounds of H=iF are estimated once per potential
+        (Gershgorin) and the Bessel coefficients of the expansion of
+        exp(-i H totalDeltaTau) precomputed: each frame is then a fixed
+        number of sparse matvecs (matvecsPerFrame) at about machine
+        precision, to compare with 4*nIntegrationSteps for the RK4.
+    '''
+    def __init__(self,chebyshevTolerance=1e-15,**kwargs):
+        WFIntegrator.__init__(self,**kwargs)
+        self.chebyshevTolerance=chebyshevTolerance
+        self.spectralBounds=None
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        if not self._updateHMatrix(self._potentialChanges(vPotential)):
+            return
+        spectralBounds=gershgorinBounds(self.hMatrix)
+        if spectralBounds==self.spectralBounds:
+            return
+        self.spectralBounds=spectralBounds
+        (
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )=chebyshevCoefficients(
+            self.spectralBounds[0],
+            self.spectralBounds[1],
+            self.totalDeltaTau,
+            tolerance=self.chebyshevTolerance,
+        )
+        self.matvecsPerFrame=max(1,len(self.chebyshevCoefficients)-1)
+
+    def _baseIntegrate(self,phi):
+        newPhi,info=chebyshevPropagate(
+            self.hMatrix,
+            phi,
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )
+        self.lastEnergy=info['energy']
+        return newPhi
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            the Chebyshev recurrence with sparse matrix-matrix products
+        '''
+        newPhis,info=chebyshevPropagate(
+            self.hMatrix,
+            phis,
+            self.chebyshevCentre,
+            self.chebyshevHalfWidth,
+            self.chebyshevCoefficients,
+        )
+        self.lastEnergies=info['energy']
+        return newPhis
+
+class SplitOperatorIntegrator(WFIntegrator):
+    '''
+        Split-operator (unitary)
+        the kinetic step is a phase multiplication in the
+        spectral basis of the kinetic term (see SpectralBasis),
+        the potential step a diagonal phase in position space.
+            order=2: Strang splitting V/2 T V/2
+            order=4: Yoshida composition of three Strang steps
+        The phase arrays are precomputed, the potential ones
+        at each setPotential; consecutive potential half-steps
+        are merged, so a frame costs about one forward and one
+        backward transform per (Strang) step.
+        With fixed BC in either direction the kinetic term is NOT
+        that of the matrix integrators (createEvolutionMatrixF):
+        the DST-I gives a hard-wall box, while createKineticMatricesXY
+        keeps the cyclic couplings and drops them on the first and
+        last lines only. The two agree for a phi vanishing near the
+        edges; otherwise phi, the energies and the observables
+        differ from those of the RK4 integrators.
+    '''
+    cachedOperatorNames=('potPhases',)
+
+    def __init__(self,order=2,**kwargs):
+        WFIntegrator.__init__(self,**kwargs)
+        self.order=order
+        self.basis=SpectralBasis(
+            self.wfSizeX,
+            self.wfSizeY,
+            self.periodicBCX,
+            self.periodicBCY,
+            self.deltaLambdaX,
+            self.deltaLambdaY,
+        )
+        self.kinEnergy=self.kineticFactor*self.basis.kinEigenvalues
+        self.stages=makeSplitOperatorStages(self.order,self.nIntegrationSteps)
+        self.kinPhases={
+            coef: np.exp(complex(0,-1)*coef*self.deltaTau*self.kinEnergy)
+            for kind,coef in self.stages
+            if kind=='T'
+        }
+        self.setPotential(kwargs['vPotential'])
+
+    def setPotential(self,vPotential):
+        self.vPotential=vPotential
+        changedSites=self._potentialChanges(vPotential)
+        if changedSites is not None and len(changedSites)==0:
+            return
+        if self._restoreOperators():
+            return
+        if changedSites is None:
+            pot2D=self.vPotential.reshape((self.wfSizeX,self.wfSizeY))
+            self.potPhases={
+                coef: np.exp(complex(0,-1)*coef*self.deltaTau*pot2D)
+                for kind,coef in self.stages
+                if kind=='V'
+            }
+        else:
+            # only the phases at the sites that changed (on copies
+            # if the current ones may be shared with operatorCache)
+            if self.operatorCache is not None:
+                self.potPhases={
+                    coef: potPhase.copy()
+                    for coef,potPhase in self.potPhases.items()
+                }
+            for coef,potPhase in self.potPhases.items():
+                potPhase.reshape(-1)[changedSites]=np.exp(
+                    complex(0,-1)*coef*self.deltaTau*self.vPotential[changedSites]
+                )
+        self._storeOperators()
+
+    def _operatorParameters(self):
+        return WFIntegrator._operatorParameters(self)+(self.order,)
+
+    def _spectralEnergy(self,Phi):
+        '''
+            <phi|H|phi> (not normalised, as lastEnergy for the
+            RK integrators), kinetic part evaluated in the spectral basis.
+            For a (K,wfSizeX,wfSizeY) batch, an array of K energies
+        '''
+        kinPart=self.basis.parsevalFactor*(
+            mod2(self.basis.forward(Phi))*self.kinEnergy
+        ).sum(axis=(-2,-1))
+        potPart=(
+            mod2(Phi)*self.vPotential.reshape((self.wfSizeX,self.wfSizeY))
+        ).sum(axis=(-2,-1))
+        if Phi.ndim==2:
+            return complex(kinPart+potPart)
+        else:
+            return (kinPart+potPart).astype(complex)
+
+    def _runStages(self,Phi):
+        '''
+            runs the precomputed sequence of stages
+            covering nIntegrationSteps steps of deltaTau
+            on Phi, (wfSizeX,wfSizeY) or a (K,wfSizeX,wfSizeY) batch
+            (the phases broadcast over the members)
+        '''
+        for kind,coef in self.stages:
+            if kind=='V':
+                Phi*=self.potPhases[coef]
+            else:
+                PhiK=self.basis.forward(Phi)
+                PhiK*=self.kinPhases[coef]
+                Phi=self.basis.backward(PhiK)
+        return Phi
+
+    def _baseIntegrate(self,phi):
+        Phi=self._runStages(phi.reshape((self.wfSizeX,self.wfSizeY)).copy())
+        self.lastEnergy=self._spectralEnergy(Phi)
+        return Phi.reshape((self.wfSizeX*self.wfSizeY))
+
+    def _baseIntegrateBatch(self,phis):
+        '''
+            the whole batch goes through each (batched) transform,
+            with the members along the leading axis so that
+            each transform runs on contiguous grids
+        '''
+        Phis=self._runStages(
+            phis.transpose().reshape((phis.shape[1],self.wfSizeX,self.wfSizeY)).copy()
+        )
+        self.lastEnergies=self._spectralEnergy(Phis)
+        return Phis.reshape((phis.shape[1],phis.shape[0])).transpose()
+
+class OperatorCache():
+    '''
+        LRU cache of the operators built by the integrators,
+        keyed by operatorFingerprint of potential and parameters.
+        The entries (maps name -> operator) are kept within a
+        budget of maxBytes (as estimated by operatorBytes), evicting
+        the least recently used ones; an entry alone exceeding the
+        budget is not stored. The hits, misses and evictions are
+        counted (see stats).
+    '''
+    def __init__(self,maxBytes=256*2**20):
+        self.maxBytes=maxBytes
+        self.entries=OrderedDict()
+        self.totalBytes=0
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    def get(self,key):
+        '''
+            the entry for key (marked as most recently used), or None
+        '''
+        if key in self.entries:
+            self.hits+=1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        else:
+            self.misses+=1
+            return None
+
+    def put(self,key,operators):
+        entryBytes=operatorBytes(operators)
+        if key in self.entries:
+            self.totalBytes-=self.entries.pop(key)[1]
+        if entryBytes>self.maxBytes:
+            return
+        while self.totalBytes+entryBytes>self.maxBytes:
+            _,(_,evictedBytes)=self.entries.popitem(last=False)
+            self.totalBytes-=evictedBytes
+            self.evictions+=1
+        self.entries[key]=(operators,entryBytes)
+        self.totalBytes+=entryBytes
+
+    def clear(self):
+        self.entries.clear()
+        self.totalBytes=0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.totalBytes,
+        }
+
+def operatorFingerprint(vPotential,parameters):
+    '''
+        a short digest of the potential (its exact bytes)
+        and of the parameters (their repr)
+    '''
+    digest=hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(vPotential,dtype=float).tobytes())
+    digest.update(repr(parameters).encode())
+    return digest.hexdigest()
+
+def operatorBytes(operator):
+    '''
+        estimated memory of an operator: arrays, sparse matrices,
+        sparse LU factorisations and containers of these
+    '''
+    if isinstance(operator,np.ndarray):
+        return operator.nbytes
+    elif isinstance(operator,dict):
+        return sum(operatorBytes(value) for value in operator.values())
+    elif isinstance(operator,(list,tuple)):
+        return sum(operatorBytes(value) for value in operator)
+    elif hasattr(operator,'indptr'):
+        return operator.data.nbytes+operator.indices.nbytes+operator.indptr.nbytes
+    elif hasattr(operator,'perm_r'):
+        # from the factorisation's own counts: reading .L, .U would
+        # build csc copies of the factors. The factorisations here
+        # are complex (of identity-F*dt/2), indices are SuperLU's ints;
+        # each factor has one column pointer per column, plus one
+        indexSize=operator.perm_r.itemsize
+        return (
+            operator.nnz*(np.dtype(complex).itemsize+indexSize)
+            +2*(operator.shape[1]+1)*indexSize
+            +operator.perm_r.nbytes+operator.perm_c.nbytes
+        )
+    else:
+        return 0
+
+class SpectralBasis():
+    '''
+        the transforms diagonalising the kinetic term, direction by direction:
+            periodic BC: the FFT (plane waves on the ring)
+            fixed BC:    the DST-I (sine waves vanishing just outside the grid,
+                         i.e. a hard-wall box: not the fixed-BC operator
+                         of createKineticMatricesXY, see SplitOperatorIntegrator)
+        The eigenvalues of the second differences (kinPartX/dLX^2+kinPartY/dLY^2)
+        are precomputed on the [kx][ky] grid matching forward().
+        The transforms act on the last two axes, any leading
+        axis running over the members of a batch.
+        Transforms are unnormalised forward and normalised backward,
+        so that backward(forward(phi))=phi and
+            sum(mod2(phi)) = parsevalFactor*sum(mod2(forward(phi)))
+    '''
+    def __init__(self,wfSizeX,wfSizeY,periodicBCX,periodicBCY,deltaLambdaX,deltaLambdaY):
+        self.wfSizeX=wfSizeX
+        self.wfSizeY=wfSizeY
+        self.periodicBCs=(periodicBCX,periodicBCY)
+        eigenX=_axisKinEigenvalues(wfSizeX,periodicBCX)/(deltaLambdaX**2)
+        eigenY=_axisKinEigenvalues(wfSizeY,periodicBCY)/(deltaLambdaY**2)
+        self.kinEigenvalues=eigenX[:,np.newaxis]+eigenY[np.newaxis,:]
+        self.parsevalFactor=1.0
+        for size,periodicBC in zip((wfSizeX,wfSizeY),self.periodicBCs):
+            self.parsevalFactor/=(size if periodicBC else 2*(size+1))
+
+    def forward(self,Phi,out=None):
+        '''
+            the transform of Phi, into out if given (a complex
+            array of the shape of Phi, possibly Phi itself): the FFT
+            axes then write into it, only the DST axes allocate
+        '''
+        return self._transform(Phi,out,False)
+
+    def backward(self,PhiK,out=None):
+        '''
+            the inverse of forward, into out as for forward
+        '''
+        return self._transform(PhiK,out,True)
+
+    def _transform(self,Phi,out,inverse):
+        # axis by axis: numpy's multi-axis inverse FFT
+        # does not reliably fill a given out array
+        fftOut=out if FFT_INTO else None
+        for axis,periodicBC in zip((-2,-1),self.periodicBCs):
+            if periodicBC:
+                if inverse:
+                    Phi=np.fft.ifft(Phi,axis=axis,out=fftOut)
+                else:
+                    Phi=np.fft.fft(Phi,axis=axis,out=fftOut)
+            else:
+                Phi=dst(Phi,type=1,axis=axis)
+                if inverse:
+                    Phi/=2*(Phi.shape[axis]+1)
+        if out is not None and Phi is not out:
+            np.copyto(out,Phi)
+            return out
+        return Phi
+
+class SpectralFilter():
+    '''
+        low-pass filter in the spectral basis of the kinetic term
+        (see SpectralBasis): phi -> backward(mask*forward(phi)), the
+        mask (spectralFilterMask, cached) removing the grid-scale modes
+        only, with a raised-cosine roll-off. The fractions of the norm
+        and the energy it removed are in lastFilterInfo
+        (the potential part of the energy only if it is given).
+        The transforms keep their plans across calls (pocketfft) and,
+        along the periodic directions, write into a k-space buffer
+        kept with the moduli, the sums being dot products against
+        the mask: the result is written back into phi, and only the
+        DST of the fixed directions allocates. With fixed BCs the
+        DST-I is fastest when wfSize+1 has only small prime factors
+        (e.g. 63, 127, 255 rather than 64, 128, 256)
+    '''
+    def __init__(
+        self,
+        wfSizeX,
+        wfSizeY,
+        periodicBCX,
+        periodicBCY,
+        deltaLambdaX,
+        deltaLambdaY,
+        mu,
+        cutoff=0.8,
+        rollOff=0.1,
+    ):
+        self.wfSizeX=wfSizeX
+        self.wfSizeY=wfSizeY
+        self.basis=SpectralBasis(
+            wfSizeX,
+            wfSizeY,
+            periodicBCX,
+            periodicBCY,
+            deltaLambdaX,
+            deltaLambdaY,
+        )
+        self.kinEnergy=(-1.0/(2.0*float(mu)))*self.basis.kinEigenvalues
+        self.mask=spectralFilterMask(
+            wfSizeX,
+            wfSizeY,
+            periodicBCX,
+            periodicBCY,
+            cutoff,
+            rollOff,
+        )
+        self.mask2=self.mask**2
+        self.mask2KinEnergy=self.mask2*self.kinEnergy
+        # complex, as a real factor would be cast through a buffer
+        self.complexMask=self.mask.astype(complex)
+        self.PhiK=np.zeros((wfSizeX,wfSizeY),dtype=complex)
+        self.mod2PhiK=np.zeros((wfSizeX,wfSizeY))
+        self.mod2Phi=np.zeros((wfSizeX,wfSizeY))
+        self.mod2Work=np.zeros((wfSizeX,wfSizeY))
+        self.lastFilterInfo=None
+
+    def filterInPlace(self,phi,vPotential=None):
+        '''
+            phi, a contiguous (wfSizeX*wfSizeY) complex array, is
+            overwritten with its filtered version and returned.
+            lastFilterInfo gets 'normRemoved' (the fraction of
+            <phi|phi> removed) and 'energyRemoved', <H> before
+            minus <H> after (both per unit norm)
+        '''
+        Phi=phi.reshape((self.wfSizeX,self.wfSizeY))
+        PhiK=self.basis.forward(Phi,out=self.PhiK)
+        mod2Into(PhiK,self.mod2PhiK,self.mod2Work)
+        normBefore=self.mod2PhiK.sum()
+        normAfter=np.vdot(self.mod2PhiK,self.mask2)
+        energyBefore=np.vdot(self.mod2PhiK,self.kinEnergy)/normBefore
+        energyAfter=np.vdot(self.mod2PhiK,self.mask2KinEnergy)/normAfter
+        if vPotential is not None:
+            mod2Into(Phi,self.mod2Phi,self.mod2Work)
+            energyBefore+=np.vdot(self.mod2Phi,vPotential)/(self.basis.parsevalFactor*normBefore)
+        np.multiply(PhiK,self.complexMask,out=PhiK)
+        self.basis.backward(PhiK,out=Phi)
+        if vPotential is not None:
+            mod2Into(Phi,self.mod2Phi,self.mod2Work)
+            energyAfter+=np.vdot(self.mod2Phi,vPotential)/(self.basis.parsevalFactor*normAfter)
+        self.lastFilterInfo={
+            'normRemoved': 1-normAfter/normBefore,
+            'energyRemoved': energyBefore-energyAfter,
+        }
+        return phi
+
+    def smoothInPlace(self,phi):
+        '''
+            same interface as StencilSmoother
+            (no potential: only the kinetic energy is accounted)
+        '''
+        return self.filterInPlace(phi)
+
+@lru_cache(maxsize=16)
+def spectralFilterMask(wfSizeX,wfSizeY,periodicBCX,periodicBCY,cutoff,rollOff):
+    '''
+        the [kx][ky] mask (matching SpectralBasis.forward) of the
+        spectral filter: a product of one factor per direction, in
+        terms of the fraction q of the largest (grid-scale) frequency,
+            1                                 for q <= cutoff
+            (1+cos(pi*(q-cutoff)/rollOff))/2  for cutoff < q < cutoff+rollOff
+            0                                 beyond
+        (read-only, as it is shared)
+    '''
+    def axisFactor(size,periodicBC):
+        # 2-2cos(theta) are the eigenvalues, theta in [0,pi]
+        q=np.arccos(1-_axisKinEigenvalues(size,periodicBC)/2)/np.pi
+        if rollOff>0:
+            rolled=np.clip((q-cutoff)/rollOff,0,1)
+            return 0.5*(1+np.cos(np.pi*rolled))
+        else:
+            return (q<=cutoff).astype(float)
+    mask=axisFactor(wfSizeX,periodicBCX)[:,np.newaxis]*axisFactor(wfSizeY,periodicBCY)[np.newaxis,:]
+    mask.flags.writeable=False
+    return mask
+
+def _axisKinEigenvalues(size,periodicBC):
+    '''
+        eigenvalues of the 1D (2,-1,-1) second differences,
+        in the index order of the corresponding transform
+    '''
+    if periodicBC:
+        return 2-2*np.cos(2*np.pi*np.arange(size)/size)
+    else:
+        return 2-2*np.cos(np.pi*np.arange(1,size+1)/(size+1))
+
+# Yoshida weights for the 4th-order composition of 2nd-order steps
+YOSHIDA_W1=1.0/(2.0-2.0**(1.0/3.0))
+YOSHIDA_W0=-(2.0**(1.0/3.0))/(2.0-2.0**(1.0/3.0))
+def makeSplitOperatorStages(order,nSteps):
+    '''
+        the sequence of (kind, coefficient) stages, kind being 'V' or 'T',
+        for nSteps steps of the split-operator scheme of the given order.
+        Coefficients are in units of deltaTau; adjacent potential stages
+        are merged into one.
+    '''
+    if order==2:
+        weights=[1.0]
+    elif order==4:
+        weights=[YOSHIDA_W1,YOSHIDA_W0,YOSHIDA_W1]
+    else:
+        raise ValueError('Split-operator order must be 2 or 4, not %s' % order)
+    stages=[]
+    for _ in range(nSteps):
+        for w in weights:
+            for kind,coef in [('V',0.5*w),('T',w),('V',0.5*w)]:
+                if kind=='V' and stages and stages[-1][0]=='V':
+                    stages[-1]=('V',stages[-1][1]+coef)
+                else:
+                    stages.append((kind,coef))
+    return stages
+
+def factoriseCyclicTridiagonalBatch(lower,diagonal,upper,cornerLow,cornerHigh):
+    '''
+        prepares the solution of a batch of cyclic tridiagonal systems,
+        one per column of the (n,nSystems) arrays:
+            lower[i]    = A[i,i-1]   (lower[0] unused)
+            diagonal[i] = A[i,i]
+            upper[i]    = A[i,i+1]   (upper[n-1] unused)
+            cornerLow   = A[n-1,0]   (one per system)
+            cornerHigh  = A[0,n-1]   (one per system)
+        The corners are handled by Sherman-Morrison on top of a plain
+        Thomas elimination, whose coefficients are precomputed here
+        together with the (right-hand-side independent) correction vector.
+        Zero corners (plain tridiagonal systems) are fine.
+        Returns a dict for solveCyclicTridiagonalBatch.
+    '''
+    n=diagonal.shape[0]
+    gamma=-diagonal[0]
+    modDiagonal=np.array(diagonal,dtype=complex)
+    modDiagonal[0]-=gamma
+    modDiagonal[n-1]-=cornerLow*cornerHigh/gamma
+    invDenominators=np.empty(diagonal.shape,dtype=complex)
+    upperPrimes=np.zeros(diagonal.shape,dtype=complex)
+    invDenominators[0]=1.0/modDiagonal[0]
+    upperPrimes[0]=upper[0]*invDenominators[0]
+    for i in range(1,n):
+        invDenominators[i]=1.0/(modDiagonal[i]-lower[i]*upperPrimes[i-1])
+        if i<n-1:
+            upperPrimes[i]=upper[i]*invDenominators[i]
+    factors={
+        'lower': lower,
+        'invDenominators': invDenominators,
+        'upperPrimes': upperPrimes,
+    }
+    # the Sherman-Morrison correction u=(gamma,0,...,0,cornerLow)
+    uVector=np.zeros(diagonal.shape,dtype=complex)
+    uVector[0]=gamma
+    uVector[n-1]=cornerLow
+    factors['zVector']=_thomasSolve(factors,uVector)
+    factors['vLastFactor']=cornerHigh/gamma
+    factors['smDenominators']=1+factors['zVector'][0]+factors['vLastFactor']*factors['zVector'][n-1]
+    return factors
+
+def solveCyclicTridiagonalBatch(factors,rhs):
+    '''
+        solves the batch of systems prepared by
+        factoriseCyclicTridiagonalBatch for the (n,nSystems) rhs,
+        or for several right-hand sides per system
+        stacked along further trailing axes of rhs
+    '''
+    sol=_thomasSolve(factors,rhs)
+    extraAxes=(Ellipsis,)+(np.newaxis,)*(rhs.ndim-2)
+    correction=(
+        (sol[0]+factors['vLastFactor'][extraAxes]*sol[-1])/
+        factors['smDenominators'][extraAxes]
+    )
+    sol-=correction*factors['zVector'][extraAxes]
+    return sol
+
+def _thomasSolve(factors,rhs):
+    '''
+        plain (non-cyclic) tridiagonal solve, vectorised
+        across the systems (and the trailing axes of rhs,
+        if any), with precomputed coefficients
+    '''
+    extraAxes=(Ellipsis,)+(np.newaxis,)*(rhs.ndim-factors['invDenominators'].ndim)
+    lower=factors['lower'][extraAxes]
+    invDenominators=factors['invDenominators'][extraAxes]
+    upperPrimes=factors['upperPrimes'][extraAxes]
+    sol=np.empty(rhs.shape,dtype=complex)
+    sol[0]=rhs[0]*invDenominators[0]
+    for i in range(1,sol.shape[0]):
+        sol[i]=(rhs[i]-lower[i]*sol[i-1])*invDenominators[i]
+    for i in range(sol.shape[0]-2,-1,-1):
+        sol[i]-=upperPrimes[i]*sol[i+1]
+    return sol
+
+def createRK4StepMatrixH(
+    vPotential,
+    deltaTau,
+    deltaLambdaX,
+    deltaLambdaY,
+    wfSizeX,
+    wfSizeY,
+    periodicBCX,
+    periodicBCY,
+    mu
+):
+    '''
+        Creates the matrix H, encoding the whole rk process.
+        H is such that for one deltaTau time step
+            phi -> phi + H*phi
+    '''
+    sF=deltaTau*createEvolutionMatrixF(
+        vPotential,
+        wfSizeX,
         wfSizeY,
         deltaLambdaX,
         deltaLambdaY,
@@ -347,9 +1909,94 @@ def createRK4StepMatrixH(
         periodicBCY,
         mu
     )
-    H=(sF+sF.dot(sF)/2.+sF.dot(sF).dot(sF)/6.+sF.dot(sF).dot(sF).dot(sF)/24.)
+    sF2=sF.dot(sF)
+    H=(sF+sF2/2.+sF2.dot(sF)/6.+sF2.dot(sF2)/24.)
     return H
 
+def rk4StepRows(stepMatrixF,rows):
+    '''
+        the given rows of 1+H (H as in createRK4StepMatrixH)
+        from sF=deltaTau*F, as a (len(rows),Nx*Ny) csr block:
+        each power of sF is one row block times sF
+    '''
+    term=csr_matrix(stepMatrixF[rows])
+    stepRows=term+csr_matrix(
+        (np.ones(len(rows)),(np.arange(len(rows)),rows)),
+        shape=term.shape,
+    )
+    for order in range(2,5):
+        term=term.dot(stepMatrixF)/order
+        stepRows=stepRows+term
+    return csr_matrix(stepRows)
+
+def createKineticMatricesXY(
+    wfSizeX,
+    wfSizeY,
+    periodicBCX,
+    periodicBCY,
+):
+    '''
+        returns the two (csr sparse) matrices kinPartX, kinPartY
+        of the X- and Y- second differences (2 on the diagonal,
+        -1 between neighbours), assembled directly in sparse form
+        as Kronecker products of one-dimensional pieces.
+
+        Along each direction the neighbours are coupled cyclically;
+        with fixed BC in X the X-couplings are dropped on the first
+        and last rows in y (y=0, y=wfSizeY-1) and symmetrically for Y.
+        With the [x][y] -> x*wfSizeY+y index map,
+            kinPartX = 2 + kron(ringX, maskY)
+            kinPartY = 2 + kron(maskX, ringY)
+    '''
+    ringX=_createRingCouplings(wfSizeX)
+    ringY=_createRingCouplings(wfSizeY)
+    maskX=diags(createLineMask(wfSizeX,periodicBCY),format='csr')
+    maskY=diags(createLineMask(wfSizeY,periodicBCX),format='csr')
+    identity=identityMatrix(wfSizeX*wfSizeY,dtype=float,format='csr')
+    kinPartX=2*identity+kron(ringX,maskY,format='csr')
+    kinPartY=2*identity+kron(maskX,ringY,format='csr')
+    kinPartX.eliminate_zeros()
+    kinPartY.eliminate_zeros()
+    return kinPartX,kinPartY
+
+def _createRingCouplings(size):
+    '''
+        the one-dimensional cyclic nearest-neighbour couplings
+        (-1 between i and i+1 mod size), as a sparse matrix
+    '''
+    idx=np.arange(size)
+    nxt=(idx+1)%size
+    # each (i,j) pair is set once, even when size is tiny and pairs repeat
+    pairs=np.unique(np.hstack([idx*size+nxt,nxt*size+idx]))
+    return csr_matrix(
+        (-np.ones(len(pairs)),(pairs//size,pairs%size)),
+        shape=(size,size),
+    )
+
+def createLineMask(size,periodicBC):
+    '''
+        mask (1/0 array) over the lines of one direction telling
+        which of them carry the couplings along the other direction:
+        with fixed BC the first and last lines carry none
+    '''
+    mask=np.ones(size)
+    if not periodicBC:
+        mask[0]=0
+        mask[-1]=0
+    return mask
+
+def hamiltonianSpectralBounds(vPotential,deltaLambdaX,deltaLambdaY,mu):
+    '''
+        bounds (eMin,eMax) to the spectrum of H=iF, F as in
+        createEvolutionMatrixF, for either BC: the kinetic part has
+        its eigenvalues within [-(2/mu)(1/dLX^2+1/dLY^2),0] and the
+        potential shifts them by [min(v),max(v)] at most (Weyl).
+        O(Nx*Ny) and no matrix needed: cheap enough for
+        each setPotential, and never looser than Gershgorin.
+    '''
+    kinWidth=(2.0/mu)*(1.0/deltaLambdaX**2+1.0/deltaLambdaY**2)
+    return vPotential.min()-kinWidth,vPotential.max()
+
 def createEvolutionMatrixF(
     vPotential,
     wfSizeX,
@@ -371,40 +2018,22 @@ def createEvolutionMatrixF(
         undergo a reshape->(self.wfSizeX*self.wfSizeY),
         the index map is:
             [x][y] -> x*self.wfSizeY+y
+
+        The matrix is assembled in sparse form throughout
+        (see createKineticMatricesXY): no dense intermediates.
     '''
-    # the kinetic part
-    fullSize=wfSizeX*wfSizeY
-    indexer=lambda x,y,_Ny=wfSizeY: x*_Ny+y
-    # the X- differences
-    kinPartX=np.diag(2*np.ones(fullSize))
-    for x in range(wfSizeX):
-        for y in range(wfSizeY):
-            tIdx=indexer(x,y)
-            kinPartX[tIdx,indexer((x+1)%wfSizeX,y)]=-1
-            kinPartX[indexer((x+1)%wfSizeX,y),tIdx]=-1
-        if not periodicBCX:
-            for y in [0,wfSizeY-1]:
-                tIdx=indexer(x,y)
-                kinPartX[tIdx,indexer((x+1)%wfSizeX,y)]=0
-                kinPartX[indexer((x+1)%wfSizeX,y),tIdx]=0
-    # the Y- differences
-    kinPartY=np.diag(2*np.ones(fullSize))
-    for y in range(wfSizeY):
-        for x in range(wfSizeX):
-            tIdx=indexer(x,y)
-            kinPartY[tIdx,indexer(x,(y+1)%wfSizeY)]=-1
-            kinPartY[indexer(x,(y+1)%wfSizeY),tIdx]=-1
-        if not periodicBCY:
-            for x in [0,wfSizeX-1]:
-                tIdx=indexer(x,y)
-                kinPartY[tIdx,indexer(x,(y+1)%wfSizeY)]=0
-                kinPartY[indexer(x,(y+1)%wfSizeY),tIdx]=0
+    kinPartX,kinPartY=createKineticMatricesXY(
+        wfSizeX,
+        wfSizeY,
+        periodicBCX,
+        periodicBCY,
+    )
     # together with the potential is the final result
     mKinFactorX=complex(0,1.0/(2.0*float(mu)*(deltaLambdaX**2)))
     mKinFactorY=complex(0,1.0/(2.0*float(mu)*(deltaLambdaY**2)))
     if vPotential is not None:
         return csr_matrix(
-            mKinFactorX*kinPartX+mKinFactorY*kinPartY+complex(0,-1)*np.diag(vPotential)
+            mKinFactorX*kinPartX+mKinFactorY*kinPartY+diags(complex(0,-1)*vPotential)
         )
     else:
         return csr_matrix(
@@ -422,49 +2051,144 @@ def evolutionOperator(
     wfSizeX,
     wfSizeY
 ):
-    if periodicBCX:
-        largePhiX=np.vstack([[Phi[:][-1]],Phi[:][:],[Phi[:][0]]])
-        der2X=(2*Phi-largePhiX[:-2]-largePhiX[2:])/(deltaLambdaX**2)
-    else:
-        zX=np.zeros((1,wfSizeX),complex)
-        der2X=np.vstack([zX,2*Phi[1:-1]-Phi[:-2]-Phi[2:],zX])/(deltaLambdaX**2)
-    #
-    PhiT=Phi.transpose()
-    if periodicBCX and periodicBCY:
-        largePhiYT=np.vstack([[PhiT[-1][:]],PhiT[:][:],[PhiT[0][:]]])
-        der2Y=((2*PhiT-largePhiYT[:-2]-largePhiYT[2:]).transpose())/(deltaLambdaY**2)
-    else:
-        zY=np.zeros((1,wfSizeY),complex)
-        der2Y=np.vstack([zY,2*PhiT[1:-1]-PhiT[:-2]-PhiT[2:],zY]).transpose()/(deltaLambdaY**2)
-    #
-    secondDerivative=kineticFactor*(der2X+der2Y)
-    #
-    minusI = complex(0,-1)
-    F = minusI*(secondDerivative+vPotential*Phi)
-    return F
+    '''
+        given wf and potential as (wfSizeX,wfSizeY) arrays, evaluates
+        F[phi] in
+            delta phi/delta tau = F[phi]
+        returning a new array (see evolutionOperatorInto)
+    '''
+    out=np.zeros((wfSizeX,wfSizeY),dtype=complex)
+    evolutionOperatorInto(
+        Phi,
+        vPotential,
+        deltaLambdaX,
+        deltaLambdaY,
+        kineticFactor,
+        periodicBCX,
+        periodicBCY,
+        out,
+        np.zeros((wfSizeX,wfSizeY),dtype=complex),
+    )
+    return out
+
+def evolutionOperatorInto(
+    Phi,
+    vPotential,
+    deltaLambdaX,
+    deltaLambdaY,
+    kineticFactor,
+    periodicBCX,
+    periodicBCY,
+    out,
+    scratch,
+):
+    '''
+        matrix-free stencil for
+            F = -i ( kineticFactor*(second differences) + v*phi )
+        written into out, with scratch as work array (all arrays
+        shaped (wfSizeX,wfSizeY), or (wfSizeX,wfSizeY,K) for a batch
+        with vPotential shaped (wfSizeX,wfSizeY,1)).
+        Each direction has its own BC:
+        periodic wraps around, fixed leaves no second difference
+        on the first and last lines. No array is allocated, but
+        the y differences act on transposed (strided) views, which
+        numpy buffers through temporary arrays.
+    '''
+    secondDifferenceInto(Phi,periodicBCX,out)
+    np.multiply(out,kineticFactor/(deltaLambdaX**2),out=out)
+    secondDifferenceInto(Phi.swapaxes(0,1),periodicBCY,scratch.swapaxes(0,1))
+    np.multiply(scratch,kineticFactor/(deltaLambdaY**2),out=scratch)
+    np.add(out,scratch,out=out)
+    np.multiply(vPotential,Phi,out=scratch)
+    np.add(out,scratch,out=out)
+    np.multiply(out,complex(0,-1),out=out)
+    return out
+
+def normaliseSmoothingMap(smoothingMap):
+    '''
+        the smoothing map with weights rescaled to sum to one
+    '''
+    smMapSum=sum(mpRule[1] for mpRule in smoothingMap)
+    return [(smPos,smVal/smMapSum) for smPos,smVal in smoothingMap]
 
 def makeSmoothingMatrix(wfSizeX,wfSizeY,periodicBCX,periodicBCY,smoothingMap=[((0,0),1.0)]):
     '''
         constructs a smoothing (csr sparse) matrix S for usage
         in killing high frequencies as:
             phi_smoothed = S . phi
+        (the shifts wrap around the grid whatever the BCs),
+        assembled directly in sparse form, one diagonal
+        band per entry of the smoothing map.
+        See StencilSmoother for the matrix-free, in-place equivalent
     '''
     fullSize=wfSizeX*wfSizeY
-    indexer=lambda x,y,_Ny=wfSizeY: x*_Ny+y
-    # the X- differences
-    smoother=np.zeros((fullSize,fullSize))
-    smMapSum=sum(mpRule[1] for mpRule in smoothingMap)
-    normSmMap=[(smPos,smVal/smMapSum) for smPos,smVal in smoothingMap]
-    for x in range(wfSizeX):
-        for y in range(wfSizeY):
-            tIdx=indexer(x,y)
-            for (posDx,posDy),smVal in normSmMap:
-                oIdx=indexer((x+posDx+wfSizeX)%wfSizeX,(y+posDy+wfSizeY)%wfSizeY)
-                smoother[tIdx,oIdx]=smVal
+    xs,ys=np.meshgrid(np.arange(wfSizeX),np.arange(wfSizeY),indexing='ij')
+    targets=(xs*wfSizeY+ys).reshape(fullSize)
+    normSmMap=normaliseSmoothingMap(smoothingMap)
     return csr_matrix(
-        smoother
+        (
+            np.concatenate([np.full(fullSize,smVal) for _,smVal in normSmMap]),
+            (
+                np.concatenate([targets for _ in normSmMap]),
+                np.concatenate([
+                    (((xs+posDx)%wfSizeX)*wfSizeY+(ys+posDy)%wfSizeY).reshape(fullSize)
+                    for (posDx,posDy),_ in normSmMap
+                ]),
+            ),
+        ),
+        shape=(fullSize,fullSize),
     )
 
+class StencilSmoother():
+    '''
+        the smoothing of makeSmoothingMatrix applied as a direct
+        (cyclic) stencil on the (wfSizeX,wfSizeY) grid, in place:
+        the shifts sharing a weight are summed first, then scaled
+        once, into two work buffers allocated at construction, and
+        the last sum is written straight into phi. Each shift is
+        copied into a third buffer, so that the arithmetic runs on
+        whole contiguous arrays: no matrix is built and no array
+        is allocated per call (only the small slice objects)
+    '''
+    def __init__(self,wfSizeX,wfSizeY,smoothingMap=[((0,0),1.0)]):
+        self.wfSizeX=wfSizeX
+        self.wfSizeY=wfSizeY
+        self.weightGroups=OrderedDict()
+        for smShift,smVal in normaliseSmoothingMap(smoothingMap):
+            self.weightGroups.setdefault(smVal,[]).append(smShift)
+        self.workPhi=np.zeros((wfSizeX,wfSizeY),dtype=complex)
+        self.scratch=np.zeros((wfSizeX,wfSizeY),dtype=complex)
+        self.shiftBuffer=np.zeros((wfSizeX,wfSizeY),dtype=complex)
+
+    def smoothInPlace(self,phi):
+        '''
+            phi, a contiguous (wfSizeX*wfSizeY) complex array,
+            is overwritten with its smoothed version and returned
+        '''
+        Phi=phi.reshape((self.wfSizeX,self.wfSizeY))
+        nGroups=len(self.weightGroups)
+        for groupIndex,(smVal,smShifts) in enumerate(self.weightGroups.items()):
+            if groupIndex==0:
+                groupSum=self.workPhi
+            else:
+                groupSum=self.scratch
+            if len(smShifts)==1:
+                shiftedInto(Phi,smShifts[0],groupSum,weight=smVal)
+            else:
+                shiftedInto(Phi,smShifts[0],groupSum)
+                for smShift in smShifts[1:]:
+                    shiftedAddInto(Phi,smShift,groupSum,self.shiftBuffer)
+                np.multiply(groupSum,smVal,out=groupSum)
+            if groupIndex>0:
+                np.add(
+                    self.workPhi,
+                    groupSum,
+                    out=Phi if groupIndex==nGroups-1 else self.workPhi,
+                )
+        if nGroups==1:
+            np.copyto(Phi,self.workPhi)
+        return phi
+
 def createEnergyCalculator(
     wfSizeX,
     wfSizeY,
@@ -473,44 +2197,52 @@ def createEnergyCalculator(
     deltaLambdaX,
     deltaLambdaY,
     mu,
+    freeMatrix=None,
 ):
+    '''
+        returns a function
+            (wf, pot, lastEnergy) -> <psi|H|psi>
+        with the area element deltaLambdaX*deltaLambdaY.
+        lastEnergy, the <phi|H|phi> most integrators get as a by-product
+        of their steps, is used when available; otherwise the energy
+        costs one in-place sparse matvec with the kinetic part iF0
+        (F0 as from createEvolutionMatrixF, given as freeMatrix if
+        already built, so that the boundary terms are those of the
+        matrix integrators) plus the elementwise potential term,
+        on buffers kept across calls.
+        wf can be a (wfSizeX*wfSizeY,K) batch: one energy per column.
+    '''
+    if freeMatrix is None:
+        freeMatrix=createEvolutionMatrixF(
+            None,
+            wfSizeX,
+            wfSizeY,
+            deltaLambdaX,
+            deltaLambdaY,
+            periodicBCX,
+            periodicBCY,
+            mu,
+        )
     enCalcData={
-        'wfSizeX':      wfSizeX,
-        'wfSizeY':      wfSizeY,
-        'periodicBCX':  periodicBCX,
-        'periodicBCY':  periodicBCY,
-        'deltaLambdaX': deltaLambdaX,
-        'deltaLambdaY': deltaLambdaY,
+        'deltaLambdaXY': deltaLambdaX*deltaLambdaY,
+        # F = (i/2mu)(kinetic part)-i(v), F0 its kinetic part:
+        #   H phi = i*F phi = i*F0 phi + v*phi
+        'iF0': csr_matrix(complex(0,1)*freeMatrix,dtype=complex),
+        'hPhi': None,
+        'potPhi': None,
     }
-    iFreeEnPart=complex(0,1)*createEvolutionMatrixF(
-        None,
-        wfSizeX,
-        wfSizeY,
-        deltaLambdaX,
-        deltaLambdaY,
-        periodicBCX,
-        periodicBCY,
-        mu,
-    )
-    def _enCalculator(wf,pot,lastEnergy,_data=enCalcData,_iF0=iFreeEnPart):
-        '''
-            F = (i/2mu)(kinetic part)-i(v)
-
-            F0 = (i/2mu)(kinetic part)
-
-            en = deltaLambda * [ phi* ( (-1/2mu)d2/dlambda2 + v ) phi ]
-               = deltaLambda * [ phi* ( i*F ) phi ]
-               = deltaLambda * [ phi* ( i*F0 + v ) phi ]
-        '''
-        if lastEnergy is not None:
-            thisEn=lastEnergy
-        else:
-            # slow, sluggish re-calculation: to be avoided when possible
-            thisEn=wf.conjugate().dot((
-                _iF0+ \
-                csr_matrix(np.diag(pot))
-            ).dot(wf))
-            # here we *AVERAGE* the two deltaLambdas assuming no large asymmetries!
-            # CAREFUL
-        return thisEn*(_data['deltaLambdaX']+_data['deltaLambdaY'])/2
+    def _enCalculator(wf,pot,lastEnergy,_data=enCalcData):
+        if lastEnergy is None:
+            if _data['hPhi'] is None or _data['hPhi'].shape!=wf.shape:
+                _data['hPhi']=np.zeros(wf.shape,dtype=complex)
+                _data['potPhi']=np.zeros(wf.shape,dtype=complex)
+            sparseMatVecInto(_data['iF0'],np.ascontiguousarray(wf,dtype=complex),_data['hPhi'])
+            np.multiply(
+                pot.reshape(pot.shape+(1,)*(wf.ndim-1)),
+                wf,
+                out=_data['potPhi'],
+            )
+            np.add(_data['hPhi'],_data['potPhi'],out=_data['hPhi'])
+            lastEnergy=expectationValue(wf,_data['hPhi'])
+        return lastEnergy*_data['deltaLambdaXY']
     return _enCalculator
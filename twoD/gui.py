@@ -72,13 +72,19 @@ def integerize(wfunction,maxMod2,paletteRange):
         rescaling the mod2 according to maxMod2
         paletteRange=256-nSpecialColors
     '''
+    return integerizeDensity(mod2(wfunction),maxMod2,paletteRange)
+
+def integerizeDensity(density,maxDensity,paletteRange):
+    '''
+        as integerize, for an already real (nonnegative) array
+    '''
     # to enhance the low values' coloring:
-    # return (0.5+((mod2(wfunction)/maxMod2)**0.43)*254).astype(int)
+    # return (0.5+((density/maxDensity)**0.43)*254).astype(int)
     # the standard coloring:
-    if maxMod2>0:
-        return (0.5+(mod2(wfunction)*(paletteRange-2)/maxMod2)).astype(int)
+    if maxDensity>0:
+        return (0.5+(density*(paletteRange-2)/maxDensity)).astype(int)
     else:
-        return mod2(wfunction).astype(int)
+        return density.astype(int)
     # the slower, bounds-checking form of the latter would be:
     # nMat=(0.5+(mod2(wfunction)*254/maxMod2)).astype(int)
     # nMat[nMat>255]=255
@@ -95,7 +101,7 @@ def mapToPalette(colArray,nparray,potarray,refPalette,refPotPalette):
             if potarray[x][y]>DRAW_POTENTIAL_THRESHOLD:
                 colArray[x][y]=np.array(refPotPalette[potarray[x][y]])
 
-def doPlot(wfunction,replotting=None,title=None,palette=0,photoIndex=None,saveImage=False,potential=None,keysToCatch=set(),keysToSend=set(),specialColors=[potentialColor]):
+def doPlot(wfunction,replotting=None,title=None,palette=0,photoIndex=None,saveImage=False,potential=None,keysToCatch=set(),keysToSend=set(),specialColors=[potentialColor],momentumTransform=None):
     '''
         all information on the x,y-scale
         is implicit.
@@ -109,6 +115,10 @@ def doPlot(wfunction,replotting=None,title=None,palette=0,photoIndex=None,saveIm
             
             # Careful: with saveImage we do not use any palette and
               employ 24-bit colors natively (slowew)
+
+        With a momentumTransform (utils.momentum.MomentumTransform)
+        the momentum distribution |phi(k)|^2 is shown instead
+        of |phi|^2, k=0 at the centre, and the potential is not drawn.
     '''
     if replotting is None:
         # create everything
@@ -144,19 +154,28 @@ def doPlot(wfunction,replotting=None,title=None,palette=0,photoIndex=None,saveIm
     # 0. cosmetics (title, etc)
     if title is not None:
         pygame.display.set_caption(title)
-    # 1. recalculate the integer wf
-    maxMod2=mod2(wfunction).max()
-    intMod2=integerize(wfunction,maxMod2,paletteRange=replotting['paletteRange'])
+    # 1. recalculate the integer wf (or its momentum distribution)
+    if momentumTransform is None:
+        density=mod2(wfunction)
+    else:
+        density=momentumTransform.update(wfunction).distribution().reshape(-1)
+    intMod2=integerizeDensity(density,density.max(),paletteRange=replotting['paletteRange'])
 
     # actual on-screen plotting through pygame (and optionally saving)
     if replotting['saveImage']:
         # non-optimised saving of the current frame
         colArray=np.zeros((Nx,Ny,3)).astype(int)
         pygame.pixelcopy.surface_to_array(colArray,replotting['pygame']['bufferSurf'])
-        mapToPalette(colArray,intMod2,replotting['potential'],replotting['usedPalette'],replotting['potPalette'])
+        mapToPalette(
+            colArray,
+            intMod2,
+            replotting['potential'] if momentumTransform is None else np.zeros_like(replotting['potential']),
+            replotting['usedPalette'],
+            replotting['potPalette'],
+        )
         pygame.pixelcopy.array_to_surface(replotting['pygame']['bufferSurf'],colArray)
     else:
-        if potential is not None:
+        if potential is not None and momentumTransform is None:
             potThreshold=0.5*potential.max()
             intMod2[potential>=potThreshold]=255
         pygame.pixelcopy.array_to_surface(
@@ -0,0 +1,158 @@
+'''
+    observables.py : the physical observables of the
+    two-dimensional wavefunction (see utils.observables)
+'''
+
+import numpy as np
+
+from utils.observables import (
+    ObservableSet,
+    forwardDifferenceInto,
+)
+
+from utils.kernels import (
+    trackPotentialChanges,
+)
+
+from twoD.dynamics import createKineticMatricesXY
+
+class GridObservables(ObservableSet):
+    '''
+        observables of phi on the (wfSizeX,wfSizeY) grid, in
+        adimensional units (positions in [0,LambdaX), ...),
+        each added with one of the add* methods:
+            addPosition: <x>, <y>, <x^2>, <y^2>, spreads sigmaX, sigmaY
+            addMomentum: <px>, <py> (the expectation of -i d/dx, with
+                the forward difference, an in-place stencil), <px^2>, <py^2> (with the
+                second difference of the integrators), sigmaPX, sigmaPY.
+                With the integrators' sign convention (see kineticFactor)
+                d<x>/dtau=2*kineticFactor*<px>
+            addCurrent: the probability per unit time crossing a segment
+            addEnergy: kineticEnergy, potentialEnergy, with the same
+                operator (and sign convention) as the integrators'
+                energy, whose sum they make up
+        Observables are evaluated with evaluate(phi).
+    '''
+    def __init__(
+        self,
+        wfSizeX,
+        wfSizeY,
+        deltaLambdaX,
+        deltaLambdaY,
+        periodicBCX,
+        periodicBCY,
+        mu,
+    ):
+        self.wfSizeX=wfSizeX
+        self.wfSizeY=wfSizeY
+        self.deltaLambdaX=deltaLambdaX
+        self.deltaLambdaY=deltaLambdaY
+        self.periodicBCX=periodicBCX
+        self.periodicBCY=periodicBCY
+        self.kineticFactor=-1.0/(2.0*float(mu))
+        # a copy of the potential of the energy weights
+        self.cachedPotential=None
+        kinPartX,kinPartY=createKineticMatricesXY(
+            wfSizeX,
+            wfSizeY,
+            periodicBCX,
+            periodicBCY,
+        )
+        ObservableSet.__init__(
+            self,
+            wfSizeX*wfSizeY,
+            deltaLambdaX*deltaLambdaY,
+            {
+                'differenceX': self._differenceXInto,
+                'differenceY': self._differenceYInto,
+                'kineticX': kinPartX/(deltaLambdaX**2),
+                'kineticY': kinPartY/(deltaLambdaY**2),
+            },
+        )
+
+    def _differenceXInto(self,phi,out):
+        forwardDifferenceInto(
+            phi.reshape((self.wfSizeX,self.wfSizeY)),
+            0,
+            self.periodicBCX,
+            out.reshape((self.wfSizeX,self.wfSizeY)),
+        )
+
+    def _differenceYInto(self,phi,out):
+        forwardDifferenceInto(
+            phi.reshape((self.wfSizeX,self.wfSizeY)),
+            1,
+            self.periodicBCY,
+            out.reshape((self.wfSizeX,self.wfSizeY)),
+        )
+
+    def _coordinates(self):
+        return np.meshgrid(
+            np.arange(self.wfSizeX)*self.deltaLambdaX,
+            np.arange(self.wfSizeY)*self.deltaLambdaY,
+            indexing='ij',
+        )
+
+    def addPosition(self):
+        xs,ys=self._coordinates()
+        self.register('x',[('density',xs)])
+        self.register('y',[('density',ys)])
+        self.register('x2',[('density',xs**2)])
+        self.register('y2',[('density',ys**2)])
+        self.registerSpread('sigmaX','x','x2')
+        self.registerSpread('sigmaY','y','y2')
+
+    def addMomentum(self):
+        ones=np.ones(self.nSites)
+        self.register('px',[('imdifferenceX',ones/self.deltaLambdaX)])
+        self.register('py',[('imdifferenceY',ones/self.deltaLambdaY)])
+        self.register('px2',[('rekineticX',ones)])
+        self.register('py2',[('rekineticY',ones)])
+        self.registerSpread('sigmaPX','px','px2')
+        self.registerSpread('sigmaPY','py','py2')
+
+    def addCurrent(self,name,axis,position,span=(0.0,1.0)):
+        '''
+            the probability per unit time flowing across the segment,
+            perpendicular to axis ('x' or 'y'), at the given fraction
+            of the grid along it and spanning the span fractions along
+            the other one. Positive when flowing towards larger x (y).
+            The flow is that of the discretised Hamiltonian, between
+            a site and the next one along axis
+        '''
+        weights=np.zeros((self.wfSizeX,self.wfSizeY))
+        if axis=='x':
+            spanStart,spanEnd=(int(0.5+fraction*self.wfSizeY) for fraction in span)
+            weights[int(position*self.wfSizeX),spanStart:spanEnd]=self.deltaLambdaY/self.deltaLambdaX
+            densityName='imdifferenceX'
+        elif axis=='y':
+            spanStart,spanEnd=(int(0.5+fraction*self.wfSizeX) for fraction in span)
+            weights[spanStart:spanEnd,int(position*self.wfSizeY)]=self.deltaLambdaX/self.deltaLambdaY
+            densityName='imdifferenceY'
+        else:
+            raise ValueError('Unknown axis "%s"' % axis)
+        # j = 2*kineticFactor*Im(phi^* D+ phi) for H = kineticFactor*(second differences)+v
+        self.register(
+            name,
+            [(densityName,weights*2*self.kineticFactor/self.deltaVolume)],
+        )
+
+    def addEnergy(self,vPotential):
+        ones=self.kineticFactor*np.ones(self.nSites)
+        self.register('kineticEnergy',[('rekineticX',ones),('rekineticY',ones)])
+        self.register('potentialEnergy',[('density',vPotential)],keepZeros=True)
+        self.cachedPotential,_=trackPotentialChanges(None,vPotential)
+
+    def setPotential(self,vPotential):
+        '''
+            to be called when the potential may have changed (if
+            addEnergy was used): the contents are compared, as
+            integrators may refill the same array in place
+        '''
+        if self.cachedPotential is not None:
+            self.cachedPotential,changedSites=trackPotentialChanges(
+                self.cachedPotential,
+                vPotential,
+            )
+            if changedSites is None or len(changedSites)>0:
+                self.updateWeights('potentialEnergy',vPotential)
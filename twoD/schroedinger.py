@@ -4,8 +4,10 @@
     schroedinger.py :
       two-dimensional study of integration of the
       Schroedinger equation
+      (with headless set, a batch run with no display)
 '''
 from itertools import count
+import atexit
 import time
 import sys
 
@@ -23,11 +25,24 @@ from twoD.settings import (
     LambdaX,
     LambdaY,
     framesToDraw,
+    integratorClass,
+    integratorOptions,
+    observablesDirectory,
+    observedCurrents,
+    highKCutoff,
+    checkpointDirectory,
+    checkpointEvery,
+    headless,
+    trajectoryDirectory,
+    trajectoryEvery,
+    trajectoryFormat,
+    trajectoryChunkFrames,
 )
 
-from twoD.gui import (
-    doPlot,
-)
+if not headless:
+    from twoD.gui import (
+        doPlot,
+    )
 
 from twoD.wfunctions import (
     wavePacket,
@@ -37,18 +52,37 @@ from twoD.potentials import (
     rectangularHolePotential,
 )
 
+from twoD.observables import (
+    GridObservables,
+)
+
+from utils.observables import (
+    ObservablesWriter,
+)
+
+from utils.momentum import (
+    MomentumTransform,
+)
+
+from utils.checkpoint import (
+    CheckpointWriter,
+    resumableCheckpoint,
+)
+
+from utils.trajectory import (
+    TrajectoryWriter,
+)
+
+from twoD.dynamics import (
+    OperatorCache,
+)
+
 from twoD.tools import (
     combineWFunctions,
     combinePotentials,
     norm,
 )
 
-from twoD.dynamics import (
-    NaiveFiniteDifferenceIntegrator,
-    RK4StepByStepIntegrator,
-    SparseMatrixRK4Integrator,
-)
-
 from utils.units import (
     toLength_fm,
     toTime_fs,
@@ -84,6 +118,23 @@ def initPhi():
     )
     return phi
 
+def initObservables(pot):
+    observables=GridObservables(
+        wfSizeX=Nx,
+        wfSizeY=Ny,
+        deltaLambdaX=deltaLambdaX,
+        deltaLambdaY=deltaLambdaY,
+        periodicBCX=periodicBCX,
+        periodicBCY=periodicBCY,
+        mu=Mu,
+    )
+    observables.addPosition()
+    observables.addMomentum()
+    observables.addEnergy(pot)
+    for currentName,(currentAxis,currentPosition,currentSpan) in observedCurrents.items():
+        observables.addCurrent(currentName,currentAxis,currentPosition,currentSpan)
+    return observables
+
 def initPot():
     return combinePotentials(
         [
@@ -133,10 +184,61 @@ def initPot():
         ]
     )
 
+def runParameters():
+    '''
+        what a checkpoint must share with the run resuming from it
+    '''
+    return {
+        'integrator': integratorClass.__name__,
+        'Nx': Nx,
+        'Ny': Ny,
+        'Mu': Mu,
+        'deltaTau': deltaTau,
+        'deltaLambdaX': deltaLambdaX,
+        'deltaLambdaY': deltaLambdaY,
+        'periodicBCX': periodicBCX,
+        'periodicBCY': periodicBCY,
+        'drawFreq': drawFreq,
+    }
+
 if __name__=='__main__':
 
     pot=initPot()
-    integrator=SparseMatrixRK4Integrator(
+    phi=initPhi()
+    tau=0
+    firstFrame=0
+    resumeOptions={}
+    if checkpointDirectory is not None:
+        checkpoint=resumableCheckpoint(checkpointDirectory,runParameters())
+        if checkpoint is not None:
+            pot=np.array(checkpoint['arrays']['potential'])
+            phi=np.array(checkpoint['arrays']['phi'])
+            tau=checkpoint['values']['tau']
+            firstFrame=checkpoint['frame']+1
+            if checkpoint['operators'] is not None:
+                # the integrator finds its operators (memory-mapped) there
+                operatorCache=integratorOptions.get('operatorCache')
+                if operatorCache is None:
+                    operatorCache=OperatorCache()
+                operatorCache.put(*checkpoint['operators'])
+                resumeOptions['operatorCache']=operatorCache
+            print('Resuming from frame %i' % firstFrame)
+        checkpointWriter=CheckpointWriter(checkpointDirectory)
+        atexit.register(checkpointWriter.close)
+    else:
+        checkpointWriter=None
+    if observablesDirectory is not None:
+        observables=initObservables(pot)
+        observablesWriter=ObservablesWriter(
+            observablesDirectory,
+            ['frame','tau']+observables.names()+['energy','energyComplexity','normDeviation','highKFraction'],
+        )
+        # also on sys.exit: the last rows are flushed
+        atexit.register(observablesWriter.close)
+    else:
+        observables=None
+        observablesWriter=None
+    integrator=integratorClass(
         wfSizeX=Nx,
         wfSizeY=Ny,
         deltaTau=deltaTau,
@@ -147,11 +249,29 @@ if __name__=='__main__':
         periodicBCX=periodicBCX,
         periodicBCY=periodicBCY,
         mu=Mu,
+        observables=observables,
+        **dict(integratorOptions,**resumeOptions)
     )
 
-    phi=initPhi()
-    tau=0
-    replotting=doPlot(phi)
+    momentumTransform=MomentumTransform((Nx,Ny),(deltaLambdaX,deltaLambdaY),highKCutoff=highKCutoff)
+    momentumView=False
+    if trajectoryDirectory is not None:
+        trajectoryWriter=TrajectoryWriter(
+            trajectoryDirectory,
+            (Nx,Ny),
+            trajectoryFormat=trajectoryFormat,
+            chunkFrames=trajectoryChunkFrames,
+            # the frames i multiple of trajectoryEvery still to run
+            nFrames=None if framesToDraw is None else len(range(
+                -(-firstFrame//trajectoryEvery)*trajectoryEvery,
+                framesToDraw,
+                trajectoryEvery,
+            )),
+        )
+        atexit.register(trajectoryWriter.close)
+    else:
+        trajectoryWriter=None
+    replotting=None if headless else doPlot(phi)
 
     # some info
     phLenX,phLenY=toLength_fm(LambdaX),toLength_fm(LambdaY)
@@ -159,25 +279,51 @@ if __name__=='__main__':
 
     plotTarget=0
 
-    keysToSend={'i','p'}
+    keysToSend={'i','p','k'}
 
     initTime=time.time()
-    for i in count() if framesToDraw is None else range(framesToDraw):
+    for i in count(firstFrame) if framesToDraw is None else range(firstFrame,framesToDraw):
         if plotTarget==0:
             phi,energy,eComp,normDev,tauIncr,_=integrator.integrate(phi)
             tau+=tauIncr
+            if headless and observablesWriter is None:
+                # (shown in the title only)
+                highKFraction=None
+            else:
+                highKFraction=momentumTransform.highKFraction(phi)
+            if observablesWriter is not None:
+                observablesWriter.push(dict(
+                    integrator.lastObservables,
+                    frame=i,
+                    tau=tau,
+                    highKFraction=highKFraction,
+                ))
+            if checkpointWriter is not None and (i+1)%checkpointEvery==0:
+                checkpointWriter.save(
+                    i,
+                    {'phi': phi, 'potential': pot},
+                    {'tau': float(tau), 'parameters': runParameters()},
+                    integrator.operatorSnapshot(),
+                )
+            if trajectoryWriter is not None and i%trajectoryEvery==0:
+                trajectoryWriter.push(phi,tau,i)
+            if headless:
+                continue
             doPlot(
                 phi,
                 replotting,
-                title='Iter %04i, t=%.1E fs, E=%.1E MeV (%.1f), nDev=%.2E' % (
+                title='Iter %04i, t=%.1E fs, E=%.1E MeV (%.1f), nDev=%.2E, hiK=%.1E%s' % (
                     i,
                     toTime_fs(tau),
                     toEnergy_MeV(energy),
                     eComp,
                     normDev,
+                    highKFraction,
+                    ' (momentum, k to resume)' if momentumView else '',
                 ),
                 palette=0,
                 keysToSend=keysToSend,
+                momentumTransform=momentumTransform if momentumView else None,
             )
         else:
             doPlot(pot.astype(complex),replotting,title='Potential (p to resume)',palette=1,keysToSend=keysToSend)
@@ -187,11 +333,21 @@ if __name__=='__main__':
             tkey=replotting['keyqueue'].pop(0)
             if tkey=='p':
                 plotTarget=1-plotTarget
+            elif tkey=='k':
+                momentumView=not momentumView
             elif tkey=='i':
                 sys.exit()
         #
     elapsed=time.time()-initTime
     print('Elapsed: %.2f seconds = %.3f iters/s' % (
         elapsed,
-        framesToDraw/elapsed,
-    ))
\ No newline at end of file
+        (framesToDraw-firstFrame)/elapsed,
+    ))
+    if hasattr(integrator,'adaptiveTotals'):
+        adaptiveTotals=integrator.adaptiveTotals
+        print('Adaptive steps: %i accepted, %i rejected (%.2f per frame, vs %i fixed)' % (
+            adaptiveTotals['accepted'],
+            adaptiveTotals['rejected'],
+            (adaptiveTotals['accepted']+adaptiveTotals['rejected'])/max(1,adaptiveTotals['frames']),
+            drawFreq,
+        ))
\ No newline at end of file
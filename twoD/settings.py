@@ -8,7 +8,16 @@
 '''
 
 import math
-import pygame
+
+from twoD.dynamics import (
+    SparseMatrixRK4Integrator,
+    SplitOperatorIntegrator,
+    CrankNicolsonIntegrator,
+    ADIIntegrator,
+    KrylovIntegrator,
+    ChebyshevIntegrator,
+    DormandPrinceIntegrator,
+)
 
 # Physical parameters
 LambdaX = 1
@@ -26,6 +35,56 @@ deltaTau = 0.000003
 periodicBCX=False
 periodicBCY=False
 
+# which integrator to use, with its extra options. E.g.:
+#   integratorClass=SplitOperatorIntegrator
+#   integratorOptions={'order': 4, 'exactEnergy': True}
+# (the implicit/unitary integrators, SplitOperator, CrankNicolson and ADI,
+# remain stable with a much larger deltaTau and smaller drawFreq;
+# KrylovIntegrator and ChebyshevIntegrator cover deltaTau*drawFreq
+# in a single propagation; DormandPrinceIntegrator, with e.g.
+#   integratorOptions={'relTolerance': 1e-6, 'absTolerance': 1e-8}
+# adapts its own step and takes deltaTau as a first guess only).
+# With 'autoTimestep' (explicit RK4 integrators only) deltaTau*drawFreq
+# is just the time between frames: the largest stable step, and the
+# number of steps, are chosen from the potential.
+# Beware: with fixed BC (periodicBCX/periodicBCY False, the default) the
+# SplitOperatorIntegrator evolves with a hard-wall kinetic term, not the
+# fixed-BC operator of the matrix integrators (which keeps the cyclic
+# couplings, dropping them on the first and last lines): near the edges
+# the evolution and the energies differ from the RK4 integrators'.
+integratorClass=SparseMatrixRK4Integrator
+integratorOptions={'autoTimestep': True}
+
+# per-frame observables (positions, momenta, spreads, energy breakdown,
+# probability currents across the given segments, as in
+# twoD.observables.GridObservables.addCurrent), streamed as chunked .npy
+# files to observablesDirectory (None = disabled);
+# read back with utils.observables.loadObservables
+observablesDirectory=None
+observedCurrents={
+    'centreX': ('x',0.5,(0.0,1.0)),
+    'centreY': ('y',0.5,(0.0,1.0)),
+}
+
+# checkpoints (phi, tau, the potential and the integrator's operators)
+# written every checkpointEvery frames to checkpointDirectory (None =
+# disabled) from a background thread; a run with the same parameters
+# resumes from the latest one found there (see utils.checkpoint)
+checkpointDirectory=None
+checkpointEvery=100
+
+# with headless the run has no display (nor pygame import) and no key
+# polling, for batch runs; every trajectoryEvery-th frame of phi is
+# stored to trajectoryDirectory (None = disabled), headless or not, as
+# memory-mapped chunks of trajectoryChunkFrames frames, in one of the
+# formats of utils.trajectory ('complex64', or quantized 'int16', 'int8');
+# read back with utils.trajectory.Trajectory
+headless=False
+trajectoryDirectory=None
+trajectoryEvery=1
+trajectoryFormat='complex64'
+trajectoryChunkFrames=256
+
 # quantities derived from the above
 deltaLambdaX=float(LambdaX)/float(Nx)
 deltaLambdaY=float(LambdaY)/float(Ny)
@@ -33,6 +92,11 @@ deltaLambdaX2=deltaLambdaX**2
 deltaLambdaY2=deltaLambdaY**2
 waveNumber0=(2*math.pi/LambdaX,2*math.pi/LambdaY)
 
+# fraction of the norm above this fraction of the grid-scale |k|
+# (along either axis), shown each frame; 'k' toggles the display
+# of the momentum distribution |phi(k)|^2
+highKCutoff=0.8
+
 # display parameters
 tileX=8
 tileY=8
@@ -4,6 +4,7 @@
 
 from functools import reduce
 import numpy as np
+from scipy.sparse import csr_matrix
 
 def mod2(psi):
     return (psi.conjugate()*psi).real
@@ -17,17 +18,77 @@ def norm(psi,deltaLambdaXY,slices=None):
         It is responsibility of the caller to ensure the slices
         are a proper partition. The slices are a list such as:
             [0, i1, i2 ... in] where in < total_size
+        psi can also be a (Nx*Ny,K) batch, one wavefunction per
+        column: norms (and partial norms) are then arrays of K.
+        The partial norms come from a single np.add.reduceat pass;
+        for arbitrary regions see RegionReducer.
     '''
     if slices is None:
-        return (sum(mod2(psi))*deltaLambdaXY)**0.5,None
+        return (mod2(psi).sum(axis=0)*deltaLambdaXY)**0.5,None
     else:
-        _mod2=mod2(psi)
-        normMap={
-            slIndex: sum(_mod2[slStart:slEnd])
-            for slIndex,(slStart,slEnd) in enumerate(zip(slices,slices[1:]+[None]))
+        partialNorms=np.add.reduceat(mod2(psi),slices,axis=0)
+        # reduceat gives the entry, not zero, for empty slices
+        partialNorms[np.diff(slices+[psi.shape[0]])==0]=0
+        fullNorm=partialNorms.sum(axis=0)
+        return (fullNorm*deltaLambdaXY)**0.5,{
+            slIndex: partialNorms[slIndex]/fullNorm
+            for slIndex in range(len(slices))
         }
-        fullNorm=sum(normMap.values())
-        return (fullNorm*deltaLambdaXY)**0.5,{k: v/fullNorm for k,v in normMap.items()}
+
+class RegionReducer():
+    '''
+        the norm of psi and the probabilities of any number of
+        regions of the grid, in a single sparse product: each region
+        is given by its weights w(x,y) (an indicator, e.g. from
+        rectangleRegion, a boolean mask, or any window) and these are
+        stacked, after a row of ones, as the rows of W, so that
+            W . mod2(psi) = [ sum|psi|^2, sum w_1|psi|^2, ... ].
+        regions is a map name -> (wfSizeX,wfSizeY) weights;
+        reduce returns the same as norm with slices, the map going
+        from the region names to the fractions of the full norm.
+        psi can be a (Nx*Ny,K) batch as for norm.
+    '''
+    def __init__(self,wfSizeX,wfSizeY,regions):
+        self.regionNames=list(regions.keys())
+        fullSize=wfSizeX*wfSizeY
+        self.weightMatrix=csr_matrix(np.vstack(
+            [np.ones(fullSize)]+[
+                np.asarray(regions[regionName],dtype=float).reshape(fullSize)
+                for regionName in self.regionNames
+            ]
+        ))
+
+    def reduce(self,psi,deltaLambdaXY):
+        regionNorms=self.weightMatrix.dot(mod2(psi))
+        fullNorm=regionNorms[0]
+        return (fullNorm*deltaLambdaXY)**0.5,{
+            regionName: regionNorms[regionIndex+1]/fullNorm
+            for regionIndex,regionName in enumerate(self.regionNames)
+        }
+
+def rectangleRegion(wfSizeX,wfSizeY,xRange,yRange):
+    '''
+        indicator of the rectangle xRange x yRange, each
+        a (start,end) pair of fractions of the grid side (end excluded)
+    '''
+    region=np.zeros((wfSizeX,wfSizeY))
+    region[
+        int(0.5+xRange[0]*wfSizeX):int(0.5+xRange[1]*wfSizeX),
+        int(0.5+yRange[0]*wfSizeY):int(0.5+yRange[1]*wfSizeY),
+    ]=1.0
+    return region
+
+def sliceRegions(slices,wfSizeX,wfSizeY):
+    '''
+        the contiguous slices of norm as regions (keys 0,1,...)
+    '''
+    fullSize=wfSizeX*wfSizeY
+    regions={}
+    for slIndex,(slStart,slEnd) in enumerate(zip(slices,slices[1:]+[fullSize])):
+        region=np.zeros(fullSize)
+        region[slStart:slEnd]=1.0
+        regions[slIndex]=region
+    return regions
 
 def re(psi):
     return psi.real
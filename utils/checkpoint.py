@@ -0,0 +1,311 @@
+'''
+    checkpoint.py : periodic checkpoints of a simulation,
+    to resume it after an interruption.
+
+    A checkpoint is a directory state-<frame> holding the arrays
+    (phi, the potential...) as separate .npy files and a manifest.json
+    with the other values (tau, the parameters of the run...), written
+    last. The operators of an integrator (see the operatorSnapshot of
+    the twoD integrators) go, once per operator key, in a directory
+    operators-<key> shared by all checkpoints referring to it:
+    a static potential costs a single write of its operators.
+    Entries are written into a temporary directory, then moved in
+    place: readers never see a partial checkpoint.
+
+    CheckpointWriter takes a snapshot (a copy) of what is saved and
+    writes it from a background thread: the caller never waits for
+    the disk, and a checkpoint still waiting when a newer one comes
+    is superseded by the latter. Only the latest keep checkpoints
+    (and the operators they refer to) are retained.
+
+    loadLatestCheckpoint memory-maps the arrays (read-only).
+'''
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# to be increased whenever the layout changes
+CHECKPOINT_VERSION=1
+
+def _encodeTree(item,arrays):
+    '''
+        a json-able description of item (nested dicts, lists, tuples,
+        scalars, arrays, sparse matrices), the arrays being copied
+        into arrays under generated names. Raises TypeError on
+        anything else (e.g. a sparse LU factorisation)
+    '''
+    if item is None or isinstance(item,(bool,int,float,str)):
+        return {'value': item}
+    elif isinstance(item,np.generic) and not np.iscomplexobj(item):
+        return {'value': item.item()}
+    elif isinstance(item,np.ndarray):
+        arrayName='a%i' % len(arrays)
+        arrays[arrayName]=np.array(item)
+        return {'array': arrayName}
+    elif hasattr(item,'indptr'):
+        item=csr_matrix(item)
+        return {
+            'csr': [_encodeTree(getattr(item,component),arrays)
+                for component in ('data','indices','indptr')],
+            'shape': list(item.shape),
+            'sorted': bool(item.has_sorted_indices),
+        }
+    elif isinstance(item,dict):
+        return {'dict': [
+            [_encodeTree(key,arrays),_encodeTree(value,arrays)]
+            for key,value in item.items()
+        ]}
+    elif isinstance(item,(list,tuple)):
+        return {
+            'list': [_encodeTree(value,arrays) for value in item],
+            'tuple': isinstance(item,tuple),
+        }
+    else:
+        raise TypeError('Cannot checkpoint a %s' % type(item).__name__)
+
+def _decodeTree(node,directory):
+    if 'value' in node:
+        return node['value']
+    elif 'array' in node:
+        return np.load(os.path.join(directory,'%s.npy' % node['array']),mmap_mode='r')
+    elif 'csr' in node:
+        matrix=csr_matrix(
+            tuple(_decodeTree(component,directory) for component in node['csr']),
+            shape=tuple(node['shape']),
+            copy=False,
+        )
+        # spares scipy an in-place sort of read-only arrays
+        matrix.has_sorted_indices=node['sorted']
+        return matrix
+    elif 'dict' in node:
+        return {
+            _decodeTree(key,directory): _decodeTree(value,directory)
+            for key,value in node['dict']
+        }
+    else:
+        items=[_decodeTree(value,directory) for value in node['list']]
+        return tuple(items) if node['tuple'] else items
+
+def _writeEntry(directory,entryName,arrays,manifest):
+    '''
+        the arrays and the manifest into directory/entryName,
+        through a temporary directory
+    '''
+    tempDirectory=tempfile.mkdtemp(dir=directory,prefix='.tmp-')
+    try:
+        for arrayName,array in arrays.items():
+            np.save(os.path.join(tempDirectory,'%s.npy' % arrayName),array)
+        with open(os.path.join(tempDirectory,'manifest.json'),'w') as manifestFile:
+            json.dump(dict(manifest,version=CHECKPOINT_VERSION),manifestFile)
+        entryDirectory=os.path.join(directory,entryName)
+        if os.path.isdir(entryDirectory):
+            shutil.rmtree(entryDirectory,ignore_errors=True)
+        os.replace(tempDirectory,entryDirectory)
+    except OSError:
+        shutil.rmtree(tempDirectory,ignore_errors=True)
+        raise
+
+def _readManifest(entryDirectory):
+    '''
+        the manifest of an entry, None if absent or not valid
+    '''
+    try:
+        with open(os.path.join(entryDirectory,'manifest.json')) as manifestFile:
+            manifest=json.load(manifestFile)
+    except (OSError,ValueError):
+        return None
+    return manifest if manifest.get('version')==CHECKPOINT_VERSION else None
+
+def _stateNames(directory):
+    return sorted(
+        entryName
+        for entryName in os.listdir(directory)
+        if entryName.startswith('state-')
+    )
+
+class CheckpointWriter():
+    '''
+        writes the checkpoints of a run into directory
+        (see the module docstring); close() writes the
+        checkpoint still pending, if any, and stops the thread.
+        Errors of the background writes are kept in lastError
+    '''
+    def __init__(self,directory,keep=2):
+        self.directory=directory
+        self.keep=keep
+        os.makedirs(self.directory,exist_ok=True)
+        self.condition=threading.Condition()
+        self.pending=None
+        self.closing=False
+        self.lastError=None
+        # the operator keys whose operators are already on disk
+        self.writtenOperatorKeys=set(
+            entryName[len('operators-'):]
+            for entryName in os.listdir(self.directory)
+            if entryName.startswith('operators-')
+            and _readManifest(os.path.join(self.directory,entryName)) is not None
+        )
+        self.thread=threading.Thread(target=self._writeLoop,daemon=True)
+        self.thread.start()
+
+    def save(self,frame,arrays,values,operators=None):
+        '''
+            schedules a checkpoint for frame: arrays (name -> array)
+            are copied now, values must be json-able. operators is
+            an optional (key, map name -> operator), as given by
+            operatorSnapshot: the operators are copied (and written)
+            only if no earlier checkpoint holds the same key, and
+            left out if they cannot be stored
+        '''
+        snapshot={
+            'frame': frame,
+            'arrays': {name: np.array(array) for name,array in arrays.items()},
+            'values': values,
+            'operatorKey': None,
+            'operatorTree': None,
+        }
+        if operators is not None:
+            operatorKey,operatorMap=operators
+            if operatorKey in self.writtenOperatorKeys:
+                snapshot['operatorKey']=operatorKey
+            else:
+                operatorArrays={}
+                try:
+                    snapshot['operatorTree']=(
+                        _encodeTree(operatorMap,operatorArrays),
+                        operatorArrays,
+                    )
+                    snapshot['operatorKey']=operatorKey
+                except TypeError:
+                    pass
+        with self.condition:
+            self.pending=snapshot
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closing=True
+            self.condition.notify()
+        self.thread.join()
+
+    def _writeLoop(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closing:
+                    self.condition.wait()
+                snapshot,self.pending=self.pending,None
+                if snapshot is None:
+                    return
+            try:
+                self._write(snapshot)
+            except OSError as error:
+                self.lastError=error
+
+    def _write(self,snapshot):
+        operatorKey=snapshot['operatorKey']
+        if snapshot['operatorTree'] is not None and operatorKey not in self.writtenOperatorKeys:
+            operatorTree,operatorArrays=snapshot['operatorTree']
+            _writeEntry(
+                self.directory,
+                'operators-%s' % operatorKey,
+                operatorArrays,
+                {'tree': operatorTree},
+            )
+            self.writtenOperatorKeys.add(operatorKey)
+        _writeEntry(
+            self.directory,
+            'state-%09i' % snapshot['frame'],
+            snapshot['arrays'],
+            {
+                'frame': snapshot['frame'],
+                'arrays': list(snapshot['arrays'].keys()),
+                'values': snapshot['values'],
+                'operatorKey': operatorKey,
+            },
+        )
+        self._prune()
+
+    def _prune(self):
+        '''
+            removes all but the latest keep checkpoints,
+            and the operators none of these refers to
+        '''
+        stateNames=_stateNames(self.directory)
+        for stateName in stateNames[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory,stateName),ignore_errors=True)
+        usedKeys=set()
+        for stateName in stateNames[-self.keep:]:
+            manifest=_readManifest(os.path.join(self.directory,stateName))
+            if manifest is not None:
+                usedKeys.add(manifest['operatorKey'])
+        for operatorKey in list(self.writtenOperatorKeys-usedKeys):
+            shutil.rmtree(
+                os.path.join(self.directory,'operators-%s' % operatorKey),
+                ignore_errors=True,
+            )
+            self.writtenOperatorKeys.discard(operatorKey)
+
+def loadLatestCheckpoint(directory):
+    '''
+        the latest valid checkpoint in directory, None if there is none,
+        as a map with keys:
+            frame, values
+            arrays       name -> array (memory-mapped, read-only)
+            operators    None or (key, map name -> operator), arrays
+                         and sparse matrices memory-mapped (read-only)
+    '''
+    if not os.path.isdir(directory):
+        return None
+    for stateName in reversed(_stateNames(directory)):
+        stateDirectory=os.path.join(directory,stateName)
+        manifest=_readManifest(stateDirectory)
+        if manifest is None:
+            continue
+        try:
+            arrays={
+                arrayName: np.load(os.path.join(stateDirectory,'%s.npy' % arrayName),mmap_mode='r')
+                for arrayName in manifest['arrays']
+            }
+        except (OSError,ValueError):
+            continue
+        operators=None
+        if manifest['operatorKey'] is not None:
+            operatorDirectory=os.path.join(directory,'operators-%s' % manifest['operatorKey'])
+            operatorManifest=_readManifest(operatorDirectory)
+            if operatorManifest is not None:
+                try:
+                    operators=(
+                        manifest['operatorKey'],
+                        _decodeTree(operatorManifest['tree'],operatorDirectory),
+                    )
+                except (OSError,ValueError):
+                    operators=None
+        return {
+            'frame': manifest['frame'],
+            'values': manifest['values'],
+            'arrays': arrays,
+            'operators': operators,
+        }
+    return None
+
+def resumableCheckpoint(directory,parameters):
+    '''
+        the latest checkpoint in directory (as loadLatestCheckpoint),
+        which must have been saved with values['parameters'] equal
+        to parameters (a json-able map), else ValueError
+    '''
+    checkpoint=loadLatestCheckpoint(directory)
+    if checkpoint is not None:
+        savedParameters=checkpoint['values'].get('parameters')
+        # (through json, as saved)
+        if savedParameters!=json.loads(json.dumps(parameters)):
+            raise ValueError('The checkpoint in "%s" is for other parameters (%s)' % (
+                directory,
+                savedParameters,
+            ))
+    return checkpoint
@@ -0,0 +1,424 @@
+'''
+    kernels.py : numerical building blocks shared by the one- and
+    two-dimensional integrators, writing into arrays given by the
+    caller instead of returning new ones. They allocate no arrays of
+    their own; numpy still buffers ufuncs through temporary arrays
+    when they act on strided (non-contiguous) views, which is noted
+    where it applies.
+'''
+
+import numpy as np
+
+try:
+    # the csr kernels writing (accumulating) into a given output array:
+    # scipy's private module, whose signatures have no stability
+    # guarantee (checked below, requirements.txt pins the tested range)
+    from scipy.sparse._sparsetools import csr_matvec, csr_matvecs
+except ImportError:
+    csr_matvec=None
+    csr_matvecs=None
+
+def _csrKernelsWork():
+    '''
+        whether csr_matvec, csr_matvecs give matrix.dot on a small
+        real and complex matrix: any failure (e.g. a changed signature)
+        makes sparseMatVecInto fall back to the ordinary product
+    '''
+    from scipy.sparse import csr_matrix
+    matrix=csr_matrix(np.array([[2.0,0.0,-1.0],[0.0,0.0,0.0],[-1.0,3.0,0.5]]))
+    block=np.arange(6.0).reshape((3,2))
+    try:
+        for dtype in (float,complex):
+            typedMatrix=matrix.astype(dtype)
+            typedBlock=block.astype(dtype)*(1+1j if dtype is complex else 1)
+            for vector in (typedBlock[:,0].copy(),typedBlock):
+                out=np.full(vector.shape,np.nan,dtype=dtype)
+                _csrKernelInto(typedMatrix,vector,out)
+                if not np.allclose(out,typedMatrix.dot(vector),rtol=1e-12,atol=0):
+                    return False
+    except Exception:
+        return False
+    return True
+
+def _csrKernelInto(matrix,vector,out):
+    out.fill(0)
+    if vector.ndim==1:
+        csr_matvec(
+            matrix.shape[0],
+            matrix.shape[1],
+            matrix.indptr,
+            matrix.indices,
+            matrix.data,
+            vector,
+            out,
+        )
+    else:
+        csr_matvecs(
+            matrix.shape[0],
+            matrix.shape[1],
+            vector.shape[1],
+            matrix.indptr,
+            matrix.indices,
+            matrix.data,
+            vector,
+            out,
+        )
+
+if csr_matvec is not None and not _csrKernelsWork():
+    csr_matvec=None
+    csr_matvecs=None
+
+def sparseMatVecInto(matrix,vector,out):
+    '''
+        out <- matrix . vector, for a csr matrix, with no allocations
+        when scipy's csr kernels can be used (they passed the check
+        at import, same dtype throughout), otherwise through the
+        ordinary (allocating) product.
+        vector can also be a (n,K) block of K vectors (C-ordered,
+        as out), which is then done in a single sweep over the matrix.
+        Returns out.
+    '''
+    if (
+        csr_matvec is None or
+        matrix.dtype!=vector.dtype or
+        matrix.dtype!=out.dtype or
+        not vector.flags['C_CONTIGUOUS'] or
+        not out.flags['C_CONTIGUOUS']
+    ):
+        np.copyto(out,matrix.dot(vector))
+    else:
+        _csrKernelInto(matrix,vector,out)
+    return out
+
+def columnVdot(a,b):
+    '''
+        vdot of a batch, member by member: the members
+        run along the last axis of a and b, whose other
+        axes are all summed over
+    '''
+    nMembers=a.shape[-1]
+    return np.einsum(
+        'ik,ik->k',
+        a.reshape((-1,nMembers)).conjugate(),
+        b.reshape((-1,nMembers)),
+    )
+
+def diagonalPositions(matrix):
+    '''
+        positions, within matrix.data, of the diagonal entries
+        of a csr matrix with sorted indices and a full diagonal
+        (so that the diagonal can be rewritten in place)
+    '''
+    matRows=np.repeat(
+        np.arange(matrix.shape[0]),
+        np.diff(matrix.indptr),
+    )
+    positions=np.nonzero(matrix.indices==matRows)[0]
+    if len(positions)!=matrix.shape[0]:
+        raise ValueError('Matrix lacks a full diagonal')
+    return positions
+
+def trackPotentialChanges(cachedPotential,vPotential):
+    '''
+        compares vPotential with cachedPotential, the copy kept
+        from the previous call (None the first time), and brings
+        the copy up to date. The contents are compared, not the
+        identity, as callers may refill the same array in place.
+        Returns (cachedPotential, changedSites), the latter being
+        the indices of the entries that changed, or None if
+        there was nothing to compare with
+    '''
+    if cachedPotential is None or cachedPotential.shape!=vPotential.shape:
+        return np.array(vPotential,dtype=float),None
+    changedSites=np.flatnonzero(cachedPotential!=vPotential)
+    cachedPotential[changedSites]=vPotential[changedSites]
+    return cachedPotential,changedSites
+
+def mod2Into(psi,out,work):
+    '''
+        out <- |psi|^2 for a complex psi, work being a real
+        array of the same shape. Returns out
+    '''
+    np.multiply(psi.real,psi.real,out=out)
+    np.multiply(psi.imag,psi.imag,out=work)
+    np.add(out,work,out=out)
+    return out
+
+def expectationValue(phi,operatorPhi):
+    '''
+        <phi|A|phi> (not normalised) given A.phi,
+        or one per member for a batch (members along the last axis)
+    '''
+    if phi.ndim==1:
+        return np.vdot(phi,operatorPhi)
+    else:
+        return columnVdot(phi,operatorPhi)
+
+def makeRK4Workspace(template):
+    '''
+        the buffers needed by rk4StepInPlace, shaped as template
+    '''
+    return {
+        'k': np.zeros(template.shape,dtype=complex),
+        'stage': np.zeros(template.shape,dtype=complex),
+        'acc': np.zeros(template.shape,dtype=complex),
+    }
+
+def rk4StepInPlace(applyFInto,phi,workspace,deltaTau,batch=False):
+    '''
+        one RK4 step of d phi/d tau = F[phi], updating phi in place.
+            applyFInto(x,out) must write F[x] into out
+            workspace is as returned by makeRK4Workspace
+        No temporaries are allocated here: the stages are built
+        in the workspace with in-place ufuncs.
+        Returns <phi|F|phi> of the incoming phi (i.e. -i<phi|H|phi>);
+        with batch=True, phi holds a batch of wavefunctions along
+        its last axis and an array of one <phi|F|phi> per member
+        is returned.
+    '''
+    k=workspace['k']
+    stage=workspace['stage']
+    acc=workspace['acc']
+    halfDeltaTau=0.5*deltaTau
+    # k1
+    applyFInto(phi,k)
+    phiDotK1=columnVdot(phi,k) if batch else np.vdot(phi,k)
+    np.copyto(acc,k)
+    np.multiply(k,halfDeltaTau,out=stage)
+    np.add(stage,phi,out=stage)
+    # k2
+    applyFInto(stage,k)
+    np.multiply(k,2.0,out=stage)
+    np.add(acc,stage,out=acc)
+    np.multiply(k,halfDeltaTau,out=stage)
+    np.add(stage,phi,out=stage)
+    # k3
+    applyFInto(stage,k)
+    np.multiply(k,2.0,out=stage)
+    np.add(acc,stage,out=acc)
+    np.multiply(k,deltaTau,out=stage)
+    np.add(stage,phi,out=stage)
+    # k4
+    applyFInto(stage,k)
+    np.add(acc,k,out=acc)
+    # phi <- phi + deltaTau*(k1+2k2+2k3+k4)/6
+    np.multiply(acc,deltaTau/6.0,out=acc)
+    np.add(phi,acc,out=phi)
+    return phiDotK1
+
+def secondDifferenceInto(Phi,periodicBC,out):
+    '''
+        out <- 2*Phi[i]-Phi[i-1]-Phi[i+1] along the first axis
+        of Phi (1D, or 2D for a batch of lines), with slice
+        arithmetic only: no padded copies, and no allocations
+        for contiguous lines. Periodic BC wrap around; fixed BC
+        leave zero on the first and last entries.
+        For the other axis of a 2D array pass transposed views
+        (strided: numpy then buffers through temporary arrays).
+    '''
+    inner=slice(1,-1)
+    np.add(Phi[:-2],Phi[2:],out=out[inner])
+    np.subtract(Phi[inner],out[inner],out=out[inner])
+    np.add(out[inner],Phi[inner],out=out[inner])
+    first=slice(0,1)
+    last=slice(-1,None)
+    if periodicBC:
+        np.add(Phi[last],Phi[1:2],out=out[first])
+        np.subtract(Phi[first],out[first],out=out[first])
+        np.add(out[first],Phi[first],out=out[first])
+        np.add(Phi[-2:-1],Phi[first],out=out[last])
+        np.subtract(Phi[last],out[last],out=out[last])
+        np.add(out[last],Phi[last],out=out[last])
+    else:
+        out[first]=0
+        out[last]=0
+    return out
+
+def _cyclicShiftBlocks(size,shift):
+    '''
+        pairs (outSlice,inSlice) such that out[outSlice] pairs with
+        in[inSlice] for out[i]<->in[(i+shift)%size]
+    '''
+    shift%=size
+    if shift==0:
+        return [(slice(None),slice(None))]
+    return [
+        (slice(0,size-shift),slice(shift,None)),
+        (slice(size-shift,None),slice(0,shift)),
+    ]
+
+def shiftedInto(Phi,shift,out,weight=None):
+    '''
+        out[x,y] = Phi[(x+dx)%Nx,(y+dy)%Ny] (times weight, if given),
+        shift=(dx,dy): the cyclic shift is copied by (at most four)
+        rectangular slices, the weight then applied to the whole of out.
+        Only copies touch the strided slices (ufuncs on them would
+        buffer through temporary arrays): with out contiguous nothing
+        is allocated. Trailing axes (e.g. a batch) are carried along
+    '''
+    for outX,inX in _cyclicShiftBlocks(Phi.shape[0],shift[0]):
+        for outY,inY in _cyclicShiftBlocks(Phi.shape[1],shift[1]):
+            np.copyto(out[outX,outY],Phi[inX,inY])
+    if weight is not None:
+        np.multiply(out,weight,out=out)
+    return out
+
+def shiftedAddInto(Phi,shift,out,scratch):
+    '''
+        out[x,y] += Phi[(x+dx)%Nx,(y+dy)%Ny]: the shift is copied
+        into scratch (as shiftedInto), then added to out, both
+        contiguous arrays of the shape of Phi
+    '''
+    shiftedInto(Phi,shift,scratch)
+    np.add(out,scratch,out=out)
+    return out
+
+# Dormand-Prince 5(4) tableau: stage coefficients (the last row
+# gives the fifth-order solution, whose F is the next first stage)
+# and differences between the fifth- and fourth-order weights
+DORMAND_PRINCE_A=[
+    [],
+    [1.0/5.0],
+    [3.0/40.0,9.0/40.0],
+    [44.0/45.0,-56.0/15.0,32.0/9.0],
+    [19372.0/6561.0,-25360.0/2187.0,64448.0/6561.0,-212.0/729.0],
+    [9017.0/3168.0,-355.0/33.0,46732.0/5247.0,49.0/176.0,-5103.0/18656.0],
+    [35.0/384.0,0.0,500.0/1113.0,125.0/192.0,-2187.0/6784.0,11.0/84.0],
+]
+DORMAND_PRINCE_E=[
+    71.0/57600.0,
+    0.0,
+    -71.0/16695.0,
+    71.0/1920.0,
+    -17253.0/339200.0,
+    22.0/525.0,
+    -1.0/40.0,
+]
+
+def makeDormandPrinceWorkspace(template):
+    '''
+        the buffers needed by dormandPrincePropagate, shaped as template
+    '''
+    return {
+        'k': [np.zeros(template.shape,dtype=complex) for _ in DORMAND_PRINCE_E],
+        'stage': np.zeros(template.shape,dtype=complex),
+        'scratch': np.zeros(template.shape,dtype=complex),
+        'error': np.zeros(template.shape,dtype=complex),
+        'weights': np.zeros(template.shape),
+        'ratios': np.zeros(template.shape),
+    }
+
+def _dormandPrinceTrialStep(applyFInto,phi,deltaTau,workspace,relTolerance,absTolerance):
+    '''
+        one trial step from phi, with F[phi] already in k[0]:
+        leaves the fifth-order solution in 'stage', its F in k[6],
+        and returns the scaled RMS norm of the error estimate
+        (accept the step if <=1)
+    '''
+    k=workspace['k']
+    stage=workspace['stage']
+    scratch=workspace['scratch']
+    for i in range(1,len(DORMAND_PRINCE_A)):
+        np.copyto(stage,phi)
+        for j,aCoefficient in enumerate(DORMAND_PRINCE_A[i]):
+            if aCoefficient!=0:
+                np.multiply(k[j],aCoefficient*deltaTau,out=scratch)
+                np.add(stage,scratch,out=stage)
+        applyFInto(stage,k[i])
+    error=workspace['error']
+    error.fill(0)
+    for j,eCoefficient in enumerate(DORMAND_PRINCE_E):
+        if eCoefficient!=0:
+            np.multiply(k[j],eCoefficient*deltaTau,out=scratch)
+            np.add(error,scratch,out=error)
+    # error/(absTolerance+relTolerance*max(|phi|,|newPhi|)), entry by entry
+    weights=workspace['weights']
+    ratios=workspace['ratios']
+    np.abs(phi,out=weights)
+    np.abs(stage,out=ratios)
+    np.maximum(weights,ratios,out=weights)
+    np.multiply(weights,relTolerance,out=weights)
+    np.add(weights,absTolerance,out=weights)
+    np.abs(error,out=ratios)
+    np.divide(ratios,weights,out=ratios)
+    return (np.vdot(ratios,ratios)/ratios.size)**0.5
+
+def dormandPrincePropagate(
+    applyFInto,
+    phi,
+    tau,
+    workspace,
+    deltaTauGuess,
+    relTolerance=1e-6,
+    absTolerance=1e-8,
+    safetyFactor=0.9,
+    minStepFactor=0.2,
+    maxStepFactor=5.0,
+):
+    '''
+        advances phi in place by exactly tau, solving d phi/d tau = F[phi]
+        with the embedded Dormand-Prince 5(4) pair: the step starts at
+        deltaTauGuess and adapts so that the error estimate of each step
+        stays within the tolerances (the last step is shortened to land
+        on tau). F is evaluated six times per trial step, as the last
+        evaluation of an accepted step is the first of the next one.
+            applyFInto(x,out) must write F[x] into out
+            workspace is as returned by makeDormandPrinceWorkspace
+
+        Returns a dict with
+            'accepted', 'rejected' (trial steps),
+            'fEvaluations',
+            'deltaTau' (the step to start the next call with),
+            'phiDotF' (<phi|F|phi> of the incoming phi)
+    '''
+    k=workspace['k']
+    applyFInto(phi,k[0])
+    info={
+        'accepted': 0,
+        'rejected': 0,
+        'fEvaluations': 1,
+        'phiDotF': np.vdot(phi,k[0]),
+    }
+    deltaTau=deltaTauGuess
+    tauLeft=tau
+    while tauLeft>1e-12*tau:
+        thisDeltaTau=min(deltaTau,tauLeft)
+        errorNorm=_dormandPrinceTrialStep(
+            applyFInto,
+            phi,
+            thisDeltaTau,
+            workspace,
+            relTolerance,
+            absTolerance,
+        )
+        info['fEvaluations']+=len(DORMAND_PRINCE_A)-1
+        if not np.isfinite(errorNorm):
+            if not np.all(np.isfinite(phi)):
+                raise ValueError('Non-finite phi in the adaptive propagation')
+            # e.g. an overflow over a far too long step: shrink as much
+            # as allowed (ending in the underflow error if it persists)
+            stepFactor=minStepFactor
+        elif errorNorm>0:
+            stepFactor=safetyFactor*errorNorm**(-0.2)
+        else:
+            stepFactor=maxStepFactor
+        if errorNorm<=1.0:
+            info['accepted']+=1
+            tauLeft-=thisDeltaTau
+            np.copyto(phi,workspace['stage'])
+            # first-same-as-last: F[newPhi] is the next k[0]
+            k[0],k[-1]=k[-1],k[0]
+            nextDeltaTau=thisDeltaTau*min(maxStepFactor,stepFactor)
+            if thisDeltaTau<deltaTau:
+                # a step shortened to reach tau says little on the next one
+                deltaTau=max(deltaTau,nextDeltaTau)
+            else:
+                deltaTau=nextDeltaTau
+        else:
+            # (a non-finite errorNorm ends up here as well, shrinking the step)
+            info['rejected']+=1
+            deltaTau=thisDeltaTau*min(1.0,max(minStepFactor,stepFactor))
+            if not deltaTau>1e-12*tau:
+                raise ValueError('Adaptive step size underflow (error norm %s)' % errorNorm)
+    info['deltaTau']=deltaTau
+    return info
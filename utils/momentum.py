@@ -0,0 +1,92 @@
+'''
+    momentum.py : the momentum-space view of phi, for oneD and twoD.
+
+    MomentumTransform builds once everything depending only on the
+    grid (wavenumber axes, the fftshift permutation, the sites
+    above the high-k cutoff, the work buffers), so that each frame
+    costs one FFT (whose plan pocketfft keeps across calls) and a
+    few in-place reductions. The same transform gives both the
+    distribution |phi(k)|^2 to display and the fraction of the norm
+    at grid-scale wavenumbers, an early sign of the numerical noise
+    that the smoothing of phi is meant to remove.
+'''
+
+import numpy as np
+
+try:
+    # numpy>=2.0 transforms into a given buffer
+    np.fft.fftn(np.zeros(1,dtype=complex),out=np.zeros(1,dtype=complex))
+    FFT_INTO=True
+except TypeError:
+    FFT_INTO=False
+
+class MomentumTransform():
+    '''
+        |phi(k)|^2 for phi on a grid of the given shape
+        (phi can be passed flattened, [x][y] -> x*wfSizeY+y),
+        deltaLambdas being the spacings along each axis.
+
+        The high-k sites are those with, along at least one axis,
+        |k| above highKCutoff times the largest (grid-scale)
+        wavenumber pi/deltaLambda: the same fractions q as in
+        twoD.dynamics.spectralFilterMask.
+
+        After update(phi):
+            lastHighKFraction   fraction of the norm on the high-k sites
+            distribution()      |phi(k)|^2/norm, centred (fftshift order),
+                                on the axes kAxes
+    '''
+    def __init__(self,shape,deltaLambdas,highKCutoff=0.8):
+        self.shape=tuple(shape)
+        self.highKCutoff=highKCutoff
+        # centred wavenumbers along each axis, for plotting
+        self.kAxes=[
+            2*np.pi*np.fft.fftshift(np.fft.fftfreq(size,d=deltaLambda))
+            for size,deltaLambda in zip(self.shape,deltaLambdas)
+        ]
+        self.shiftIndex=np.fft.fftshift(
+            np.arange(np.prod(self.shape)).reshape(self.shape)
+        ).reshape(-1)
+        # |fftfreq| is at most 1/2, the grid-scale wavenumber
+        axisFractions=[2*np.abs(np.fft.fftfreq(size)) for size in self.shape]
+        highK=np.zeros(self.shape,dtype=bool)
+        for axis,axisFraction in enumerate(axisFractions):
+            highK|=(axisFraction>highKCutoff).reshape(
+                [-1 if otherAxis==axis else 1 for otherAxis in range(len(self.shape))]
+            )
+        self.highKSites=np.flatnonzero(highK)
+        self.phiK=np.zeros(self.shape,dtype=complex)
+        self.mod2K=np.zeros(self.shape)
+        self.shiftedMod2K=np.zeros(np.prod(self.shape))
+        self.lastNorm2K=None
+        self.lastHighKFraction=None
+
+    def update(self,phi):
+        '''
+            transforms phi (one FFT) and refreshes lastHighKFraction.
+            Returns self
+        '''
+        phi=phi.reshape(self.shape)
+        if FFT_INTO:
+            np.fft.fftn(phi,out=self.phiK)
+        else:
+            np.copyto(self.phiK,np.fft.fftn(phi))
+        np.multiply(self.phiK.real,self.phiK.real,out=self.mod2K)
+        self.mod2K+=self.phiK.imag**2
+        self.lastNorm2K=self.mod2K.sum()
+        self.lastHighKFraction=(
+            self.mod2K.reshape(-1)[self.highKSites].sum()/self.lastNorm2K
+        )
+        return self
+
+    def highKFraction(self,phi):
+        return self.update(phi).lastHighKFraction
+
+    def distribution(self):
+        '''
+            |phi(k)|^2 of the last update, normalised to sum one
+            and centred, with the shape of the grid (a reused buffer)
+        '''
+        np.take(self.mod2K.reshape(-1),self.shiftIndex,out=self.shiftedMod2K)
+        self.shiftedMod2K/=self.lastNorm2K
+        return self.shiftedMod2K.reshape(self.shape)
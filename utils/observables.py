@@ -0,0 +1,378 @@
+'''
+    observables.py : physical observables of phi evaluated
+    together once per frame, and their streaming to disk.
+
+    Every observable is a linear functional of a few per-site
+    densities of phi:
+        'density'       |phi|^2
+        're<operator>'  Re(phi^* (A phi))
+        'im<operator>'  Im(phi^* (A phi))
+    for the operators A given to the set (e.g. forward
+    differences for the probability flow, second differences
+    for the kinetic energy), so that, once registered with its
+    weight array, each observable is a weighted sum of densities.
+    A frame computes only the densities (and operator products)
+    that the registered observables use: one sparse product for
+    all the operators given as matrices (stacked; real matrices
+    act on the real and imaginary parts of phi in the same sweep),
+    one call for each given as an in-place stencil, a few ufuncs
+    per density, then one dense product per density for the
+    weights spanning the grid (e.g. the positions) and one small
+    gather for each of the others (e.g. the currents across a segment).
+    The results are expectation values, i.e. divided by the norm
+    of phi (which need not be normalised).
+
+    Spreads (standard deviations) are derived from pairs of
+    registered moments <a>, <a^2>.
+
+    ObservablesWriter streams the per-frame values to chunked
+    .npy files from a background thread.
+'''
+
+import os
+import json
+import queue
+import threading
+import tempfile
+import numpy as np
+from scipy.sparse import (
+    csr_matrix,
+    vstack,
+)
+
+from utils.kernels import (
+    sparseMatVecInto,
+)
+
+NORM_NAME='norm2'
+# terms on more sites than this fraction are evaluated as dense rows
+DENSE_TERM_FRACTION=0.25
+# the column of the frame numbers, if written (see loadObservables)
+FRAME_NAME='frame'
+
+def forwardDifferenceInto(phi,axis,periodicBC,out):
+    '''
+        out <- phi[i+1]-phi[i] along axis of phi and out (arrays
+        of the grid shape, e.g. reshaped views): cyclic with periodic
+        BC, else phi is zero beyond the last site. Returns out
+    '''
+    size=phi.shape[axis]
+    head=(slice(None),)*axis
+    np.subtract(phi[head+(slice(1,size),)],phi[head+(slice(0,size-1),)],out=out[head+(slice(0,size-1),)])
+    if periodicBC:
+        np.subtract(phi[head+(slice(0,1),)],phi[head+(slice(size-1,size),)],out=out[head+(slice(size-1,size),)])
+    else:
+        np.negative(phi[head+(slice(size-1,size),)],out=out[head+(slice(size-1,size),)])
+    return out
+
+class ObservableSet():
+    '''
+        a set of observables sharing the fused evaluation.
+        operators maps a name to either a (nSites,nSites) sparse
+        matrix or a function f(phi,out) writing A phi into out
+        (the densities 're<name>', 'im<name>' become available);
+        deltaVolume is the volume element
+    '''
+    def __init__(self,nSites,deltaVolume,operators):
+        self.nSites=nSites
+        self.deltaVolume=deltaVolume
+        self.operators=operators
+        self.densityNames={'density'}|{
+            '%s%s' % (part,operatorName)
+            for operatorName in operators.keys()
+            for part in ('re','im')
+        }
+        # name -> list of terms (densityName, columns, values),
+        # columns None for the terms on all sites
+        self.rows={}
+        # name -> (meanName, squareName)
+        self.spreads={}
+        self.register(NORM_NAME,[('density',np.ones(nSites))])
+        self.evaluationPlan=None
+
+    def names(self):
+        '''
+            the names of the evaluated quantities, in order
+        '''
+        return list(self.rows.keys())+list(self.spreads.keys())
+
+    def register(self,name,terms,keepZeros=False):
+        '''
+            the observable sum over the terms (densityName, weights)
+            of sum_s weights[s]*density[s]*deltaVolume.
+            Terms on more than DENSE_TERM_FRACTION of the sites, or
+            with keepZeros, are kept on all sites (and later
+            updateWeights, e.g. a changing potential, are in place)
+        '''
+        row=[]
+        for densityName,weights in terms:
+            if densityName not in self.densityNames:
+                raise ValueError('Unknown density "%s"' % densityName)
+            weights=np.asarray(weights,dtype=float).reshape(self.nSites)
+            columns=np.flatnonzero(weights)
+            if keepZeros or len(columns)>DENSE_TERM_FRACTION*self.nSites:
+                row.append((densityName,None,weights*self.deltaVolume))
+            else:
+                row.append((densityName,columns,weights[columns]*self.deltaVolume))
+        self.rows[name]=row
+        self.evaluationPlan=None
+
+    def registerSpread(self,name,meanName,squareName):
+        self.spreads[name]=(meanName,squareName)
+
+    def updateWeights(self,name,weights):
+        '''
+            new weights for a single-term observable: in place
+            if it is kept on all sites, else with a new registration
+        '''
+        (densityName,columns,_),=self.rows[name]
+        if columns is None:
+            values=np.asarray(weights,dtype=float).reshape(self.nSites)*self.deltaVolume
+            self.rows[name]=[(densityName,None,values)]
+            if self.evaluationPlan is not None:
+                block,blockRow=self.evaluationPlan['denseRows'][name]
+                block[blockRow]=values
+        else:
+            self.register(name,[(densityName,weights)])
+
+    def _assemble(self):
+        '''
+            the evaluation plan: the operators and densities which
+            the registered terms need (only those are computed),
+            for each density the dense block of the weights of the
+            terms on all sites and the list of the other terms
+        '''
+        rowIndices={name: rowIndex for rowIndex,name in enumerate(self.rows.keys())}
+        usedDensities=['density']+sorted(
+            {densityName for row in self.rows.values() for densityName,_,_ in row}-{'density'}
+        )
+        usedOperators=sorted({densityName[2:] for densityName in usedDensities[1:]})
+        # the matrices first, so that their products are one block
+        usedOperators.sort(key=lambda operatorName: callable(self.operators[operatorName]))
+        matrices=[
+            self.operators[operatorName]
+            for operatorName in usedOperators
+            if not callable(self.operators[operatorName])
+        ]
+        denseBlocks=[]
+        sparseTerms=[]
+        denseRows={}
+        for densityIndex,densityName in enumerate(usedDensities):
+            # name -> summed weights of its terms on all sites
+            denseWeights={}
+            for name,row in self.rows.items():
+                for termDensityName,columns,values in row:
+                    if termDensityName!=densityName:
+                        continue
+                    if columns is None:
+                        denseWeights[name]=denseWeights.get(name,0)+values
+                    else:
+                        sparseTerms.append((densityIndex,rowIndices[name],columns,values))
+            if denseWeights:
+                block=np.array(list(denseWeights.values()))
+                denseBlocks.append((
+                    densityIndex,
+                    np.array([rowIndices[name] for name in denseWeights.keys()]),
+                    block,
+                ))
+                for blockRow,name in enumerate(denseWeights.keys()):
+                    if len(self.rows[name])==1:
+                        denseRows[name]=(block,blockRow)
+        realMatrices=not any(np.iscomplexobj(matrix) for matrix in matrices)
+        self.evaluationPlan={
+            # real matrices act on the real and imaginary parts apart
+            'realMatrices': realMatrices,
+            'stackedOperators': None if not matrices else csr_matrix(
+                vstack(matrices),
+                dtype=float if realMatrices else complex,
+            ),
+            'stencils': [
+                (operatorIndex,self.operators[operatorName])
+                for operatorIndex,operatorName in enumerate(usedOperators)
+                if callable(self.operators[operatorName])
+            ],
+            # (part, operator index) for each density
+            'densityRecipes': [
+                (densityName[:2],usedOperators.index(densityName[2:]) if densityName!='density' else None)
+                for densityName in usedDensities
+            ],
+            'denseBlocks': denseBlocks,
+            'sparseTerms': sparseTerms,
+            'denseRows': denseRows,
+            'operatorPhis': np.zeros((len(usedOperators),self.nSites),dtype=complex),
+            'matrixParts': np.zeros((len(matrices)*self.nSites,2)),
+            'phiParts': np.zeros((2,self.nSites)),
+            'densities': np.zeros((len(usedDensities),self.nSites)),
+            'work': np.zeros(self.nSites),
+        }
+        # (re, im) of each operator applied to phi
+        operatorParts=[
+            (operatorPhi.real,operatorPhi.imag)
+            for operatorPhi in self.evaluationPlan['operatorPhis']
+        ]
+        if realMatrices:
+            matrixParts=self.evaluationPlan['matrixParts'].reshape((len(matrices),self.nSites,2))
+            for operatorIndex in range(len(matrices)):
+                operatorParts[operatorIndex]=(
+                    matrixParts[operatorIndex,:,0],
+                    matrixParts[operatorIndex,:,1],
+                )
+        self.evaluationPlan['operatorParts']=operatorParts
+
+    def evaluate(self,phi,**extraValues):
+        '''
+            a map name -> value of all observables (and spreads)
+            for phi, plus the extraValues passed (e.g. the energy
+            computed by the integrator)
+        '''
+        if self.evaluationPlan is None:
+            self._assemble()
+        plan=self.evaluationPlan
+        phi=np.ascontiguousarray(phi,dtype=complex)
+        phiRe,phiIm=plan['phiParts']
+        np.copyto(phiRe,phi.real)
+        np.copyto(phiIm,phi.imag)
+        stackedOperators=plan['stackedOperators']
+        if stackedOperators is not None and plan['realMatrices']:
+            # both parts in one sweep, phi seen as (nSites,2) floats
+            sparseMatVecInto(
+                stackedOperators,
+                phi.view(float).reshape((self.nSites,2)),
+                plan['matrixParts'],
+            )
+        elif stackedOperators is not None:
+            sparseMatVecInto(
+                stackedOperators,
+                phi,
+                plan['operatorPhis'].reshape(-1)[:stackedOperators.shape[0]],
+            )
+        for operatorIndex,stencil in plan['stencils']:
+            stencil(phi,plan['operatorPhis'][operatorIndex])
+        work=plan['work']
+        densities=plan['densities']
+        operatorParts=plan['operatorParts']
+        # Re, Im of phi^* (A phi) = (re A.re + im A.im), (re A.im - im A.re)
+        for density,(part,operatorIndex) in zip(densities,plan['densityRecipes']):
+            if operatorIndex is None:
+                np.multiply(phiRe,phiRe,out=density)
+                np.multiply(phiIm,phiIm,out=work)
+                np.add(density,work,out=density)
+            else:
+                operatorRe,operatorIm=operatorParts[operatorIndex]
+                if part=='re':
+                    np.multiply(phiRe,operatorRe,out=density)
+                    np.multiply(phiIm,operatorIm,out=work)
+                    np.add(density,work,out=density)
+                else:
+                    np.multiply(phiRe,operatorIm,out=density)
+                    np.multiply(phiIm,operatorRe,out=work)
+                    np.subtract(density,work,out=density)
+        rowValues=np.zeros(len(self.rows))
+        for densityIndex,blockRowIndices,block in plan['denseBlocks']:
+            rowValues[blockRowIndices]+=block.dot(densities[densityIndex])
+        for densityIndex,rowIndex,columns,values in plan['sparseTerms']:
+            rowValues[rowIndex]+=values.dot(densities[densityIndex][columns])
+        norm2=rowValues[0]
+        values={NORM_NAME: norm2}
+        for rowIndex,name in enumerate(self.rows.keys()):
+            if rowIndex>0:
+                values[name]=rowValues[rowIndex]/norm2
+        for name,(meanName,squareName) in self.spreads.items():
+            values[name]=max(0.0,values[squareName]-values[meanName]**2)**0.5
+        values.update(extraValues)
+        return values
+
+class ObservablesWriter():
+    '''
+        streams rows of observables to directory: the values are
+        queued by push and written by a background thread in chunks
+        of chunkFrames rows, each a (rows,len(names)) float .npy
+        (chunk-000000.npy, ...), moved in place once complete.
+        names.json lists the columns. close() flushes the last
+        (partial) chunk and stops the thread.
+        Chunks already in directory (e.g. of a run being resumed,
+        which must have the same names) are kept, new ones numbered
+        after them: with a FRAME_NAME column, loadObservables
+        then drops the rows superseded by the resumed run.
+    '''
+    def __init__(self,directory,names,chunkFrames=256):
+        self.directory=directory
+        self.names=list(names)
+        self.chunkFrames=chunkFrames
+        os.makedirs(self.directory,exist_ok=True)
+        self.nChunks=len(_observableChunkNames(self.directory))
+        if self.nChunks>0:
+            with open(os.path.join(self.directory,'names.json')) as namesFile:
+                if json.load(namesFile)!=self.names:
+                    raise ValueError('The observables in "%s" have other names' % self.directory)
+        else:
+            with open(os.path.join(self.directory,'names.json'),'w') as namesFile:
+                json.dump(self.names,namesFile)
+        self.rowQueue=queue.Queue()
+        self.thread=threading.Thread(target=self._writeLoop,daemon=True)
+        self.thread.start()
+
+    def push(self,values):
+        '''
+            queues a row (a map name -> value: missing names are NaN)
+        '''
+        self.rowQueue.put([values.get(name,np.nan) for name in self.names])
+
+    def close(self):
+        self.rowQueue.put(None)
+        self.thread.join()
+
+    def _writeLoop(self):
+        chunk=[]
+        while True:
+            row=self.rowQueue.get()
+            if row is None:
+                break
+            chunk.append(row)
+            if len(chunk)==self.chunkFrames:
+                self._writeChunk(chunk)
+                chunk=[]
+        if chunk:
+            self._writeChunk(chunk)
+
+    def _writeChunk(self,chunk):
+        fileDescriptor,tempName=tempfile.mkstemp(dir=self.directory,prefix='.tmp-',suffix='.npy')
+        with os.fdopen(fileDescriptor,'wb') as chunkFile:
+            np.save(chunkFile,np.array(chunk,dtype=float))
+        os.replace(tempName,os.path.join(self.directory,'chunk-%06i.npy' % self.nChunks))
+        self.nChunks+=1
+
+def _observableChunkNames(directory):
+    return sorted(
+        fileName
+        for fileName in os.listdir(directory)
+        if fileName.startswith('chunk-') and fileName.endswith('.npy')
+    )
+
+def loadObservables(directory):
+    '''
+        the time series written by an ObservablesWriter,
+        as a map name -> array (one entry per row).
+        With a FRAME_NAME column, the rows of a run followed by
+        a resumed one from frame f (frames going back to f) are
+        kept only up to frame f-1: the later run replaces the rest
+    '''
+    with open(os.path.join(directory,'names.json')) as namesFile:
+        names=json.load(namesFile)
+    chunkNames=_observableChunkNames(directory)
+    if chunkNames:
+        table=np.concatenate([
+            np.load(os.path.join(directory,chunkName))
+            for chunkName in chunkNames
+        ])
+    else:
+        table=np.zeros((0,len(names)))
+    if FRAME_NAME in names and len(table)>0:
+        frames=table[:,names.index(FRAME_NAME)]
+        # a row stays if all the following ones are of later frames
+        laterFrames=np.append(np.minimum.accumulate(frames[::-1])[::-1][1:],np.inf)
+        table=table[frames<laterFrames]
+    return {
+        name: table[:,nameIndex]
+        for nameIndex,name in enumerate(names)
+    }
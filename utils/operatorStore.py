@@ -0,0 +1,103 @@
+'''
+    operatorStore.py : on-disk cache of the sparse operators
+    that depend only on the grid and the physical parameters
+    (free-particle matrices, smoothing matrices...).
+
+    Each operator lives in its own directory, named after its kind
+    and a digest of its parameters, holding the csr components as
+    separate .npy files (an .npz could not be memory-mapped) and
+    a manifest.json written last. Loading memory-maps the arrays
+    (read-only), so that it costs milliseconds whatever the size.
+    An entry whose manifest does not match the store version,
+    the kind or the parameters is rebuilt and overwritten.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# to be increased whenever the layout or the operators' definitions change
+STORE_VERSION=1
+
+CSR_COMPONENTS=('data','indices','indptr')
+
+def operatorEntryDirectory(storeDirectory,kind,parameters):
+    digest=hashlib.blake2b(repr(parameters).encode(),digest_size=12).hexdigest()
+    return os.path.join(storeDirectory,'%s-%s' % (kind,digest))
+
+def _manifest(kind,parameters,matrix):
+    return {
+        'version': STORE_VERSION,
+        'kind': kind,
+        'parameters': repr(parameters),
+        'shape': list(matrix.shape),
+    }
+
+def loadOperator(storeDirectory,kind,parameters):
+    '''
+        the stored csr matrix for kind and parameters (its arrays
+        memory-mapped read-only), or None if absent or not valid
+    '''
+    entryDirectory=operatorEntryDirectory(storeDirectory,kind,parameters)
+    try:
+        with open(os.path.join(entryDirectory,'manifest.json')) as manifestFile:
+            manifest=json.load(manifestFile)
+        if (
+            manifest.get('version')!=STORE_VERSION or
+            manifest.get('kind')!=kind or
+            manifest.get('parameters')!=repr(parameters)
+        ):
+            return None
+        components=[
+            np.load(os.path.join(entryDirectory,'%s.npy' % component),mmap_mode='r')
+            for component in CSR_COMPONENTS
+        ]
+    except (OSError,ValueError):
+        return None
+    matrix=csr_matrix(tuple(components),shape=tuple(manifest['shape']),copy=False)
+    # stored sorted: this spares scipy an in-place sort of read-only arrays
+    matrix.has_sorted_indices=True
+    return matrix
+
+def storeOperator(storeDirectory,kind,parameters,matrix):
+    '''
+        writes the csr matrix into a temporary directory, then moved
+        in place of the entry: readers never see a partial entry.
+        Failures (e.g. a read-only store) are ignored
+    '''
+    matrix=csr_matrix(matrix)
+    matrix.sort_indices()
+    entryDirectory=operatorEntryDirectory(storeDirectory,kind,parameters)
+    try:
+        os.makedirs(storeDirectory,exist_ok=True)
+        tempDirectory=tempfile.mkdtemp(dir=storeDirectory,prefix='.tmp-')
+    except OSError:
+        return
+    try:
+        for component in CSR_COMPONENTS:
+            np.save(os.path.join(tempDirectory,'%s.npy' % component),getattr(matrix,component))
+        with open(os.path.join(tempDirectory,'manifest.json'),'w') as manifestFile:
+            json.dump(_manifest(kind,parameters,matrix),manifestFile)
+        if os.path.isdir(entryDirectory):
+            shutil.rmtree(entryDirectory,ignore_errors=True)
+        os.replace(tempDirectory,entryDirectory)
+    except OSError:
+        shutil.rmtree(tempDirectory,ignore_errors=True)
+
+def loadOrBuildOperator(storeDirectory,kind,parameters,builder):
+    '''
+        the operator for kind and parameters: from the store if
+        there is a valid entry, else built by builder() and stored.
+        With storeDirectory None, simply builder()
+    '''
+    if storeDirectory is None:
+        return builder()
+    matrix=loadOperator(storeDirectory,kind,parameters)
+    if matrix is None:
+        matrix=csr_matrix(builder())
+        storeOperator(storeDirectory,kind,parameters,matrix)
+    return matrix
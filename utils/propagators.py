@@ -0,0 +1,285 @@
+'''
+    propagators.py : dimension-independent tools to apply
+    exp(-i*tau*H) to a wavefunction, for a Hermitian sparse H
+'''
+
+import numpy as np
+from scipy.sparse import (
+    csr_matrix,
+    vstack,
+)
+from scipy.special import jv
+
+from utils.kernels import (
+    columnVdot,
+)
+
+def lanczosPropagate(hMatrix,phi,tau,tolerance=1e-10,maxKrylovDim=30):
+    '''
+        approximates exp(-i*tau*H) phi in the Krylov subspace
+        spanned by phi, H phi, H^2 phi, ... (Lanczos).
+
+        The subspace grows until the a-posteriori error estimate
+            ||phi|| * beta_m * |[exp(-i*dt*T_m)]_{m-1,0}|
+        falls below tolerance*||phi||. If maxKrylovDim is reached first,
+        the step dt is halved (reusing the same subspace) until the
+        estimate is met, and the remaining interval is covered by
+        further substeps.
+
+        Returns (newPhi, info) where info is a dict with
+            'matvecs', 'substeps', 'krylovDims' (one per substep),
+            'energy' (<phi|H|phi>, not normalised, of the input phi)
+    '''
+    if maxKrylovDim<2:
+        raise ValueError('maxKrylovDim must be at least 2')
+    info={
+        'matvecs': 0,
+        'substeps': 0,
+        'krylovDims': [],
+        'energy': None,
+    }
+    newPhi=phi
+    tauLeft=tau
+    while tauLeft>1e-12*tau:
+        dt=tauLeft
+        beta0=np.linalg.norm(newPhi)
+        if beta0==0:
+            break
+        basis=np.empty((maxKrylovDim,len(newPhi)),dtype=complex)
+        basis[0]=newPhi/beta0
+        alphas=[]
+        betas=[]
+        for j in range(maxKrylovDim):
+            w=hMatrix.dot(basis[j])
+            info['matvecs']+=1
+            alpha=np.vdot(basis[j],w).real
+            w-=alpha*basis[j]
+            if j>0:
+                w-=betas[j-1]*basis[j-1]
+            alphas.append(alpha)
+            if info['energy'] is None:
+                info['energy']=complex(alpha*beta0**2)
+            beta=np.linalg.norm(w)
+            if beta<=tolerance*1e-3:
+                # invariant subspace reached: the result is exact
+                errEstimate=0.0
+                break
+            errEstimate=beta*abs(_expTridiagonalFirstColumn(alphas,betas,dt)[-1])
+            if errEstimate<=tolerance:
+                break
+            if j<maxKrylovDim-1:
+                betas.append(beta)
+                basis[j+1]=w/beta
+        krylovDim=len(alphas)
+        betas=betas[:krylovDim-1]
+        while errEstimate>tolerance:
+            dt*=0.5
+            errEstimate=beta*abs(_expTridiagonalFirstColumn(alphas,betas,dt)[-1])
+        coefficients=beta0*_expTridiagonalFirstColumn(alphas,betas,dt)
+        newPhi=coefficients.dot(basis[:krylovDim])
+        tauLeft-=dt
+        info['substeps']+=1
+        info['krylovDims'].append(krylovDim)
+    return newPhi,info
+
+def _expTridiagonalFirstColumn(alphas,betas,dt):
+    '''
+        first column of exp(-i*dt*T), T being the real symmetric
+        tridiagonal matrix with diagonal alphas and off-diagonal betas
+    '''
+    tMatrix=np.diag(alphas)
+    if betas:
+        tMatrix+=np.diag(betas,1)+np.diag(betas,-1)
+    eigVals,eigVecs=np.linalg.eigh(tMatrix)
+    return eigVecs.dot(np.exp(complex(0,-dt)*eigVals)*eigVecs[0])
+
+def gershgorinBounds(hMatrix):
+    '''
+        lower and upper bounds to the spectrum of the
+        Hermitian (sparse) H from Gershgorin's discs
+    '''
+    diagonal=hMatrix.diagonal()
+    radii=np.asarray(abs(hMatrix).sum(axis=1)).ravel()-abs(diagonal)
+    return (diagonal.real-radii).min(),(diagonal.real+radii).max()
+
+def chebyshevCoefficients(eMin,eMax,tau,tolerance=1e-15):
+    '''
+        coefficients of the Chebyshev expansion
+            exp(-i*tau*H) = sum_k c_k T_k( (H-centre)/halfWidth )
+        for a spectrum within [eMin,eMax], with
+            centre=(eMax+eMin)/2, halfWidth=(eMax-eMin)/2,
+            c_k=exp(-i*tau*centre)*(2-delta_k0)*(-i)^k*J_k(halfWidth*tau).
+        The series is cut where the Bessel functions, past
+        their k~halfWidth*tau turning point, drop below tolerance.
+        Returns (centre, halfWidth, coefficients).
+    '''
+    centre=0.5*(eMax+eMin)
+    halfWidth=max(0.5*(eMax-eMin),1e-300)
+    argument=halfWidth*tau
+    coefficients=[]
+    k=0
+    while True:
+        besselJ=jv(k,argument)
+        if k>argument and abs(besselJ)<tolerance:
+            break
+        coefficients.append((1 if k==0 else 2)*((-1j)**k)*besselJ)
+        k+=1
+    return (
+        centre,
+        halfWidth,
+        np.exp(complex(0,-tau*centre))*np.array(coefficients,dtype=complex),
+    )
+
+def chebyshevPropagate(hMatrix,phi,centre,halfWidth,coefficients):
+    '''
+        sums the Chebyshev series prepared by chebyshevCoefficients
+        with the three-term recurrence, i.e. at a cost of
+        len(coefficients)-1 sparse matvecs.
+
+        phi can also be a (n,K) block of K vectors, advanced
+        together with sparse matrix-matrix products.
+
+        Returns (newPhi, info) where info is a dict with
+            'matvecs', 'energy' (<phi|H|phi>, not normalised, of the input phi;
+            an array of K energies for a block)
+    '''
+    hPhi=hMatrix.dot(phi)
+    info={
+        'matvecs': max(1,len(coefficients)-1),
+        'energy': complex(np.vdot(phi,hPhi)) if phi.ndim==1 else columnVdot(phi,hPhi),
+    }
+    newPhi=coefficients[0]*phi
+    if len(coefficients)>1:
+        tPrev=phi
+        tCurr=(hPhi-centre*phi)/halfWidth
+        newPhi+=coefficients[1]*tCurr
+        for coefficient in coefficients[2:]:
+            tNext=2*(hMatrix.dot(tCurr)-centre*tCurr)/halfWidth-tPrev
+            newPhi+=coefficient*tNext
+            tPrev,tCurr=tCurr,tNext
+    return newPhi,info
+
+def _infinityNorm(matrix):
+    '''
+        max row sum of the absolute values (an operator norm)
+    '''
+    if matrix.nnz==0:
+        return 0.0
+    return float(np.asarray(abs(matrix).sum(axis=1)).max())
+
+def _pruneInPlace(matrix,dropTolerance):
+    '''
+        drops the entries of the csr matrix below dropTolerance
+        (absolute), returning the infinity-norm of what was dropped
+    '''
+    if dropTolerance<=0:
+        return 0.0
+    dropMask=abs(matrix.data)<dropTolerance
+    if not dropMask.any():
+        return 0.0
+    matRows=np.repeat(np.arange(matrix.shape[0]),np.diff(matrix.indptr))
+    droppedNorm=np.bincount(
+        matRows[dropMask],
+        weights=abs(matrix.data[dropMask]),
+        minlength=matrix.shape[0],
+    ).max()
+    matrix.data[dropMask]=0
+    matrix.eliminate_zeros()
+    return float(droppedNorm)
+
+def prunedMatrixPower(matrix,exponent,dropTolerance=1e-12,maxNnz=None):
+    '''
+        matrix**exponent for a sparse (csr) matrix, by repeated squaring
+        (about 2*log2(exponent) products instead of exponent-1):
+        after each product the entries below dropTolerance are pruned,
+        to contain the fill-in of the growing stencil.
+        The truncation errors are propagated through the products
+        as a bound, in the infinity norm, to |computed-exact power|.
+
+        If maxNnz is given and any intermediate result exceeds it,
+        the computation is abandoned (the caller should then apply
+        the matrix exponent times instead) and None is returned
+        in place of the power.
+
+        Returns (power, info), info being a dict with
+            'nnz', 'bytes' (of the power, or of the last intermediate
+            if abandoned), 'errorBound', 'products', 'abandoned'
+    '''
+    info={
+        'products': 0,
+        'abandoned': False,
+    }
+    def _multiply(aPair,bPair):
+        # pairs are (matrix, bound on its error): returns their product pair
+        aMat,aErr=aPair
+        bMat,bErr=bPair
+        product=csr_matrix(aMat.dot(bMat))
+        info['products']+=1
+        aNorm=_infinityNorm(aMat)
+        bNorm=_infinityNorm(bMat)
+        productErr=aNorm*bErr+aErr*bNorm+aErr*bErr
+        productErr+=_pruneInPlace(product,dropTolerance)
+        return product,productErr
+    if exponent<1:
+        raise ValueError('Matrix power needs a positive exponent')
+    base=csr_matrix(matrix,copy=True)
+    basePair=(base,_pruneInPlace(base,dropTolerance))
+    resultPair=None
+    remaining=int(exponent)
+    while True:
+        if remaining%2==1:
+            resultPair=basePair if resultPair is None else _multiply(resultPair,basePair)
+            lastMatrix=resultPair[0]
+            if maxNnz is not None and lastMatrix.nnz>maxNnz:
+                break
+        remaining//=2
+        if remaining==0:
+            break
+        basePair=_multiply(basePair,basePair)
+        lastMatrix=basePair[0]
+        if maxNnz is not None and lastMatrix.nnz>maxNnz:
+            break
+    info['nnz']=lastMatrix.nnz
+    info['bytes']=lastMatrix.data.nbytes+lastMatrix.indices.nbytes+lastMatrix.indptr.nbytes
+    if remaining>0:
+        info['abandoned']=True
+        info['errorBound']=None
+        return None,info
+    info['errorBound']=resultPair[1]
+    return resultPair[0],info
+
+def prunedRowsOfPower(matrix,rows,exponent,dropTolerance=1e-12):
+    '''
+        the given rows of matrix**exponent, as a (len(rows),n) csr
+        block obtained by multiplying those rows of matrix by matrix
+        exponent-1 times, pruned after each product as in
+        prunedMatrixPower: for a few rows much cheaper than the power.
+        Returns (rowBlock, errorBound), the bound being
+        on the infinity norm of the error of the block
+    '''
+    rowBlock=csr_matrix(matrix[rows])
+    errorBound=_pruneInPlace(rowBlock,dropTolerance)
+    matrixNorm=_infinityNorm(matrix)
+    for _ in range(int(exponent)-1):
+        rowBlock=csr_matrix(rowBlock.dot(matrix))
+        errorBound=errorBound*matrixNorm+_pruneInPlace(rowBlock,dropTolerance)
+    return rowBlock,errorBound
+
+def replaceRows(matrix,rows,newRows):
+    '''
+        a csr copy of matrix with the given rows (unique indices)
+        replaced by those of the csr block newRows
+    '''
+    keptRows=np.setdiff1d(np.arange(matrix.shape[0]),rows)
+    stacked=vstack([matrix[keptRows],newRows],format='csr')
+    return stacked[np.argsort(np.concatenate([keptRows,rows]))]
+
+def reachableRows(matrix,sites,hops):
+    '''
+        the (sorted) indices reached from sites within the given
+        number of hops along the nonzero pattern of matrix
+    '''
+    rows=np.unique(sites)
+    for _ in range(int(hops)):
+        rows=np.unique(np.concatenate([rows,matrix[rows].indices]))
+    return rows
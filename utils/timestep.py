@@ -0,0 +1,27 @@
+'''
+    timestep.py : choice of the integration step of the
+    explicit integrators from the spectrum of the Hamiltonian
+'''
+
+import math
+
+# the largest |deltaTau*lambda| for which the scheme is stable
+# when lambda is purely imaginary (the eigenvalues of F=-iH, H Hermitian)
+RK4_STABILITY_LIMIT=2.0*math.sqrt(2.0)
+
+def spectralRadius(eMin,eMax):
+    '''
+        spectral radius of H (hence of F=-iH) from bounds to its spectrum
+    '''
+    return max(abs(eMin),abs(eMax))
+
+def planTimeStep(radius,frameTau,stabilityLimit,safetyFactor=0.9):
+    '''
+        the fewest equal steps covering frameTau with
+            deltaTau*radius <= safetyFactor*stabilityLimit,
+        i.e. the largest stable deltaTau dividing the frame exactly.
+        Returns (deltaTau, nIntegrationSteps)
+    '''
+    maxDeltaTau=safetyFactor*stabilityLimit/max(radius,1e-300)
+    nIntegrationSteps=max(1,int(math.ceil(frameTau/maxDeltaTau)))
+    return frameTau/nIntegrationSteps,nIntegrationSteps
@@ -0,0 +1,171 @@
+'''
+    trajectory.py : the frames of phi stored on disk
+    as memory-mapped arrays, for runs without display.
+
+    A trajectory is a directory of chunks, each a pair
+        phi-<n>.npy     (frames,)+shape complex64 or, quantized,
+                        (frames,)+shape+(2,) int16/int8 (re, im)
+        index-<n>.npy   one record (frame, tau, scale) per frame
+    preallocated with open_memmap when the chunk is started, so that
+    storing a frame is a copy into the mapped pages (the writing to
+    disk is left to the operating system) and an interrupted run
+    leaves valid files behind. Index records not yet written have
+    frame -1. trajectory.json describes the shape and format.
+
+    In the quantized formats each component is stored as
+    round(value/scale), scale being the largest |re|, |im| of the
+    frame over the largest integer: the error is at most scale/2.
+'''
+
+import os
+import json
+import numpy as np
+from numpy.lib.format import open_memmap
+
+TRAJECTORY_FORMATS={
+    'complex64': None,
+    'int16': np.int16,
+    'int8': np.int8,
+}
+
+INDEX_DTYPE=np.dtype([
+    ('frame',np.int64),
+    ('tau',np.float64),
+    ('scale',np.float64),
+])
+
+def _chunkNames(directory):
+    return sorted(
+        fileName[len('phi-'):-len('.npy')]
+        for fileName in os.listdir(directory)
+        if fileName.startswith('phi-') and fileName.endswith('.npy')
+    )
+
+class TrajectoryWriter():
+    '''
+        stores frames of phi (flattened or with the given shape)
+        into directory, in chunks of chunkFrames frames (fewer for
+        the last one if the total nFrames is given) in one of the
+        TRAJECTORY_FORMATS. Chunks already in directory (e.g. of a
+        run being resumed) are kept, new ones numbered after them.
+        close() flushes the current chunk
+    '''
+    def __init__(self,directory,shape,trajectoryFormat='complex64',chunkFrames=256,nFrames=None):
+        if trajectoryFormat not in TRAJECTORY_FORMATS:
+            raise ValueError('Unknown trajectory format "%s"' % trajectoryFormat)
+        self.directory=directory
+        self.shape=tuple(shape)
+        self.trajectoryFormat=trajectoryFormat
+        self.intType=TRAJECTORY_FORMATS[trajectoryFormat]
+        self.chunkFrames=chunkFrames
+        self.framesLeft=nFrames
+        os.makedirs(self.directory,exist_ok=True)
+        with open(os.path.join(self.directory,'trajectory.json'),'w') as descriptionFile:
+            json.dump(
+                {'shape': list(self.shape), 'format': self.trajectoryFormat},
+                descriptionFile,
+            )
+        self.nChunks=len(_chunkNames(self.directory))
+        self.phiChunk=None
+        self.indexChunk=None
+        self.chunkPosition=0
+        if self.intType is not None:
+            self.maxInt=np.iinfo(self.intType).max
+            self.workComponents=np.zeros(self.shape+(2,))
+
+    def _startChunk(self):
+        chunkFrames=self.chunkFrames
+        if self.framesLeft is not None:
+            chunkFrames=max(1,min(chunkFrames,self.framesLeft))
+        if self.intType is None:
+            frameShape,frameType=self.shape,np.complex64
+        else:
+            frameShape,frameType=self.shape+(2,),self.intType
+        self.phiChunk=open_memmap(
+            os.path.join(self.directory,'phi-%06i.npy' % self.nChunks),
+            mode='w+',
+            dtype=frameType,
+            shape=(chunkFrames,)+frameShape,
+        )
+        self.indexChunk=open_memmap(
+            os.path.join(self.directory,'index-%06i.npy' % self.nChunks),
+            mode='w+',
+            dtype=INDEX_DTYPE,
+            shape=(chunkFrames,),
+        )
+        self.indexChunk['frame']=-1
+        self.nChunks+=1
+        self.chunkPosition=0
+
+    def push(self,phi,tau,frame):
+        if self.phiChunk is None:
+            self._startChunk()
+        phi=np.ascontiguousarray(phi,dtype=complex).reshape(self.shape)
+        if self.intType is None:
+            self.phiChunk[self.chunkPosition]=phi
+            scale=1.0
+        else:
+            components=phi.view(float).reshape(self.shape+(2,))
+            scale=np.abs(components).max()/self.maxInt
+            if scale==0:
+                scale=1.0
+            np.divide(components,scale,out=self.workComponents)
+            np.rint(self.workComponents,out=self.workComponents)
+            self.phiChunk[self.chunkPosition]=self.workComponents
+        # the index record last: a frame is listed only once stored
+        self.indexChunk[self.chunkPosition]=(frame,tau,scale)
+        self.chunkPosition+=1
+        if self.framesLeft is not None:
+            self.framesLeft-=1
+        if self.chunkPosition==len(self.indexChunk):
+            self.close()
+
+    def close(self):
+        if self.phiChunk is not None:
+            self.phiChunk.flush()
+            self.indexChunk.flush()
+            self.phiChunk=None
+            self.indexChunk=None
+
+class Trajectory():
+    '''
+        the frames stored by a TrajectoryWriter in directory
+        (memory-mapped, read-only):
+            frames, taus    the frame numbers and times stored,
+                            by increasing frame
+            phi(j)          the j-th stored phi, complex, as saved
+                            (dequantized if needed)
+    '''
+    def __init__(self,directory):
+        with open(os.path.join(directory,'trajectory.json')) as descriptionFile:
+            description=json.load(descriptionFile)
+        self.shape=tuple(description['shape'])
+        self.trajectoryFormat=description['format']
+        # frame -> (index record, phi chunk, position in it): a frame
+        # stored again (by a resumed run) replaces the earlier one
+        storedFrames={}
+        for chunkName in _chunkNames(directory):
+            phiChunk=np.load(os.path.join(directory,'phi-%s.npy' % chunkName),mmap_mode='r')
+            indexChunk=np.load(os.path.join(directory,'index-%s.npy' % chunkName))
+            for position in np.flatnonzero(indexChunk['frame']>=0):
+                storedFrames[int(indexChunk['frame'][position])]=(
+                    indexChunk[position],
+                    phiChunk,
+                    position,
+                )
+        sortedFrames=[storedFrames[frame] for frame in sorted(storedFrames)]
+        self.locations=[(phiChunk,position) for _,phiChunk,position in sortedFrames]
+        self.index=np.array([record for record,_,_ in sortedFrames],dtype=INDEX_DTYPE)
+        self.frames=self.index['frame']
+        self.taus=self.index['tau']
+
+    def __len__(self):
+        return len(self.locations)
+
+    def phi(self,j):
+        phiChunk,position=self.locations[j]
+        if TRAJECTORY_FORMATS[self.trajectoryFormat] is None:
+            return phiChunk[position].astype(complex)
+        else:
+            components=phiChunk[position]*self.index['scale'][j]
+            return components[...,0]+complex(0,1)*components[...,1]